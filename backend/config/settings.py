@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_from_environment
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -44,6 +47,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so request timings include every other middleware
+    'eld.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -76,12 +81,11 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# SQLite in WAL mode unless DATABASE_URL points at PostgreSQL; see
+# config/database.py for the pool and pragma settings.
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_environment(os.environ, BASE_DIR / 'db.sqlite3'),
 }
 
 
@@ -134,3 +138,165 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
     ],
 }
+
+# Geocoding cache
+# The shared tier uses the Django cache named by CACHE_ALIAS; point it at a
+# database or Redis cache so resolved locations are shared across workers.
+
+ELD_GEOCODE_CACHE = {
+    'MAX_SIZE': 1024,
+    'TTL': 60 * 60 * 24 * 30,  # seconds
+    'CACHE_ALIAS': 'default',
+}
+
+# Route cache for parsed OpenRouteService results, keyed on the lane's
+# coordinate sequence. MAX_SIZE and MAX_BYTES cap the in-process tier.
+
+ELD_ROUTE_CACHE = {
+    'MAX_SIZE': 512,
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'TTL': 60 * 60 * 6,  # seconds
+    'CACHE_ALIAS': 'default',
+}
+
+# OpenRouteService client: pooled keep-alive session, per-attempt
+# (connect, read) timeouts, bounded retries with exponential backoff and a
+# circuit breaker that falls back to local routes while ORS is failing.
+# DEADLINE caps all attempts of one route request, backoff included; read
+# timeouts are not retried and Retry-After is ignored.
+# ROAD_GRAPH_PATH points at a graph built with `manage.py build_road_graph`;
+# set BACKEND to 'offline' to route only on that graph (air-gapped hosts).
+
+ELD_ROUTING = {
+    'BACKEND': 'openrouteservice',
+    'ROAD_GRAPH_PATH': None,
+    'BASE_URL': 'https://api.openrouteservice.org/v2/directions/driving-car',
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'DEADLINE': 20,
+    'MAX_RETRIES': 2,
+    'BACKOFF_FACTOR': 0.3,
+    'POOL_SIZE': 10,
+    'BREAKER_FAILURE_THRESHOLD': 5,
+    'BREAKER_RESET_TIMEOUT': 30,
+}
+
+# Batch planning (/api/trips/calculate-batch/). SCHEDULE_WORKERS of None
+# uses one process per CPU; each web process starts its pool once and
+# reuses it. Batches with fewer unique schedules than
+# PARALLEL_SCHEDULE_THRESHOLD, or hosts with a single worker, schedule
+# in-process instead.
+
+ELD_BATCH = {
+    'MAX_ITEMS': 1000,
+    'ROUTE_WORKERS': 8,
+    'SCHEDULE_WORKERS': None,
+    'PARALLEL_SCHEDULE_THRESHOLD': 256,
+}
+
+# Offline bulk generation (manage.py generate_logs). SCHEDULE_WORKERS of
+# None uses one process per CPU.
+
+ELD_BULK = {
+    'CHUNK_SIZE': 500,
+    'ROUTE_WORKERS': 8,
+    'SCHEDULE_WORKERS': None,
+}
+
+# Idempotent /trips/calculate/ (eld/idempotency.py): responses to requests
+# with an Idempotency-Key header are replayed for TTL seconds; identical
+# payloads without one are replayed for PAYLOAD_WINDOW seconds (0: only
+# concurrent duplicates are coalesced). Use a cache shared by all workers.
+
+ELD_IDEMPOTENCY = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 24 * 3600,
+    'PAYLOAD_WINDOW': 0,
+    'LOCK_TIMEOUT': 60,
+    'WAIT_TIMEOUT': 30,
+}
+
+# Background calculation jobs (eld/jobs.py): POST /api/trips/calculate/
+# with "Prefer: respond-async" queues the trip in the database and returns
+# 202; `manage.py run_jobs` starts WORKERS processes that run the queue.
+# A job is retried when its worker holds it longer than LEASE seconds.
+
+ELD_JOBS = {
+    'WORKERS': 2,
+    'POLL_INTERVAL': 1.0,
+    'LEASE': 300,
+    'MAX_ATTEMPTS': 3,
+    'MAX_WAIT': 30,
+}
+
+# Request instrumentation (eld/metrics.py): per-stage timers, cache and
+# ORS fallback counters and DB query counts, exposed at /api/metrics/ in
+# Prometheus text format and, with SERVER_TIMING, in a Server-Timing
+# response header. Off by default; when off, the middleware drops out of
+# the stack and /api/metrics/ returns 404. /api/metrics/ answers 403 unless
+# the client's address is in ALLOWED_NETWORKS or it sends
+# "Authorization: Bearer <TOKEN>"; behind a reverse proxy every client has
+# the proxy's address, so set TOKEN and narrow ALLOWED_NETWORKS there.
+
+ELD_METRICS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'QUERY_COUNTS': True,
+    'ALLOWED_NETWORKS': ('127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12',
+                         '192.168.0.0/16', 'fc00::/7'),
+    'TOKEN': os.environ.get('ELD_METRICS_TOKEN', ''),
+}
+
+# What-if planning (/api/trips/what-if/): start times x cycle values for one
+# route. Grids with at least PARALLEL_THRESHOLD distinct simulations are run
+# in a process pool of WORKERS processes (None: one per CPU), CHUNK_SIZE
+# simulations per task; each web process starts its pool once and reuses it.
+
+ELD_WHAT_IF = {
+    'MAX_SCENARIOS': 20000,
+    'WORKERS': None,
+    'PARALLEL_THRESHOLD': 2000,
+    'CHUNK_SIZE': 250,
+}
+
+# Route geometry. Trips store an encoded polyline simplified at
+# STORAGE_TOLERANCE (degrees; 1e-5 is about 1 m). Responses are simplified
+# again per DETAIL level, chosen with ?geometry_detail=full|high|medium|low|none;
+# ?geometry_format=polyline returns the encoded form instead of GeoJSON.
+
+ELD_GEOMETRY = {
+    'STORAGE_TOLERANCE': 0.00001,
+    'DETAIL_TOLERANCES': {
+        'full': 0,
+        'high': 0.0001,
+        'medium': 0.001,
+        'low': 0.01,
+    },
+    'DEFAULT_DETAIL': 'high',
+}
+
+# Cached /api/trips/{id}/logs/ payloads, served with ETags and dropped by
+# model signals when a trip's rows change. Point CACHE_ALIAS at a cache
+# shared by all workers in production.
+
+ELD_LOGS_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 7 * 86400,
+    'WARM_ON_CALCULATE': True,
+}
+
+# Duty-status storage. 'rows' writes one DutyStatus row per interval;
+# 'compact' packs each day into DailyLog.timeline (see eld/timeline.py).
+# Reads handle both, so the mode can be switched at any time.
+
+ELD_STORAGE = {
+    'DUTY_STATUS_MODE': 'rows',
+}
+
+# Trip plan memoization: event-engine schedules are cached per process as
+# date-independent templates and rebased onto each request's start date.
+# MAX_SIZE bounds the LRU; 0 disables it.
+
+ELD_SCHEDULE_CACHE = {
+    'MAX_SIZE': 256,
+}
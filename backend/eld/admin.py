@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Trip, DailyLog, DutyStatus
+from .models import Trip, DailyLog, DutyStatus, CalculationJob
 
 
 class DutyStatusInline(admin.TabularInline):
@@ -33,3 +33,10 @@ class DutyStatusAdmin(admin.ModelAdmin):
     list_display = [
         'daily_log', 'status', 'start_time', 'end_time', 'location']
     list_filter = ['status', 'start_time']
+
+
+@admin.register(CalculationJob)
+class CalculationJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'status', 'attempts', 'worker', 'trip', 'created_at', 'finished_at']
+    list_filter = ['status', 'created_at']
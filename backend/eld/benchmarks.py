@@ -0,0 +1,1112 @@
+"""
+Benchmarks for the trip calculation hot path.
+
+Run with ``python manage.py benchmark [name ...]``. Every benchmark that
+touches the database runs inside a transaction that is rolled back, and
+routing and request benchmarks talk to a local stub of the
+OpenRouteService directions API, never the real one.
+
+The ``writes`` load test is the exception: concurrent writers insert
+trips into scratch SQLite files (and, on PostgreSQL, into the configured
+database, deleting them afterwards).
+
+``--output`` writes the results as JSON; ``--baseline`` compares a run
+with such a file and fails on regressions (see compare_results).
+"""
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List
+from unittest import mock
+
+import django
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from rest_framework.pagination import Cursor
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from config.database import SQLITE_OPTIONS, SQLITE_PRAGMAS, sqlite_database
+
+from .batch import plan_trip_batch
+from .cache import LRUCache
+from .calculations import TripCalculator, summarize_hos_compliance
+from .compliance import audit_duty_statuses
+from .geometry import as_coordinate_array, cumulative_miles, polyline_miles, render_geometry
+from .logs_cache import invalidate_logs
+from .metrics import count, measure, stage
+from .models import Trip, DailyLog, DutyStatus
+from .pagination import TripCursorPagination
+from .persistence import attach_timelines, create_trip_with_logs, create_trips_with_logs
+from .responses import calculation_response, logs_response
+from .routing import CITY_COORDINATES, RouteCalculator, offline_route_calculator
+from .schedule_cache import get_schedule_cache
+from .serializers import (
+    TripCalculationResponseSerializer,
+    TripCalculationSerializer,
+    TripSummarySerializer,
+    get_geometry_config,
+    storage_geometry,
+)
+from .upstream import CircuitBreaker
+from .views import TripViewSet, plan_trip
+from .whatif import plan_what_if
+
+BENCH_START_DATE = datetime(2025, 1, 6)
+
+BENCH_TRIP_DATA = {
+    'current_location': 'Chicago, IL',
+    'pickup_location': 'Dallas, TX',
+    'dropoff_location': 'Los Angeles, CA',
+    'current_cycle_used': 0,
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def count_queries():
+    """Count queries on the default connection (unbounded, unlike
+    CaptureQueriesContext which keeps at most 9000)"""
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+def build_payloads(count: int, lanes: int = 20) -> List[Dict]:
+    """Build ``count`` trip requests spread over ``lanes`` distinct lanes"""
+    cities = [city.title() for city in CITY_COORDINATES]
+    payloads = []
+    for i in range(count):
+        lane = i % lanes
+        payloads.append({
+            'current_location': cities[lane % len(cities)],
+            'pickup_location': cities[(lane // len(cities) + lane + 3) % len(cities)],
+            'dropoff_location': cities[(lane + 7) % len(cities)],
+            'current_cycle_used': str((i * 7) % 60),
+        })
+    return payloads
+
+
+def build_schedules(days: int) -> List[Dict]:
+    """Build a schedule of exactly ``days`` driving days"""
+    calculator = TripCalculator()
+    return [
+        calculator.create_daily_schedule(
+            day_number=day + 1,
+            date=BENCH_START_DATE + timedelta(days=day),
+            driving_hours=calculator.hos_rules.DAILY_DRIVING_LIMIT,
+            distance=550,
+            has_pickup_dropoff=(day == 0 or day == days - 1)
+        )
+        for day in range(days)
+    ]
+
+
+def build_route_data(daily_schedules: List[Dict]) -> Dict:
+    distance = sum(s['estimated_distance'] for s in daily_schedules)
+    duration = sum(s['total_driving_hours'] for s in daily_schedules)
+    return {
+        'distance': distance,
+        'duration': duration,
+        'fuel_stops': 0,
+        'geometry': {'type': 'LineString', 'coordinates': []},
+        'summary': {},
+    }
+
+
+def persist_row_by_row(data: Dict, route_data: Dict, daily_schedules: List[Dict]) -> Trip:
+    """Reference implementation: one INSERT per daily log and duty status"""
+    with transaction.atomic():
+        trip = Trip.objects.create(
+            current_location=data['current_location'],
+            pickup_location=data['pickup_location'],
+            dropoff_location=data['dropoff_location'],
+            current_cycle_used=data['current_cycle_used'],
+            total_distance=route_data['distance'],
+            estimated_duration=route_data['duration'],
+            total_days=len(daily_schedules),
+            route_geometry=route_data.get('geometry'),
+            route_summary=route_data.get('summary')
+        )
+
+        for schedule in daily_schedules:
+            daily_log = DailyLog.objects.create(
+                trip=trip,
+                log_date=schedule['date'],
+                day_number=schedule['day_number'],
+                total_miles=int(schedule['estimated_distance']),
+                total_driving_hours=schedule['total_driving_hours'],
+                total_on_duty_hours=schedule['total_on_duty_hours'],
+                total_off_duty_hours=schedule['total_off_duty_hours'],
+                cycle_used=schedule['total_on_duty_hours']
+            )
+
+            for activity in schedule['activities']:
+                DutyStatus.objects.create(
+                    daily_log=daily_log,
+                    status=activity['status'],
+                    start_time=datetime.fromisoformat(activity['start_time']),
+                    end_time=datetime.fromisoformat(activity['end_time']),
+                    location=activity['location'],
+                    description=activity['description'],
+                    duration_hours=activity['duration_hours']
+                )
+
+    return trip
+
+
+def _time_persist(persist, daily_schedules: List[Dict], repeat: int) -> Dict:
+    route_data = build_route_data(daily_schedules)
+    timings = []
+    queries = 0
+
+    for _ in range(repeat):
+        with transaction.atomic():
+            with count_queries() as counter:
+                started = time.perf_counter()
+                persist(BENCH_TRIP_DATA, route_data, daily_schedules)
+                timings.append(time.perf_counter() - started)
+            queries = counter.count
+            transaction.set_rollback(True)
+
+    return {
+        'queries': queries,
+        'best_ms': round(min(timings) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+    }
+
+
+def bench_persistence(repeat: int = 5) -> List[Dict]:
+    """Compare row-by-row and bulk persistence of calculated trips"""
+    results = []
+    for days in (1, 5, 20):
+        daily_schedules = build_schedules(days)
+        activities = sum(len(s['activities']) for s in daily_schedules)
+
+        for name, persist in (('row_by_row', persist_row_by_row),
+                              ('bulk', create_trip_with_logs)):
+            results.append({
+                'benchmark': f'persistence.{name}',
+                'days': days,
+                'activities': activities,
+                **_time_persist(persist, daily_schedules, repeat),
+            })
+
+    return results
+
+
+def _plan_one_by_one(payloads: List[Dict], route_calculator: RouteCalculator):
+    """What N separate /trips/calculate/ requests do, minus HTTP"""
+    for payload in payloads:
+        serializer = TripCalculationSerializer(data=payload)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        route_data = route_calculator.calculate_route(
+            start=data['current_location'],
+            end=data['dropoff_location'],
+            via=[data['pickup_location']]
+        )
+        plan_trip(data, route_data)
+
+
+def bench_batch(repeat: int = 5) -> List[Dict]:
+    """Compare planning a dispatch board one trip at a time and as a batch"""
+    route_calculator = offline_route_calculator()
+    results = []
+    for count in (10, 100, 500):
+        payloads = build_payloads(count)
+        for name, plan in (
+                ('one_by_one', lambda: _plan_one_by_one(payloads, route_calculator)),
+                ('batch', lambda: plan_trip_batch(payloads, route_calculator))):
+            timings = []
+            for _ in range(repeat):
+                with transaction.atomic():
+                    with count_queries() as counter:
+                        started = time.perf_counter()
+                        plan()
+                        timings.append(time.perf_counter() - started)
+                    transaction.set_rollback(True)
+            results.append({
+                'benchmark': f'batch.{name}',
+                'trips': count,
+                'queries': counter.count,
+                'best_ms': round(min(timings) * 1000, 3),
+                'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+            })
+
+    return results
+
+
+def _best_of(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def bench_schedule(repeat: int = 5) -> List[Dict]:
+    """Sweep TripCalculator engines over many trips, and check that the
+    event engine scales linearly with trip length"""
+    trips = [(duration, cycle)
+             for duration in range(5, 125, 5)
+             for cycle in range(0, 70, 7)]
+    results = []
+
+    sweeps = (
+        ('daily', lambda d, c: TripCalculator(c, engine='daily').calculate_trip_schedule(d, d * 55)),
+        ('event', lambda d, c: TripCalculator(c).calculate_trip_schedule(
+            d, d * 55, start=BENCH_START_DATE)),
+        ('event_timeline', lambda d, c: TripCalculator(c).simulate(d, d * 55)),
+    )
+    with override_settings(ELD_SCHEDULE_CACHE={'MAX_SIZE': 0}):
+        for name, calculate in sweeps:
+            best = _best_of(lambda: [calculate(d, c) for d, c in trips], repeat)
+            results.append({
+                'benchmark': f'schedule.sweep.{name}',
+                'trips': len(trips),
+                'best_ms': round(best * 1000, 3),
+                'per_trip_us': round(best / len(trips) * 1e6, 1),
+            })
+
+    # Same trips re-planned for later start dates, served from warm
+    # memoized plans
+    with override_settings(ELD_SCHEDULE_CACHE={'MAX_SIZE': len(trips)}):
+        get_schedule_cache().clear()
+        for d, c in trips:
+            TripCalculator(c).calculate_trip_schedule(d, d * 55, start=BENCH_START_DATE)
+        best = _best_of(lambda: [
+            TripCalculator(c).calculate_trip_schedule(
+                d, d * 55, start=BENCH_START_DATE + timedelta(days=i % 30))
+            for i, (d, c) in enumerate(trips)], repeat)
+        stats = get_schedule_cache().get_stats()
+        results.append({
+            'benchmark': 'schedule.sweep.event_memoized',
+            'trips': len(trips),
+            'best_ms': round(best * 1000, 3),
+            'per_trip_us': round(best / len(trips) * 1e6, 1),
+            'hits': stats['hits'],
+            'misses': stats['misses'],
+        })
+
+    # Per-trip cost by trip length and starting cycle, so a regression in
+    # one corner (e.g. restarts near the 70-hour limit) isn't averaged away
+    with override_settings(ELD_SCHEDULE_CACHE={'MAX_SIZE': 0}):
+        for driving_hours in (10, 40, 120):
+            for cycle in (0, 35, 65):
+                best = _best_of(lambda: TripCalculator(cycle).calculate_trip_schedule(
+                    driving_hours, driving_hours * 55, start=BENCH_START_DATE), repeat)
+                results.append({
+                    'benchmark': 'schedule.case',
+                    'driving_hours': driving_hours,
+                    'current_cycle_used': cycle,
+                    'best_ms': round(best * 1000, 3),
+                })
+
+    for weeks in (1, 4, 16):
+        duration = weeks * 7 * 10
+        timeline = TripCalculator().simulate(duration, duration * 55)
+        best = _best_of(lambda: TripCalculator().simulate(duration, duration * 55), repeat)
+        results.append({
+            'benchmark': 'schedule.event_scaling',
+            'driving_hours': duration,
+            'intervals': len(timeline),
+            'timeline_bytes': timeline.nbytes,
+            'best_ms': round(best * 1000, 3),
+            'per_interval_us': round(best / len(timeline) * 1e6, 2),
+        })
+
+    return results
+
+
+def bench_geometry(repeat: int = 5) -> List[Dict]:
+    """Scalar haversine loop vs vectorized polyline kernels"""
+    calculator = RouteCalculator()
+    results = []
+    for vertices in (1000, 10000, 50000):
+        coordinates = [[-87.6 + i * 1e-4, 41.8 - i * 5e-5] for i in range(vertices)]
+        points = as_coordinate_array(coordinates)
+
+        def scalar():
+            return sum(
+                calculator.haversine_distance(lat1, lon1, lat2, lon2)
+                for (lon1, lat1), (lon2, lat2) in zip(coordinates, coordinates[1:]))
+
+        for name, kernel in (('scalar', scalar),
+                             ('cumulative_miles', lambda: cumulative_miles(points))):
+            results.append({
+                'benchmark': f'geometry.{name}',
+                'vertices': vertices,
+                'best_ms': round(_best_of(kernel, repeat) * 1000, 3),
+            })
+
+    return results
+
+
+def bench_route_geometry(repeat: int = 5) -> List[Dict]:
+    """Stored and rendered route geometry size and time per detail level"""
+    config = get_geometry_config()
+    results = []
+    for vertices in (10000, 50000):
+        # A winding route with GPS-like jitter, as ORS returns it
+        lons = [-87.6 - i * 30 / vertices for i in range(vertices)]
+        coordinates = [[round(lon, 6), round(34 + math.sin(lon * 3) * 0.5 + (i % 7) * 2e-6, 6)]
+                       for i, lon in enumerate(lons)]
+        geometry = {'type': 'LineString', 'coordinates': coordinates}
+        stored = storage_geometry(geometry)
+        results.append({
+            'benchmark': 'route_geometry.storage',
+            'vertices': vertices,
+            'geojson_bytes': len(json.dumps(geometry)),
+            'stored_bytes': len(json.dumps(stored)),
+            'best_ms': round(_best_of(lambda: storage_geometry(geometry), repeat) * 1000, 3),
+        })
+
+        for detail, tolerance in config['DETAIL_TOLERANCES'].items():
+            rendered = render_geometry(stored, tolerance)
+            results.append({
+                'benchmark': f'route_geometry.render.{detail}',
+                'vertices': vertices,
+                'rendered_vertices': len(rendered['coordinates']),
+                'bytes': len(json.dumps(rendered)),
+                'best_ms': round(
+                    _best_of(lambda: render_geometry(stored, tolerance), repeat) * 1000, 3),
+            })
+
+    return results
+
+
+def bench_serialization(repeat: int = 5) -> List[Dict]:
+    """Validating response serializers vs the plain-dict output path"""
+    renderer = JSONRenderer()
+    results = []
+    for driving_hours in (10, 100, 400):
+        daily_schedules = TripCalculator(BENCH_TRIP_DATA['current_cycle_used']).calculate_trip_schedule(
+            driving_hours, driving_hours * 55, start=BENCH_START_DATE)
+        route_data = build_route_data(daily_schedules)
+        hos_compliance_check = summarize_hos_compliance(
+            BENCH_TRIP_DATA['current_cycle_used'], daily_schedules)
+
+        with transaction.atomic():
+            trip = create_trip_with_logs(BENCH_TRIP_DATA, route_data, daily_schedules)
+            stored = Trip.objects.prefetch_related('daily_logs__duty_statuses').get(pk=trip.pk)
+
+            def validated():
+                serializer = TripCalculationResponseSerializer(data={
+                    'trip': TripSummarySerializer(trip).data,
+                    'route': route_data,
+                    'daily_schedules': daily_schedules,
+                    'total_days': len(daily_schedules),
+                    'hos_compliance_check': hos_compliance_check,
+                })
+                serializer.is_valid(raise_exception=True)
+                return renderer.render(serializer.data)
+
+            def logs_serializer():
+                return renderer.render(TripCalculationResponseSerializer({
+                    **logs_response(stored),
+                    'trip': stored,
+                }).data)
+
+            cases = (
+                ('calculate', validated, lambda: renderer.render(calculation_response(
+                    trip, route_data, daily_schedules, hos_compliance_check))),
+                ('logs', logs_serializer, lambda: renderer.render(logs_response(stored))),
+            )
+            for name, slow, fast in cases:
+                slow_ms = _best_of(slow, repeat) * 1000
+                fast_ms = _best_of(fast, repeat) * 1000
+                results.append({
+                    'benchmark': f'serialization.{name}',
+                    'days': len(daily_schedules),
+                    'activities': sum(len(day['activities']) for day in daily_schedules),
+                    'serializer_ms': round(slow_ms, 3),
+                    'fast_path_ms': round(fast_ms, 3),
+                    'speedup': round(slow_ms / fast_ms, 1),
+                    'identical': slow() == fast(),
+                })
+            transaction.set_rollback(True)
+
+    return results
+
+
+def bench_trip_list(repeat: int = 5) -> List[Dict]:
+    """Cursor-paginated slim list pages vs loading the whole table"""
+    view = TripViewSet.as_view({'get': 'list'})
+    factory = APIRequestFactory()
+    geometry = storage_geometry({
+        'type': 'LineString',
+        'coordinates': [[-87.6 - i * 0.01, 41.8 + math.sin(i / 10)] for i in range(500)],
+    })
+    results = []
+
+    for count in (1000, 20000):
+        with transaction.atomic():
+            Trip.objects.bulk_create([
+                Trip(**{**BENCH_TRIP_DATA, 'total_distance': 2000, 'estimated_duration': 40,
+                        'route_geometry': geometry, 'route_summary': {'total_distance': 2000}})
+                for _ in range(count)
+            ], batch_size=1000)
+
+            paginator = TripCursorPagination()
+            paginator.base_url = 'http://localhost/api/trips/'
+            deep = Trip.objects.order_by('-created_at', '-id')[count - 100]
+            deep_url = paginator.encode_cursor(
+                Cursor(offset=0, reverse=False, position=str(deep.created_at)))
+
+            def get(url):
+                response = view(factory.get(url, HTTP_HOST='localhost'))
+                response.render()
+                return response
+
+            cases = (
+                ('first_page', lambda: get('/api/trips/')),
+                ('deep_page', lambda: get(deep_url)),
+                ('unpaginated_rows', lambda: list(Trip.objects.all())),
+            )
+            for name, fn in cases:
+                with count_queries() as counter:
+                    best = _best_of(fn, repeat)
+                results.append({
+                    'benchmark': f'trip_list.{name}',
+                    'trips': count,
+                    'queries': counter.count // repeat,
+                    'best_ms': round(best * 1000, 3),
+                })
+            transaction.set_rollback(True)
+
+    return results
+
+
+def bench_logs_cache(repeat: int = 5) -> List[Dict]:
+    """Logs endpoint: rebuilt from rows vs cached payload vs 304"""
+    view = TripViewSet.as_view({'get': 'logs'})
+    factory = APIRequestFactory()
+    results = []
+    for driving_hours in (10, 100, 400):
+        daily_schedules = TripCalculator().calculate_trip_schedule(
+            driving_hours, driving_hours * 55, start=BENCH_START_DATE)
+        with transaction.atomic():
+            trip = create_trip_with_logs(
+                BENCH_TRIP_DATA, build_route_data(daily_schedules), daily_schedules)
+
+            def get(**headers):
+                return view(factory.get(f'/api/trips/{trip.pk}/logs/', HTTP_HOST='localhost',
+                                        **headers), pk=str(trip.pk))
+
+            def miss():
+                invalidate_logs(trip.pk)
+                return get()
+
+            etag = get()['ETag']
+            cases = (
+                ('miss', miss),
+                ('hit', get),
+                ('not_modified', lambda: get(HTTP_IF_NONE_MATCH=etag)),
+            )
+            for name, fn in cases:
+                with count_queries() as counter:
+                    best = _best_of(fn, repeat)
+                results.append({
+                    'benchmark': f'logs_cache.{name}',
+                    'days': len(daily_schedules),
+                    'queries': counter.count // repeat,
+                    'bytes': len(fn().content),
+                    'best_ms': round(best * 1000, 3),
+                })
+            invalidate_logs(trip.pk)
+            transaction.set_rollback(True)
+
+    return results
+
+
+def _table_bytes(*tables: str) -> int:
+    """Bytes used by some tables and their indexes (SQLite dbstat)"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT SUM(d.pgsize) FROM dbstat d JOIN sqlite_master m ON m.name = d.name '
+            'WHERE m.tbl_name IN (%s)' % ', '.join('%s' for _ in tables), tables)
+        return cursor.fetchone()[0] or 0
+
+
+def _duty_status_bytes() -> int:
+    """Duty-status storage: DutyStatus rows, labels and packed timelines"""
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT SUM(LENGTH(timeline)) FROM eld_dailylog')
+        blobs = cursor.fetchone()[0] or 0
+    return _table_bytes('eld_dutystatus', 'eld_timelinelabel') + blobs
+
+
+def bench_timeline(repeat: int = 5) -> List[Dict]:
+    """DutyStatus rows vs compact packed timelines: storage and read cost"""
+    if connection.vendor != 'sqlite':
+        return [{'benchmark': 'timeline', 'skipped': 'needs SQLite dbstat'}]
+
+    daily_schedules = TripCalculator().calculate_trip_schedule(400, 400 * 55, start=BENCH_START_DATE)
+    route_data = build_route_data(daily_schedules)
+    trips = 50
+    days = trips * len(daily_schedules)
+    results = []
+
+    for mode in ('rows', 'compact'):
+        with override_settings(ELD_STORAGE={'DUTY_STATUS_MODE': mode}), transaction.atomic():
+            before = _duty_status_bytes(), _table_bytes('eld_trip', 'eld_dailylog')
+            created = create_trips_with_logs([(BENCH_TRIP_DATA, route_data, daily_schedules)] * trips)
+            duty_status_bytes = _duty_status_bytes() - before[0]
+            total_bytes = duty_status_bytes + _table_bytes('eld_trip', 'eld_dailylog') - before[1]
+            daily_logs = list(DailyLog.objects.filter(trip=created[0]))
+
+            def read_duty_statuses():
+                if mode == 'rows':
+                    return list(DutyStatus.objects.filter(daily_log__in=daily_logs))
+                for log in daily_logs:
+                    log._timeline_entries = None
+                attach_timelines(daily_logs)
+                return [entry for log in daily_logs for entry in log.get_duty_statuses()]
+
+            def read_trip():
+                trip = Trip.objects.prefetch_related('daily_logs__duty_statuses').get(
+                    pk=created[0].pk)
+                attach_timelines(trip.daily_logs.all())
+                return [entry for log in trip.daily_logs.all() for entry in log.get_duty_statuses()]
+
+            results.append({
+                'benchmark': f'timeline.{mode}',
+                'days': days,
+                'duty_status_bytes_per_day': round(duty_status_bytes / days),
+                'total_bytes_per_day': round(total_bytes / days),
+                'duty_status_read_per_day_us': round(
+                    _best_of(read_duty_statuses, repeat) / len(daily_logs) * 1e6, 1),
+                'trip_read_ms': round(_best_of(read_trip, repeat) * 1000, 3),
+            })
+            transaction.set_rollback(True)
+
+    return results
+
+
+def bench_compliance(repeat: int = 5) -> List[Dict]:
+    """Streaming audit of stored duty statuses: throughput and peak memory"""
+    daily_schedules = TripCalculator().calculate_trip_schedule(400, 400 * 55, start=BENCH_START_DATE)
+    route_data = build_route_data(daily_schedules)
+    results = []
+
+    for mode in ('rows', 'compact'):
+        with override_settings(ELD_STORAGE={'DUTY_STATUS_MODE': mode}), transaction.atomic():
+            stored = 0
+            for trips in (10, 50):
+                create_trips_with_logs(
+                    [(BENCH_TRIP_DATA, route_data, daily_schedules)] * (trips - stored))
+                stored = trips
+                intervals = trips * sum(len(day['activities']) for day in daily_schedules)
+
+                def audit():
+                    return sum(1 for _ in audit_duty_statuses())
+
+                best = _best_of(audit, repeat)
+                tracemalloc.start()
+                audit()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results.append({
+                    'benchmark': f'compliance.{mode}',
+                    'intervals': intervals,
+                    'best_ms': round(best * 1000, 3),
+                    'intervals_per_s': round(intervals / best),
+                    'peak_kb': round(peak / 1024),
+                })
+            transaction.set_rollback(True)
+
+    return results
+
+
+def bench_what_if(repeat: int = 5) -> List[Dict]:
+    """What-if grids: in-process vs process pool"""
+    cycles = list(range(0, 70, 5))
+    results = []
+    # Quarter-hour starts over a week share a time of day; 7-minute ones
+    # over a week mostly do not
+    for label, step in (('quarter_hours', 15), ('seven_minutes', 7)):
+        starts = [BENCH_START_DATE + timedelta(minutes=step * i) for i in range(7 * 24 * 60 // step)]
+        for mode, threshold in (('in_process', float('inf')), ('pool', 0)):
+            with override_settings(ELD_WHAT_IF={'PARALLEL_THRESHOLD': threshold}):
+                plan = plan_what_if(120, 120 * 55, starts, cycles, top=1)
+                best = _best_of(lambda: plan_what_if(120, 120 * 55, starts, cycles, top=1),
+                                max(1, repeat // 2))
+            results.append({
+                'benchmark': f'what_if.{label}.{mode}',
+                'scenarios': plan['scenarios'],
+                'simulations': plan['simulations'],
+                'best_ms': round(best * 1000, 3),
+                'per_scenario_us': round(best / plan['scenarios'] * 1e6, 2),
+            })
+    return results
+
+
+class _StubRoutingHandler(BaseHTTPRequestHandler):
+    """OpenRouteService directions stand-in: a straight-line route through
+    the requested coordinates at 50 mph, densified like a real polyline"""
+
+    protocol_version = 'HTTP/1.1'
+    # One write per response, so replies aren't held back by Nagle's
+    # algorithm waiting on the client's delayed ACK
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests += 1
+        if self.server.status != 200:
+            return self._send(self.server.status, {'error': 'stubbed failure'})
+
+        coordinates = body['coordinates']
+        points = []
+        for (x1, y1), (x2, y2) in zip(coordinates, coordinates[1:]):
+            steps = self.server.points_per_leg
+            points.extend([x1 + (x2 - x1) * i / steps, y1 + (y2 - y1) * i / steps]
+                          for i in range(steps))
+        points.append(coordinates[-1])
+        miles = polyline_miles(coordinates)
+        self._send(200, {'features': [{
+            'properties': {'summary': {
+                'distance': miles / 0.621371 * 1000,
+                'duration': miles / 50 * 3600,
+            }},
+            'geometry': {'type': 'LineString', 'coordinates': points},
+        }]})
+
+    def _send(self, status_code: int, payload: Dict):
+        content = json.dumps(payload).encode()
+        self.send_response(status_code)
+        if status_code in (429, 503):
+            # As ORS does; the client must not wait this long
+            self.send_header('Retry-After', '4')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def stub_routing_server(status: int = 200, points_per_leg: int = 500) -> Iterator:
+    """Serve the stub directions API on a free local port; the server's
+    ``url`` is a RouteCalculator base_url"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _StubRoutingHandler)
+    server.daemon_threads = True
+    server.status = status
+    server.points_per_leg = points_per_leg
+    server.requests = 0
+    server.url = f'http://127.0.0.1:{server.server_port}/v2/directions/driving-car'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}/v2/directions/driving-car'
+
+
+def bench_routing(repeat: int = 5) -> List[Dict]:
+    """RouteCalculator paths: routing API, route cache, and each fallback"""
+    lane = ('Chicago, IL', 'Los Angeles, CA', ['Dallas, TX'])
+    # Never opens, so every failure takes the same path
+    breaker = partial(CircuitBreaker, failure_threshold=10 ** 9)
+    results = []
+
+    with stub_routing_server() as ok, stub_routing_server(status=503) as failing:
+        calculators = {
+            'api': RouteCalculator(base_url=ok.url, circuit_breaker=breaker()),
+            'route_cache_hit': RouteCalculator(base_url=ok.url, circuit_breaker=breaker()),
+            # No retries: backoff sleeps would dwarf the fallback itself
+            'upstream_503': RouteCalculator(
+                base_url=failing.url, max_retries=0, circuit_breaker=breaker()),
+            'connection_refused': RouteCalculator(
+                base_url=_closed_port_url(), max_retries=0, circuit_breaker=breaker()),
+            'breaker_open': offline_route_calculator(),
+        }
+        for name, calculator in calculators.items():
+            calculator.geocode_cache = LRUCache()
+            calculator.route_cache = LRUCache()
+
+            def route():
+                if name != 'route_cache_hit':
+                    calculator.route_cache.clear()
+                return calculator.calculate_route(*lane)
+
+            # The exception fallback prints the error it recovers from
+            with redirect_stdout(io.StringIO()):
+                points = len(route()['geometry']['coordinates'])
+                before = ok.requests + failing.requests
+                best = _best_of(route, repeat)
+            results.append({
+                'benchmark': f'routing.{name}',
+                'upstream_requests': (ok.requests + failing.requests - before) // repeat,
+                'points': points,
+                'best_ms': round(best * 1000, 3),
+            })
+
+    return results
+
+
+def _timed(fn, repeat: int):
+    """Best and mean of ``repeat`` calls, with the per-call query count"""
+    timings = []
+    with count_queries() as counter:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - started)
+    return result, {
+        'queries': counter.count // repeat,
+        'best_ms': round(min(timings) * 1000, 3),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+    }
+
+
+def bench_requests(repeat: int = 5) -> List[Dict]:
+    """Full /trips/calculate/ and /trips/{id}/logs/ requests through the
+    URLconf and middleware, routed by the stub directions API"""
+    client = Client(HTTP_HOST='localhost')
+    lanes = (
+        ('regional', {'current_location': 'New York, NY', 'pickup_location': 'Philadelphia, PA',
+                      'dropoff_location': 'Chicago, IL'}),
+        ('cross_country', {'current_location': 'Chicago, IL', 'pickup_location': 'Dallas, TX',
+                           'dropoff_location': 'Los Angeles, CA'}),
+    )
+    route_cache = LRUCache()
+    results = []
+
+    # Requests without a start time plan from a naive default start, which
+    # Django warns about on every DutyStatus it saves
+    with stub_routing_server() as server, warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        route_calculator = partial(
+            RouteCalculator, base_url=server.url, geocode_cache=LRUCache(),
+            route_cache=route_cache, circuit_breaker=CircuitBreaker())
+
+        for lane, locations in lanes:
+            for cycle in (0, 60):
+                payload = {**locations, 'current_cycle_used': cycle}
+
+                def calculate(miss: bool):
+                    if miss:
+                        route_cache.clear()
+                    return client.post('/api/trips/calculate/', payload,
+                                       content_type='application/json')
+
+                with transaction.atomic(), mock.patch('eld.views.RouteCalculator',
+                                                      route_calculator):
+                    response = calculate(miss=True)
+                    if response.status_code >= 400:
+                        raise RuntimeError(f'/trips/calculate/ failed: {response.content!r}')
+                    data = response.json()
+                    trip_id = data['id']
+                    daily_schedules = data['daily_schedules']
+                    route_data = route_calculator().calculate_route(
+                        start=payload['current_location'], end=payload['dropoff_location'],
+                        via=[payload['pickup_location']])
+
+                    def logs(miss: bool):
+                        if miss:
+                            invalidate_logs(trip_id)
+                        return client.get(f'/api/trips/{trip_id}/logs/')
+
+                    cases = (
+                        ('calculate.route_miss', lambda: calculate(miss=True)),
+                        ('calculate.route_hit', lambda: calculate(miss=False)),
+                        # The persistence stage of a calculate request on its own
+                        ('calculate.persist', lambda: create_trip_with_logs(
+                            payload, route_data, daily_schedules)),
+                        ('logs.miss', lambda: logs(miss=True)),
+                        ('logs.hit', lambda: logs(miss=False)),
+                    )
+                    for name, fn in cases:
+                        response, timing = _timed(fn, repeat)
+                        result = {
+                            'benchmark': f'requests.{name}',
+                            'lane': lane,
+                            'current_cycle_used': cycle,
+                            'days': len(daily_schedules),
+                        }
+                        if not isinstance(response, Trip):
+                            result['bytes'] = len(response.content)
+                        results.append({**result, **timing})
+                    invalidate_logs(trip_id)
+                    transaction.set_rollback(True)
+
+    return results
+
+
+def bench_metrics(repeat: int = 5) -> List[Dict]:
+    """Instrumentation overhead: stage timers and counters with no request
+    being measured vs inside one, and /trips/calculate/ with ELD_METRICS
+    off vs on"""
+    calls = 100000
+    results = []
+
+    def instrumented():
+        for _ in range(calls):
+            with stage('bench'):
+                count('bench')
+
+    for mode in ('disabled', 'enabled'):
+        if mode == 'disabled':
+            best = _best_of(instrumented, repeat)
+        else:
+            with measure(query_counts=False):
+                best = _best_of(instrumented, repeat)
+        results.append({
+            'benchmark': f'metrics.stage_and_count.{mode}',
+            'calls': calls,
+            'per_call_us': round(best / calls * 1e6, 3),
+        })
+
+    payload = {**BENCH_TRIP_DATA, 'current_cycle_used': 10}
+    with stub_routing_server() as server, warnings.catch_warnings(), mock.patch(
+            'eld.views.RouteCalculator', partial(
+                RouteCalculator, base_url=server.url, geocode_cache=LRUCache(),
+                route_cache=LRUCache(), circuit_breaker=CircuitBreaker())):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for enabled in (False, True):
+            with override_settings(ELD_METRICS={'ENABLED': enabled}), transaction.atomic():
+                # Middleware is loaded on a client's first request
+                client = Client(HTTP_HOST='localhost')
+                response, timing = _timed(lambda: client.post(
+                    '/api/trips/calculate/', payload, content_type='application/json'),
+                    max(repeat, 5))
+                results.append({
+                    'benchmark': f"metrics.calculate.{'enabled' if enabled else 'disabled'}",
+                    'server_timing': 'Server-Timing' in response,
+                    **timing,
+                })
+                transaction.set_rollback(True)
+
+    return results
+
+
+def _in_thread(fn):
+    """Run ``fn`` in a new thread, on that thread's own DB connections"""
+    def run():
+        try:
+            fn()
+        finally:
+            connections.close_all()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+@contextmanager
+def scratch_sqlite(options: Dict) -> Iterator[str]:
+    """Point connections opened by new threads at a migrated scratch SQLite
+    file with ``options``; the current thread keeps its connection"""
+    directory = tempfile.mkdtemp(prefix='eld-bench-')
+    saved = connections.settings['default']
+    connections.settings['default'] = {
+        **saved, 'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(directory, 'db.sqlite3'), 'OPTIONS': options}
+    try:
+        _in_thread(lambda: call_command('migrate', verbosity=0)).join()
+        yield connections.settings['default']['NAME']
+    finally:
+        connections.settings['default'] = saved
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def write_load(writers: int, trips: int, days: int = 5) -> Dict:
+    """``writers`` threads each persisting ``trips`` trips while one reader
+    pages the trip list; returns throughput, latency and lock errors"""
+    daily_schedules = build_schedules(days)
+    route_data = build_route_data(daily_schedules)
+    latencies, read_latencies, created, errors = [], [], [], []
+    done = threading.Event()
+
+    def write():
+        for _ in range(trips):
+            started = time.perf_counter()
+            try:
+                trip = create_trip_with_logs(BENCH_TRIP_DATA, route_data, daily_schedules)
+            except OperationalError:
+                errors.append(1)  # "database is locked"
+                continue
+            latencies.append(time.perf_counter() - started)
+            created.append(trip.pk)
+
+    def read():
+        while not done.is_set():
+            started = time.perf_counter()
+            try:
+                list(Trip.objects.only('id', 'created_at')[:20])
+            except OperationalError:
+                errors.append(1)
+                continue
+            read_latencies.append(time.perf_counter() - started)
+
+    reader = _in_thread(read)
+    started = time.perf_counter()
+    for thread in [_in_thread(write) for _ in range(writers)]:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    done.set()
+    reader.join()
+
+    latencies.sort()
+    read_latencies.sort()
+    return {
+        'created': created,
+        'trips_per_s': round(len(created) / elapsed, 1),
+        'p95_write_ms': round(latencies[int(len(latencies) * 0.95)] * 1000, 3) if latencies else None,
+        'p95_read_ms': (round(read_latencies[int(len(read_latencies) * 0.95)] * 1000, 3)
+                        if read_latencies else None),
+        'errors': len(errors),
+    }
+
+
+def bench_writes(repeat: int = 5, writers: int = 4) -> List[Dict]:
+    """Write-throughput load test: concurrent calculate transactions on
+    SQLite with Django's defaults (rollback journal, deferred transactions)
+    vs the WAL/IMMEDIATE settings of config/database.py, and on the
+    configured database when it is PostgreSQL"""
+    trips = 10 * max(repeat, 1)
+    results = []
+    cases = [
+        ('sqlite.default', {}),
+        ('sqlite.tuned', sqlite_database('', SQLITE_PRAGMAS, SQLITE_OPTIONS)['OPTIONS']),
+    ]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for name, options in cases:
+            with scratch_sqlite(options):
+                load = write_load(writers, trips)
+            load.pop('created')
+            results.append({'benchmark': f'writes.{name}', 'writers': writers, **load})
+
+        if connection.vendor == 'postgresql':
+            load = write_load(writers, trips)
+            Trip.objects.filter(pk__in=load.pop('created')).delete()
+            results.append({'benchmark': 'writes.postgresql', 'writers': writers, **load})
+
+    return results
+
+
+BENCHMARKS = {
+    'persistence': bench_persistence,
+    'batch': bench_batch,
+    'schedule': bench_schedule,
+    'geometry': bench_geometry,
+    'route_geometry': bench_route_geometry,
+    'serialization': bench_serialization,
+    'trip_list': bench_trip_list,
+    'logs_cache': bench_logs_cache,
+    'timeline': bench_timeline,
+    'compliance': bench_compliance,
+    'what_if': bench_what_if,
+    'routing': bench_routing,
+    'requests': bench_requests,
+    'metrics': bench_metrics,
+    'writes': bench_writes,
+}
+
+
+# A timing regresses when it is more than REGRESSION_TOLERANCE slower than
+# the baseline and also slower by more than NOISE_FLOOR_MS, so sub-0.1ms
+# cases don't flap; query counts regress on any increase
+REGRESSION_TOLERANCE = 0.2
+NOISE_FLOOR_MS = 0.1
+COUNT_METRICS = ('queries',)
+
+
+def run_metadata(repeat: int) -> Dict:
+    """Where and how a run was made, stored next to its results"""
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'repeat': repeat,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': connection.vendor,
+    }
+
+
+def _timing_floor(metric: str) -> float:
+    if metric.endswith('_ms'):
+        return NOISE_FLOOR_MS
+    if metric.endswith('_us'):
+        return NOISE_FLOOR_MS * 1000
+    return None
+
+
+def _case(result: Dict) -> str:
+    return '  '.join(f'{key}={value}' for key, value in result.items()
+                     if key != 'benchmark' and _timing_floor(key) is None
+                     and key not in COUNT_METRICS)
+
+
+def compare_results(results: Dict[str, List[Dict]], baseline: Dict[str, List[Dict]],
+                    tolerance: float = REGRESSION_TOLERANCE) -> List[Dict]:
+    """Compare each timing and query count with the baseline run.
+
+    Both are ``{benchmark name: [result, ...]}``; results are matched by
+    position within a benchmark, as every benchmark runs a fixed list of
+    cases. Cases missing from either side are skipped.
+    """
+    comparisons = []
+    for name, current in results.items():
+        for result, base in zip(current, baseline.get(name, [])):
+            if result['benchmark'] != base.get('benchmark'):
+                continue
+            for metric, value in result.items():
+                if metric not in base or not isinstance(value, (int, float)):
+                    continue
+                floor = _timing_floor(metric)
+                if floor is not None:
+                    regression = (value > base[metric] * (1 + tolerance)
+                                  and value - base[metric] > floor)
+                elif metric in COUNT_METRICS:
+                    regression = value > base[metric]
+                else:
+                    continue
+                comparisons.append({
+                    'benchmark': result['benchmark'],
+                    'case': _case(result),
+                    'metric': metric,
+                    'baseline': base[metric],
+                    'current': value,
+                    'change': round(value / base[metric] - 1, 3) if base[metric] else None,
+                    'regression': regression,
+                })
+    return comparisons
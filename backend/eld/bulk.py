@@ -0,0 +1,232 @@
+"""
+Offline bulk log generation (manage.py generate_logs).
+
+Trips are read from a CSV or JSONL file with the trip request fields
+(current_location, pickup_location, dropoff_location, current_cycle_used)
+and an optional ISO 8601 start_time, and processed a chunk at a time so
+memory stays flat however long the file is:
+
+    1. rows are validated; invalid ones are reported and skipped
+    2. each lane not seen in an earlier chunk is routed once
+    3. each distinct (cycle, lane, start) is scheduled in the process's
+       shared 'bulk.schedule' pool (see eld.pools)
+    4. trips are written with bulk INSERTs, or as JSON lines to a file
+
+While a chunk is written, the workers are already scheduling the next one.
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .batch import _route_lanes, calculate_schedule, lane_key
+from .calculations import summarize_hos_compliance
+from .persistence import create_trips_with_logs
+from .pools import get_process_pool, pool_map
+from .routing import RouteCalculator
+from .serializers import BulkTripSerializer
+
+BULK_DEFAULTS = {
+    'CHUNK_SIZE': 500,
+    'ROUTE_WORKERS': 8,
+    'SCHEDULE_WORKERS': None,  # defaults to the CPU count
+}
+
+FORMATS = ('csv', 'jsonl')
+
+SCHEDULE_POOL = 'bulk.schedule'
+
+
+class BulkInputError(ValueError):
+    pass
+
+
+def get_bulk_config() -> Dict:
+    return {**BULK_DEFAULTS, **getattr(settings, 'ELD_BULK', {})}
+
+
+def input_format(path: str, fmt: str = None) -> str:
+    """``fmt``, or the format implied by the file extension"""
+    fmt = fmt or os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt == 'ndjson':
+        fmt = 'jsonl'
+    if fmt not in FORMATS:
+        raise BulkInputError(f'Unknown input format {fmt!r}; use one of {", ".join(FORMATS)}')
+    return fmt
+
+
+def read_trips(stream: IO, fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """``(line number, row)`` of each trip in a CSV or JSONL stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Empty cells mean "not given", e.g. a blank start_time
+            yield reader.line_num, {key: value for key, value in row.items()
+                                    if value not in ('', None)}
+        return
+
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BulkInputError(f'Line {number}: {e}') from e
+        if not isinstance(row, dict):
+            raise BulkInputError(f'Line {number}: expected a JSON object')
+        yield number, row
+
+
+def _chunks(rows: Iterator, size: int) -> Iterator[List]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkGenerator:
+    """Generate and store the logs of every trip in an input stream.
+
+    ``output`` is a writable text stream for JSON lines; without one
+    trips are written to the database. ``progress`` is called after every
+    chunk with the running stats and the chunk's ``(line, errors)`` pairs.
+    """
+
+    def __init__(self, route_calculator: RouteCalculator = None, output: IO = None,
+                 chunk_size: int = None, workers: Optional[int] = None,
+                 progress: Callable[[Dict, List], None] = None):
+        config = get_bulk_config()
+        self.route_calculator = route_calculator or RouteCalculator()
+        self.output = output
+        self.chunk_size = chunk_size or config['CHUNK_SIZE']
+        self.route_workers = config['ROUTE_WORKERS']
+        self.workers = workers if workers is not None else config['SCHEDULE_WORKERS']
+        self.progress = progress
+        self.routes = {}  # lane -> route data, kept across chunks
+        self.stats = {'trips': 0, 'failed': 0, 'days': 0, 'elapsed': 0.0, 'trips_per_s': 0.0}
+
+    def run(self, rows: Iterable[Tuple[int, Dict]]) -> Dict:
+        started = time.perf_counter()
+        pending = None
+        for chunk in _chunks(iter(rows), self.chunk_size):
+            submitted = self._submit(chunk)
+            if pending is not None:
+                self._finish(*pending, started)
+            pending = submitted
+        if pending is not None:
+            self._finish(*pending, started)
+        return self.stats
+
+    @property
+    def in_process(self) -> bool:
+        # One worker means no pool: scheduling runs in this process
+        return self.workers is not None and self.workers <= 1
+
+    def _submit(self, chunk: List[Tuple[int, Dict]]) -> Tuple:
+        """Validate and route a chunk and start scheduling it"""
+        valid, errors = [], []
+        for number, row in chunk:
+            serializer = BulkTripSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((number, serializer.validated_data))
+            else:
+                errors.append((number, serializer.errors))
+
+        new_lanes = {}
+        for _, data in valid:
+            key = lane_key(data)
+            if key not in self.routes:
+                new_lanes.setdefault(key, data)
+        if new_lanes:
+            self.routes.update(_route_lanes(new_lanes, self.route_calculator, self.route_workers))
+
+        trips = []
+        for number, data in valid:
+            if self.routes[lane_key(data)]:
+                trips.append((number, data))
+            else:
+                errors.append((number, {'error': 'Could not calculate route'}))
+
+        inputs = {}
+        for _, data in trips:
+            inputs.setdefault(self._input(data), None)
+        args = [(cycle, self.routes[lane]['duration'], self.routes[lane]['distance'],
+                 self.routes[lane].get('geometry'), start)
+                for cycle, lane, start in inputs]
+
+        if not args:
+            schedules = []
+        elif self.in_process:
+            schedules = [calculate_schedule(*arg) for arg in args]
+        else:
+            try:
+                pool = get_process_pool(SCHEDULE_POOL, self.workers)
+                schedules = pool.map(calculate_schedule, *zip(*args), chunksize=8)
+            except BrokenProcessPool:
+                # Collected (and retried on a new pool) by _finish
+                schedules = None
+        return trips, errors, list(inputs), args, schedules
+
+    def _input(self, data: Dict) -> Tuple:
+        return float(data['current_cycle_used']), lane_key(data), data.get('start_time')
+
+    def _finish(self, trips: List, errors: List, inputs: List, args: List, schedules,
+                started: float):
+        """Collect a chunk's schedules and write it out"""
+        try:
+            schedules = list(schedules) if schedules is not None else None
+        except BrokenProcessPool:
+            schedules = None
+        if schedules is None:
+            # A worker died; pool_map replaces the pool and retries once
+            schedules = pool_map(SCHEDULE_POOL, self.workers, calculate_schedule,
+                                 *zip(*args), chunksize=8)
+        schedules = dict(zip(inputs, schedules))
+        plans = [(data, self.routes[lane_key(data)], schedules[self._input(data)])
+                 for _, data in trips]
+
+        if self.output is None:
+            create_trips_with_logs(plans)
+        else:
+            self._write(trips, errors, plans)
+
+        stats = self.stats
+        stats['trips'] += len(plans)
+        stats['failed'] += len(errors)
+        stats['days'] += sum(len(daily_schedules) for _, _, daily_schedules in plans)
+        stats['elapsed'] = round(time.perf_counter() - started, 3)
+        stats['trips_per_s'] = round(stats['trips'] / stats['elapsed'], 1) if stats['elapsed'] else 0.0
+        if self.progress:
+            self.progress(dict(stats), errors)
+
+    def _write(self, trips: List, errors: List, plans: List):
+        records = [
+            {'line': number, 'errors': trip_errors} for number, trip_errors in errors
+        ] + [
+            {
+                'line': number,
+                'trip': data,
+                'route': {
+                    'distance': route_data['distance'],
+                    'duration': route_data['duration'],
+                    'fuel_stops': route_data['fuel_stops'],
+                    'summary': route_data['summary'],
+                },
+                'daily_schedules': daily_schedules,
+                'hos_compliance_check': summarize_hos_compliance(
+                    data['current_cycle_used'], daily_schedules),
+            }
+            for (number, _), (data, route_data, daily_schedules) in zip(trips, plans)
+        ]
+        records.sort(key=lambda record: record['line'])
+        for record in records:
+            self.output.write(json.dumps(record, cls=DjangoJSONEncoder) + '\n')
@@ -0,0 +1,217 @@
+"""
+Two-tier caches for routing lookups.
+
+A bounded in-process LRU sits in front of a shared Django cache backend,
+so repeated lookups in one worker never leave the process and lookups
+resolved by another worker are reused until their TTL expires.
+SingleFlight coalesces concurrent misses for one key into a single call.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from django.core.cache import caches
+
+MISSING = object()
+
+
+def normalize_address(address: str) -> str:
+    """Normalize an address string into a stable cache key"""
+    address = address.lower().replace('.', ' ')
+    parts = [re.sub(r'\s+', ' ', part).strip() for part in address.split(',')]
+    return ', '.join(part for part in parts if part)
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory footprint of a JSON-like value in bytes"""
+    return len(json.dumps(value, separators=(',', ':'), default=str))
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with size caps and optional TTL.
+
+    ``max_size`` caps the number of entries; ``max_bytes`` additionally
+    caps their approximate JSON-encoded size.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key, MISSING)
+            if entry is MISSING:
+                return default
+
+            value, expires_at, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._pop(key)
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        size = estimate_size(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, expires_at, size)
+            self.total_bytes += size
+            while len(self._data) > self.max_size or (
+                    self.max_bytes and self.total_bytes > self.max_bytes):
+                self._pop(next(iter(self._data)))
+
+    def _pop(self, key: str):
+        _, _, size = self._data.pop(key)
+        self.total_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one execution.
+
+    The first caller runs the function; callers arriving while it is in
+    flight wait for it and receive the same result or exception.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop"""
+
+    def __init__(self):
+        self._flights = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight = self._flights.get(key)
+        if flight is not None:
+            return await asyncio.shield(flight)
+
+        flight = self._flights[key] = asyncio.ensure_future(fn())
+        try:
+            return await asyncio.shield(flight)
+        finally:
+            if flight.done():
+                del self._flights[key]
+            else:
+                # The leader was cancelled; drop the key once the call ends
+                flight.add_done_callback(lambda _: self._flights.pop(key, None))
+
+
+class TieredCache:
+    """In-process LRU tier backed by a shared Django cache with a TTL"""
+
+    def __init__(self, prefix: str, max_size: int = 1024, ttl: float = 86400,
+                 cache_alias: Optional[str] = 'default',
+                 max_bytes: Optional[int] = None):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self.local = LRUCache(max_size=max_size, ttl=ttl, max_bytes=max_bytes)
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def _count(self, counter: str):
+        with self._stats_lock:
+            self.stats[counter] += 1
+
+    def _shared_key(self, key: str) -> str:
+        # Hash so free-form addresses are valid keys for every backend
+        return f'{self.prefix}:{hashlib.sha1(key.encode()).hexdigest()}'
+
+    def get(self, key: str, default: Any = MISSING) -> Any:
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._count('local_hits')
+            return value
+
+        if self.shared is not None:
+            value = self.shared.get(self._shared_key(key), MISSING)
+            if value is not MISSING:
+                self._count('shared_hits')
+                self.local.set(key, value)
+                return value
+
+        self._count('misses')
+        return default
+
+    def set(self, key: str, value: Any):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), value, timeout=self.ttl)
+
+    def clear(self):
+        """Drop the in-process tier and reset counters"""
+        self.local.clear()
+        with self._stats_lock:
+            for counter in self.stats:
+                self.stats[counter] = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['local_size'] = len(self.local)
+        stats['local_bytes'] = self.local.total_bytes
+        return stats
@@ -1,15 +1,68 @@
 import math
 from datetime import datetime, timedelta
 from .hos_rules import HOSRules
+from .hos_engine import HOSSimulator, default_trip_start, render_days, start_hour
+from .geometry import RouteLocator
+from .schedule_cache import get_schedule_cache
 
 
 class TripCalculator:
-    def __init__(self, current_cycle_used=0):
+    # 'event' runs the continuous-time HOSSimulator; 'daily' is the
+    # original per-calendar-day planner
+    ENGINES = ('event', 'daily')
+
+    def __init__(self, current_cycle_used=0, engine='event', cycle_tracker=None):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown schedule engine: {engine}")
         self.current_cycle_used = current_cycle_used
+        self.engine = engine
+        # Optional CycleTracker with the driver's per-day history; the
+        # event engine uses it instead of current_cycle_used
+        self.cycle_tracker = cycle_tracker
         self.hos_rules = HOSRules()
 
-    def calculate_trip_schedule(self, total_duration_hours: float, total_distance_miles: float):
-        """Calculate complete trip schedule with HOS compliance"""
+    def calculate_trip_schedule(self, total_duration_hours: float, total_distance_miles: float,
+                                start: datetime = None, route_geometry: dict = None):
+        """Calculate complete trip schedule with HOS compliance.
+
+        With a GeoJSON ``route_geometry``, en-route activities are labelled
+        with their interpolated position on the route.
+        """
+        if self.engine == 'daily':
+            return self.calculate_daily_trip_schedule(
+                total_duration_hours, total_distance_miles)
+
+        start = start or default_trip_start()
+        days, miles = self.plan(total_duration_hours, total_distance_miles, start)
+        labels = None
+        if route_geometry and route_geometry.get('coordinates'):
+            labels = RouteLocator(route_geometry['coordinates'], total_distance_miles).describe(miles)
+        return render_days(days, start, labels)
+
+    def plan(self, total_duration_hours: float, total_distance_miles: float, start: datetime):
+        """Day template and interval mile markers of the trip, memoized per
+        process unless a cycle_tracker is set (see schedule_cache.py)"""
+        base = start_hour(start)
+
+        def build():
+            timeline = self.simulate(total_duration_hours, total_distance_miles, start)
+            return timeline.day_template(base), timeline.miles
+
+        cache = get_schedule_cache() if self.cycle_tracker is None else None
+        if cache is None:
+            return build()
+        key = (float(total_duration_hours), float(total_distance_miles),
+               float(self.current_cycle_used), base, type(self.hos_rules))
+        return cache.get_or_build(key, build)
+
+    def simulate(self, total_duration_hours: float, total_distance_miles: float,
+                 start: datetime = None):
+        """Run the event engine and return the columnar DutyTimeline"""
+        return HOSSimulator(self.current_cycle_used, self.hos_rules, self.cycle_tracker).simulate(
+            total_duration_hours, total_distance_miles, start)
+
+    def calculate_daily_trip_schedule(self, total_duration_hours: float, total_distance_miles: float):
+        """Plan the trip one calendar day at a time (original planner)"""
         days_needed = self.calculate_days_needed(total_duration_hours)
         daily_schedules = []
 
@@ -256,3 +309,15 @@ class TripCalculator:
             'hos_compliant': True,
             'is_restart_day': True
         }
+
+
+def summarize_hos_compliance(current_cycle_used: float, daily_schedules):
+    """Build the hos_compliance_check summary for a calculated schedule"""
+    total_on_duty = sum(s['total_on_duty_hours'] for s in daily_schedules)
+    return {
+        'is_compliant': True,
+        'total_days': len(daily_schedules),
+        'total_driving_hours': sum(s['total_driving_hours'] for s in daily_schedules),
+        'total_on_duty_hours': total_on_duty,
+        'cycle_used_end': float(current_cycle_used) + total_on_duty
+    }
@@ -0,0 +1,263 @@
+"""
+Streaming HOS compliance checks.
+
+ComplianceValidator takes a driver's duty-status intervals in time order,
+one at a time, and reports each violation at the moment the limit is
+crossed. Its state is a few counters plus a CycleTracker, so memory does
+not grow with the stream. Intervals may cross midnight; on-duty hours are
+booked on every calendar day an interval covers.
+
+Rules (49 CFR 395.3, property-carrying drivers):
+
+    driving_limit   more than 11 hours driving in a shift
+    duty_window     driving after the 14th hour since the shift began
+    break           driving after 8 hours of driving without a 30-minute
+                    interruption
+    cycle           driving beyond 70 on-duty hours in 8 days
+    overlap         an interval starting before the previous one ended;
+                    only the part after that end is checked
+
+10 consecutive hours off duty or in the sleeper berth start a new shift,
+34 restart the cycle. Time not covered by any interval counts as off duty.
+Each rule is reported once per shift (break: once per driving stretch,
+cycle: once per restart).
+
+audit_duty_statuses() streams every stored trip, DutyStatus rows and
+compact timelines alike, through a validator of its own.
+"""
+from datetime import date, datetime, time, timedelta
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.utils import timezone
+
+from .cycle import CycleTracker
+from .hos_rules import HOSRules
+from .models import DailyLog, DutyStatus
+from .timeline import timeline_intervals
+
+AUDIT_CHUNK_SIZE = 2000
+
+# Durations are stored to the minute and rounded; a second of slack keeps
+# rounding from being reported as a violation
+TOLERANCE = 1 / 3600
+
+OFF_DUTY_STATUSES = frozenset(('off_duty', 'sleeper_berth'))
+SHIFT_RULES = ('driving_limit', 'duty_window', 'break')
+
+Interval = Tuple[str, datetime, datetime]
+
+
+class Violation(NamedTuple):
+    rule: str
+    at: datetime
+    message: str
+    trip_id: Optional[int] = None
+
+
+def _hours(delta: timedelta) -> float:
+    return delta.total_seconds() / 3600
+
+
+class ComplianceValidator:
+    """Check one driver's intervals as they arrive.
+
+    ``cycle_tracker`` holds the driver's on-duty hours before the first
+    interval (see CycleTracker.from_history); it is copied, not changed.
+    Without one, ``current_cycle_used`` is booked on the day before the
+    first interval, as HOSSimulator does.
+    """
+
+    def __init__(self, hos_rules=HOSRules, cycle_tracker: CycleTracker = None,
+                 current_cycle_used: float = 0, trip_id: Optional[int] = None):
+        self.hos_rules = hos_rules
+        self.trip_id = trip_id
+        self.current_cycle_used = float(current_cycle_used)
+        self.cycle = (cycle_tracker.copy() if cycle_tracker is not None
+                      else CycleTracker(limit=hos_rules.CYCLE_LIMIT_8_DAY))
+        self.last_end = None
+        self.shift_start = None
+        self.shift_driving = 0.0
+        self.driving_since_break = 0.0
+        self.off_duty = 0.0  # consecutive off-duty hours
+        self.not_driving = float('inf')  # consecutive non-driving hours
+        self.reported = set()
+        # Aware times are compared as local wall-clock times, so calendar
+        # days split at local midnight
+        self.tz = timezone.get_current_timezone()
+        self.last_raw_end = self.last_naive_end = None
+
+    def _naive(self, value: datetime) -> datetime:
+        if value.tzinfo is None:
+            return value
+        return value.astimezone(self.tz).replace(tzinfo=None)
+
+    def validate(self, intervals: Iterable[Interval]) -> Iterator[Violation]:
+        """Feed ``(status, start, end)`` intervals, yielding violations"""
+        for status, start, end in intervals:
+            yield from self.feed(status, start, end)
+
+    def feed(self, status: str, start: datetime, end: datetime) -> List[Violation]:
+        """Check one interval; returns the violations it causes"""
+        # Consecutive intervals share boundaries
+        if start == self.last_raw_end:
+            start = self.last_naive_end
+        else:
+            start = self._naive(start)
+        self.last_raw_end = end
+        end = self.last_naive_end = self._naive(end)
+        violations = []
+
+        if self.last_end is None:
+            if self.cycle.current is None and self.current_cycle_used:
+                self.cycle.record(start.toordinal() - 1, self.current_cycle_used)
+        elif start < self.last_end - timedelta(hours=TOLERANCE):
+            violations.append(self._violation(
+                'overlap', start,
+                f'{status} starts before the previous interval ends at {self.last_end}'))
+            if end <= self.last_end:
+                return violations
+            start = self.last_end
+        elif start > self.last_end:
+            self._rest(_hours(start - self.last_end))
+        self.last_end = end
+
+        hours = _hours(end - start)
+        if status in OFF_DUTY_STATUSES:
+            self._rest(hours)
+            return violations
+
+        rules = self.hos_rules
+        if self.off_duty >= rules.RESTART_HOURS - TOLERANCE:
+            self.cycle.restart(start.toordinal())
+            self.reported.discard('cycle')
+        if self.shift_start is None or self.off_duty >= rules.MIN_OFF_DUTY - TOLERANCE:
+            self.shift_start = start
+            self.shift_driving = 0.0
+            self.driving_since_break = 0.0
+            self.reported.difference_update(SHIFT_RULES)
+        if self.not_driving >= rules.MIN_BREAK_DURATION - TOLERANCE:
+            self.driving_since_break = 0.0
+            self.reported.discard('break')
+        self.off_duty = 0.0
+
+        if status == 'driving':
+            self._check_driving(start, end, hours, violations)
+            self.shift_driving += hours
+            self.driving_since_break += hours
+            self.not_driving = 0.0
+        else:
+            self.not_driving += hours
+        self._book(start, end)
+        return violations
+
+    def _check_driving(self, start: datetime, end: datetime, hours: float,
+                       violations: List[Violation]):
+        rules = self.hos_rules
+
+        left = rules.DAILY_DRIVING_LIMIT - self.shift_driving
+        if hours > left + TOLERANCE:
+            self._report(violations, 'driving_limit', start + timedelta(hours=max(left, 0)),
+                         f'More than {rules.DAILY_DRIVING_LIMIT}h driving in a shift')
+
+        window_end = self.shift_start + timedelta(hours=rules.DUTY_WINDOW_LIMIT)
+        if end > window_end + timedelta(hours=TOLERANCE):
+            self._report(violations, 'duty_window', max(start, window_end),
+                         f'Driving after the {rules.DUTY_WINDOW_LIMIT}-hour duty window')
+
+        left = rules.BREAK_REQUIRED_AFTER - self.driving_since_break
+        if hours > left + TOLERANCE:
+            self._report(violations, 'break', start + timedelta(hours=max(left, 0)),
+                         f'Driving after {rules.BREAK_REQUIRED_AFTER}h without a '
+                         f'{round(rules.MIN_BREAK_DURATION * 60)}-minute break')
+
+        left = self.cycle.available_on(start.toordinal())
+        if hours > left + TOLERANCE:
+            self._report(violations, 'cycle', start + timedelta(hours=left),
+                         f'Driving beyond {self.cycle.limit:g}h on duty in '
+                         f'{self.cycle.days} days')
+
+    def _rest(self, hours: float):
+        self.off_duty += hours
+        self.not_driving += hours
+
+    def _book(self, start: datetime, end: datetime):
+        """Book on-duty hours on each calendar day they fall on"""
+        day = start.toordinal()
+        while True:
+            midnight = datetime.combine(date.fromordinal(day + 1), time())
+            if end <= midnight:
+                self.cycle.record(day, _hours(end - start))
+                return
+            self.cycle.record(day, _hours(midnight - start))
+            start = midnight
+            day += 1
+
+    def _report(self, violations: List[Violation], rule: str, at: datetime, message: str):
+        if rule not in self.reported:
+            self.reported.add(rule)
+            violations.append(self._violation(rule, at, message))
+
+    def _violation(self, rule: str, at: datetime, message: str) -> Violation:
+        return Violation(rule, at, message, self.trip_id)
+
+
+def activity_intervals(activities: Iterable[Dict]) -> Iterator[Interval]:
+    """Intervals of TripCalculator activity dicts"""
+    for activity in activities:
+        yield (activity['status'], datetime.fromisoformat(activity['start_time']),
+               datetime.fromisoformat(activity['end_time']))
+
+
+def validate_schedules(daily_schedules: Iterable[Dict], current_cycle_used: float = 0,
+                       hos_rules=HOSRules) -> Iterator[Violation]:
+    """Validate a calculated trip, day after day"""
+    validator = ComplianceValidator(hos_rules, current_cycle_used=current_cycle_used)
+    for schedule in daily_schedules:
+        yield from validator.validate(activity_intervals(schedule['activities']))
+
+
+def _audit_trips(rows: Iterable[Tuple], hos_rules) -> Iterator[Violation]:
+    """Validate ``(trip_id, current_cycle_used, status, start, end)`` rows
+    ordered by trip and start time"""
+    for (trip_id, current_cycle_used), trip_rows in groupby(rows, key=lambda row: row[:2]):
+        validator = ComplianceValidator(
+            hos_rules, current_cycle_used=current_cycle_used, trip_id=trip_id)
+        for _, _, status, start, end in trip_rows:
+            yield from validator.feed(status, start, end)
+
+
+def _timeline_rows(daily_logs) -> Iterator[Tuple]:
+    for trip_id, current_cycle_used, log_date, blob in daily_logs:
+        for status, start, end in timeline_intervals(blob, log_date):
+            yield trip_id, current_cycle_used, status, start, end
+
+
+def audit_duty_statuses(trip_ids: Iterable[int] = None, hos_rules=HOSRules,
+                        chunk_size: int = AUDIT_CHUNK_SIZE) -> Iterator[Violation]:
+    """Validate stored trips in one pass over the database.
+
+    Rows are read ``chunk_size`` at a time as plain tuples, so memory stays
+    flat however many trips are stored. Each trip is checked on its own,
+    starting from its ``current_cycle_used``.
+    """
+    duty_statuses = DutyStatus.objects.all()
+    daily_logs = DailyLog.objects.filter(timeline__isnull=False)
+    if trip_ids is not None:
+        trip_ids = list(trip_ids)
+        duty_statuses = duty_statuses.filter(daily_log__trip_id__in=trip_ids)
+        daily_logs = daily_logs.filter(trip_id__in=trip_ids)
+
+    yield from _audit_trips(
+        duty_statuses
+        .order_by('daily_log__trip_id', 'start_time')
+        .values_list('daily_log__trip_id', 'daily_log__trip__current_cycle_used',
+                     'status', 'start_time', 'end_time')
+        .iterator(chunk_size=chunk_size),
+        hos_rules)
+    yield from _audit_trips(_timeline_rows(
+        daily_logs
+        .order_by('trip_id', 'day_number')
+        .values_list('trip_id', 'trip__current_cycle_used', 'log_date', 'timeline')
+        .iterator(chunk_size=chunk_size)),
+        hos_rules)
@@ -0,0 +1,141 @@
+"""
+Rolling 70-hour/8-day cycle accounting.
+
+The cycle limit applies to on-duty hours in the last 8 consecutive days,
+so hours worked more than 8 days ago stop counting. CycleTracker keeps
+one on-duty total per day in an 8-slot ring buffer indexed by date
+ordinal plus a running sum. Recording hours and moving the window forward
+by a day are O(1), and "hours available on date D" only looks at the
+slots that would roll off before D.
+"""
+from datetime import date
+from typing import Iterable, Optional, Tuple, Union
+
+from django.db.models import Sum
+
+from .hos_rules import HOSRules
+from .models import DailyLog
+
+Day = Union[date, int]
+
+
+def _ordinal(day: Day) -> int:
+    return day if type(day) is int else day.toordinal()
+
+
+class CycleTracker:
+    """On-duty hours per day over a rolling window of ``days`` days"""
+
+    def __init__(self, limit: float = HOSRules.CYCLE_LIMIT_8_DAY, days: int = 8):
+        self.limit = float(limit)
+        self.days = days
+        self.hours = [0.0] * days
+        self.total = 0.0
+        self.current = None  # ordinal of the newest day in the window
+
+    def copy(self) -> 'CycleTracker':
+        tracker = CycleTracker(self.limit, self.days)
+        tracker.hours = list(self.hours)
+        tracker.total = self.total
+        tracker.current = self.current
+        return tracker
+
+    def advance(self, day: Day):
+        """Move the window forward so it ends on ``day``"""
+        ordinal = _ordinal(day)
+        if self.current is None:
+            self.current = ordinal
+            return
+        if ordinal < self.current:
+            raise ValueError(f'Cycle window already ends on {date.fromordinal(self.current)}')
+
+        for rolled in range(self.current + 1, min(ordinal, self.current + self.days) + 1):
+            slot = rolled % self.days
+            self.total -= self.hours[slot]
+            self.hours[slot] = 0.0
+        self.current = ordinal
+
+    def record(self, day: Day, on_duty_hours: float):
+        """Add on-duty hours worked on ``day``.
+
+        Days already outside the window are ignored, as they no longer
+        count towards the cycle.
+        """
+        ordinal = _ordinal(day)
+        if ordinal != self.current:
+            if self.current is None or ordinal > self.current:
+                self.advance(ordinal)
+            elif ordinal <= self.current - self.days:
+                return
+        self.hours[ordinal % self.days] += on_duty_hours
+        self.total += on_duty_hours
+
+    def restart(self, day: Day):
+        """34-hour restart: nothing worked before ``day`` counts any more"""
+        self.hours = [0.0] * self.days
+        self.total = 0.0
+        self.current = _ordinal(day)
+
+    def used_on(self, day: Day) -> float:
+        """On-duty hours in the window ending on ``day``, which may not be
+        before the last recorded day"""
+        ordinal = _ordinal(day)
+        if ordinal == self.current:
+            return self.total
+        if self.current is None:
+            return 0.0
+        if ordinal < self.current:
+            raise ValueError(f'Cycle window already ends on {date.fromordinal(self.current)}')
+
+        used = self.total
+        for rolled in range(self.current + 1, min(ordinal, self.current + self.days) + 1):
+            used -= self.hours[rolled % self.days]
+        return max(used, 0.0)
+
+    def available_on(self, day: Day) -> float:
+        """Cycle hours left on ``day``"""
+        return max(self.limit - self.used_on(day), 0.0)
+
+    @classmethod
+    def from_days(cls, totals: Iterable[Tuple[Day, float]], **kwargs) -> 'CycleTracker':
+        """Tracker seeded with ``(day, on_duty_hours)`` pairs in date order"""
+        tracker = cls(**kwargs)
+        for day, on_duty_hours in totals:
+            tracker.record(day, float(on_duty_hours))
+        return tracker
+
+    @classmethod
+    def from_cycle_used(cls, current_cycle_used: float, start: Day, **kwargs) -> 'CycleTracker':
+        """Tracker for a single client-supplied ``current_cycle_used``.
+
+        Without a per-day breakdown the hours are booked on the day before
+        ``start``, the latest they can have been worked, so none of them
+        roll off earlier than they really do.
+        """
+        tracker = cls(**kwargs)
+        tracker.record(_ordinal(start) - 1, float(current_cycle_used))
+        return tracker
+
+    @classmethod
+    def from_history(cls, start: Day, driver_name: Optional[str] = None,
+                     queryset=None, **kwargs) -> 'CycleTracker':
+        """Tracker seeded from stored DailyLog rows.
+
+        Only the days that can still count on ``start`` are read, summed
+        per date by the database in one query.
+        """
+        ordinal = _ordinal(start)
+        tracker = cls(**kwargs)
+        logs = DailyLog.objects.all() if queryset is None else queryset
+        if driver_name is not None:
+            logs = logs.filter(driver_name=driver_name)
+        totals = (
+            logs.filter(log_date__range=(date.fromordinal(ordinal - tracker.days + 1),
+                                         date.fromordinal(ordinal)))
+            .order_by('log_date')
+            .values_list('log_date')
+            .annotate(on_duty=Sum('total_on_duty_hours'))
+        )
+        for log_date, on_duty_hours in totals:
+            tracker.record(log_date, float(on_duty_hours))
+        return tracker
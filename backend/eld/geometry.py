@@ -0,0 +1,212 @@
+"""
+Vectorized kernels for route geometry.
+
+Coordinates are ``[lon, lat]`` pairs as in GeoJSON. All kernels work on
+whole arrays with NumPy, so a LineString with tens of thousands of
+vertices is measured in a single pass.
+
+Trips store their route as a Google encoded polyline (about 6 bytes per
+vertex instead of ~40 for JSON numbers), simplified with Douglas-Peucker
+at a storage tolerance well below what a map can show. Responses are
+rendered from it at the level of detail the client asks for.
+"""
+from typing import List, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_MILES = 6371 * 0.621371
+
+# Douglas-Peucker spans longer than this are scanned with NumPy
+SIMPLIFY_VECTOR_MIN = 48
+
+
+def haversine_miles(lon1, lat1, lon2, lat2) -> np.ndarray:
+    """Element-wise great-circle distance in miles"""
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=float))
+                              for v in (lon1, lat1, lon2, lat2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def as_coordinate_array(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    points = np.asarray(coordinates, dtype=float)
+    if points.ndim != 2 or points.shape[1] < 2:
+        return np.empty((0, 2))
+    return points[:, :2]
+
+
+def segment_miles(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """Length of each segment of a polyline, in miles"""
+    points = as_coordinate_array(coordinates)
+    if len(points) < 2:
+        return np.zeros(0)
+    return haversine_miles(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+
+
+def cumulative_miles(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """Mile marker of every vertex of a polyline, starting at 0"""
+    return np.concatenate(([0.0], np.cumsum(segment_miles(coordinates))))
+
+
+def polyline_miles(coordinates: Sequence[Sequence[float]]) -> float:
+    """Total length of a polyline in miles"""
+    return float(segment_miles(coordinates).sum())
+
+
+class RouteLocator:
+    """Maps route mile markers to positions along a route geometry.
+
+    ``route_miles`` is the route's reported distance; markers are scaled
+    onto the geometry's own length so the two need not agree exactly.
+    """
+
+    def __init__(self, coordinates: Sequence[Sequence[float]], route_miles: float = None):
+        self.points = as_coordinate_array(coordinates)
+        self.markers = cumulative_miles(self.points)
+        self.length = float(self.markers[-1])
+        self.scale = self.length / route_miles if route_miles and self.length > 0 else 1.0
+
+    def locate(self, miles) -> np.ndarray:
+        """Interpolated ``[lon, lat]`` rows for an array of mile markers"""
+        miles = np.asarray(miles, dtype=float)
+        if len(self.points) == 0:
+            return np.full((len(miles), 2), np.nan)
+        if len(self.points) == 1 or self.length == 0:
+            return np.repeat(self.points[:1], len(miles), axis=0)
+
+        position = np.clip(miles * self.scale, 0, self.length)
+        index = np.clip(
+            np.searchsorted(self.markers, position, side='right') - 1, 0, len(self.points) - 2)
+        span = self.markers[index + 1] - self.markers[index]
+        fraction = np.divide(
+            position - self.markers[index], span, out=np.zeros_like(position), where=span > 0)
+        start = self.points[index]
+        return start + fraction[:, None] * (self.points[index + 1] - start)
+
+    def describe(self, miles) -> List[str]:
+        """Human-readable location labels for an array of mile markers"""
+        miles = np.asarray(miles, dtype=float)
+        if len(self.points) == 0:
+            return [f'Route - mile {round(mile)}' for mile in miles.tolist()]
+        return [
+            f'Route - mile {round(mile)} ({lat:.4f}, {lon:.4f})'
+            for mile, (lon, lat) in zip(miles.tolist(), self.locate(miles).tolist())
+        ]
+
+
+def simplify(coordinates: Sequence[Sequence[float]], tolerance: float) -> List[List[float]]:
+    """Douglas-Peucker simplification with a tolerance in degrees"""
+    points = as_coordinate_array(coordinates)
+    if len(points) < 3 or tolerance <= 0:
+        return points.tolist()
+
+    lons, lats = points[:, 0], points[:, 1]
+    lon_list, lat_list = lons.tolist(), lats.tolist()
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        # Squared cross products rank points by distance from the chord
+        # without a division or square root per point
+        x0, y0 = lon_list[start], lat_list[start]
+        dx, dy = lon_list[end] - x0, lat_list[end] - y0
+        chord = dx * dx + dy * dy
+        limit = tolerance * tolerance * (chord if chord > 0 else 1)
+
+        if end - start > SIMPLIFY_VECTOR_MIN:
+            if chord > 0:
+                cross = dx * (lats[start + 1:end] - y0) - dy * (lons[start + 1:end] - x0)
+                distances = cross * cross
+            else:
+                distances = (lons[start + 1:end] - x0) ** 2 + (lats[start + 1:end] - y0) ** 2
+            farthest = int(distances.argmax())
+            worst = float(distances[farthest])
+            split = start + 1 + farthest
+        else:
+            # NumPy call overhead dominates on short spans
+            worst, split = -1.0, start
+            for i in range(start + 1, end):
+                if chord > 0:
+                    cross = dx * (lat_list[i] - y0) - dy * (lon_list[i] - x0)
+                    distance = cross * cross
+                else:
+                    distance = (lon_list[i] - x0) ** 2 + (lat_list[i] - y0) ** 2
+                if distance > worst:
+                    worst, split = distance, i
+
+        if worst > limit:
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return points[keep].tolist()
+
+
+def encode_polyline(coordinates: Sequence[Sequence[float]], precision: int = 5) -> str:
+    """Encode ``[lon, lat]`` pairs with Google's encoded polyline algorithm"""
+    points = as_coordinate_array(coordinates)
+    if len(points) == 0:
+        return ''
+
+    # The format stores (lat, lon) deltas as zigzag-encoded integers
+    scaled = np.round(points[:, ::-1] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    values = (deltas << 1) ^ (deltas >> 63)
+
+    chunks = []
+    for value in values.tolist():
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[List[float]]:
+    """Decode a Google encoded polyline into ``[lon, lat]`` pairs"""
+    values = []
+    result = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        result |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            result = shift = 0
+
+    if len(values) < 2:
+        return []
+    deltas = np.array(values[:len(values) // 2 * 2], dtype=np.int64).reshape(-1, 2)
+    points = np.cumsum(deltas, axis=0) / 10 ** precision
+    return points[:, ::-1].tolist()
+
+
+def geometry_coordinates(geometry: dict) -> List[List[float]]:
+    """Coordinates of a GeoJSON LineString or an encoded-polyline geometry"""
+    if not geometry:
+        return []
+    if geometry.get('type') == 'EncodedPolyline':
+        return decode_polyline(geometry.get('polyline', ''), geometry.get('precision', 5))
+    return geometry.get('coordinates') or []
+
+
+def encoded_geometry(coordinates: Sequence[Sequence[float]], precision: int = 5) -> dict:
+    """Geometry object holding an encoded polyline"""
+    return {
+        'type': 'EncodedPolyline',
+        'precision': precision,
+        'polyline': encode_polyline(coordinates, precision),
+    }
+
+
+def render_geometry(geometry: dict, tolerance: float = 0, fmt: str = 'geojson') -> dict:
+    """Render a stored geometry as a (simplified) LineString or polyline"""
+    coordinates = simplify(geometry_coordinates(geometry), tolerance)
+    if fmt == 'polyline':
+        return encoded_geometry(coordinates)
+    return {'type': 'LineString', 'coordinates': coordinates}
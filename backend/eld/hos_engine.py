@@ -0,0 +1,389 @@
+"""
+Continuous-time HOS simulation.
+
+HOSSimulator advances a single clock through a trip, inserting 30-minute
+breaks, 10-hour resets and 34-hour restarts exactly when a limit is
+reached instead of planning whole calendar days up front. Each step is
+O(1) and appends one interval to a DutyTimeline, a columnar buffer of
+parallel typed arrays; dicts are only built when the timeline is converted
+to the daily schedule format used by the API. On-duty hours are booked
+per calendar day on a CycleTracker, so they roll off the 70-hour/8-day
+cycle after 8 days.
+"""
+import math
+from array import array
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from .cycle import CycleTracker
+from .hos_rules import HOSRules
+
+EPSILON = 1e-9
+
+# Event kinds stored in the timeline's ``kinds`` column
+PRE_TRIP, PICKUP, DRIVING, BREAK, DROPOFF, POST_TRIP, REST, RESTART = range(8)
+
+# kind -> (status, description, location); None locations are filled with
+# the route mile marker at the start of the interval
+EVENT_KINDS = {
+    PRE_TRIP: ('on_duty', 'Pre-trip inspection and vehicle check', None),
+    PICKUP: ('on_duty', 'Loading and paperwork at pickup location', 'Pickup Location'),
+    DRIVING: ('driving', 'Driving', None),
+    BREAK: ('off_duty', '30-minute break as required by HOS', None),
+    DROPOFF: ('on_duty', 'Unloading and paperwork at destination', 'Dropoff Location'),
+    POST_TRIP: ('on_duty', 'Post-trip inspection and documentation', None),
+    REST: ('off_duty', '10-hour off-duty period as required by HOS', None),
+    RESTART: ('off_duty', '34-hour restart period to reset 70-hour cycle', None),
+}
+
+ON_DUTY_KINDS = frozenset(
+    kind for kind, (status, _, _) in EVENT_KINDS.items() if status in ('on_duty', 'driving'))
+
+# EVENT_KINDS plus on-duty flag, indexed by kind
+KIND_INFO = tuple((*EVENT_KINDS[kind], kind in ON_DUTY_KINDS) for kind in sorted(EVENT_KINDS))
+
+# Fixed durations in hours
+PRE_TRIP_HOURS = 0.25
+POST_TRIP_HOURS = 0.25
+PICKUP_HOURS = 1.0
+DROPOFF_HOURS = 1.0
+
+
+def default_trip_start() -> datetime:
+    """Trips start at 6:00 AM today unless a start time is given"""
+    return datetime.now().replace(hour=6, minute=0, second=0, microsecond=0)
+
+
+class DutyTimeline:
+    """Columnar buffer of duty-status intervals.
+
+    Offsets are hours relative to the start of the trip; ``miles`` is the
+    route distance covered when the interval starts and ``speed`` the
+    average miles per driving hour.
+    """
+
+    def __init__(self, speed: float = 0.0):
+        self.speed = speed
+        self.kinds = array('B')
+        self.starts = array('d')
+        self.ends = array('d')
+        self.miles = array('d')
+
+    def append(self, kind: int, start: float, end: float, miles: float):
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.miles.append(miles)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __iter__(self) -> Iterator[Tuple[int, float, float, float]]:
+        return zip(self.kinds, self.starts, self.ends, self.miles)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.itemsize * len(column)
+                   for column in (self.kinds, self.starts, self.ends, self.miles))
+
+    @property
+    def duration(self) -> float:
+        return self.ends[-1] if self.ends else 0.0
+
+    def count(self, kind: int) -> int:
+        return self.kinds.count(kind)
+
+    def to_daily_schedules(self, start: datetime, locator=None) -> List[Dict]:
+        """Split the timeline at midnight into TripCalculator day schedules.
+
+        Intervals crossing midnight are split between days. Trailing days
+        that only hold the final off-duty period are dropped. With a
+        RouteLocator, en-route locations are resolved along the route
+        geometry in one vectorized call.
+        """
+        labels = locator.describe(self.miles) if locator is not None else None
+        return render_days(self.day_template(start_hour(start)), start, labels)
+
+    def day_template(self, base: float) -> 'List[DayTemplate]':
+        """Date-independent day schedules for a trip starting ``base`` hours
+        after midnight (see render_days)"""
+        days = []
+        day = None
+        day_index = -1
+        day_end = 0.0
+        speed = self.speed
+        # Each piece starts where the previous one ended, so every boundary
+        # is converted once
+        end_clock = clock_time(round(base * 3600))
+
+        for index, (kind, begin, end, miles) in enumerate(self):
+            status, description, location, on_duty = KIND_INFO[kind]
+            label_index = -1
+            if location is None:
+                location = f'Route - mile {round(miles)}'
+                label_index = index
+
+            piece_start = base + begin
+            stop = base + end
+            while piece_start < stop - EPSILON:
+                # Offsets are never negative, so int() floors
+                if int(piece_start / 24 + EPSILON) != day_index:
+                    day_index = int(piece_start / 24 + EPSILON)
+                    while len(days) <= day_index:
+                        days.append(DayTemplate())
+                    day = days[day_index]
+                    day_end = (day_index + 1) * 24
+                piece_end = day_end if day_end < stop else stop
+                hours = piece_end - piece_start
+
+                start_clock = end_clock
+                end_clock = clock_time(round(piece_end * 3600))
+                day.activities.append((
+                    start_clock, end_clock, status, description, location,
+                    round(hours, 2), label_index))
+
+                if on_duty:
+                    day.on_duty_hours += hours
+                    if kind == DRIVING:
+                        day.driving_hours += hours
+                        day.distance += hours * speed
+                elif kind == BREAK:
+                    if piece_start == base + begin:
+                        day.breaks += 1
+                elif kind == RESTART:
+                    day.restart = True
+                piece_start = piece_end
+
+        while len(days) > 1 and days[-1].on_duty_hours <= EPSILON and not days[-1].restart:
+            days.pop()
+
+        for day in days:
+            if day.driving_hours > EPSILON:
+                day.restart = False
+            day.driving_hours = round(day.driving_hours, 2)
+            day.on_duty_hours = round(day.on_duty_hours, 2)
+            day.distance = round(day.distance, 2)
+        return days
+
+
+# 'HH:MM:' of every minute of the day and 'SS' of every second; formatting
+# clock times with %02d fields dominated rendering a schedule
+_MINUTE_PREFIXES = tuple(f'{minute // 60:02d}:{minute % 60:02d}:' for minute in range(1440))
+_SECONDS = tuple(f'{second:02d}' for second in range(60))
+
+
+def clock_time(seconds: int) -> Tuple[int, str]:
+    """``(day offset, 'HH:MM:SS')`` of seconds since midnight of the
+    trip's first day"""
+    day, seconds_of_day = divmod(seconds, 86400)
+    minute, second = divmod(seconds_of_day, 60)
+    return day, _MINUTE_PREFIXES[minute] + _SECONDS[second]
+
+
+class DayTemplate:
+    """One day of a trip, independent of the trip's start date.
+
+    ``activities`` are (start, end, status, description, location,
+    duration_hours, label_index) tuples. Times are clock_time pairs, so
+    rendering only prefixes a date; a label_index of -1 keeps the
+    location, otherwise it indexes the RouteLocator labels.
+    """
+
+    __slots__ = ('activities', 'driving_hours', 'on_duty_hours', 'breaks', 'distance', 'restart')
+
+    def __init__(self):
+        self.activities = []
+        self.driving_hours = 0.0
+        self.on_duty_hours = 0.0
+        self.breaks = 0
+        self.distance = 0.0
+        self.restart = False
+
+
+def start_hour(start: datetime) -> float:
+    """Hours from midnight to ``start``"""
+    return start.hour + start.minute / 60 + (start.second + start.microsecond / 1e6) / 3600
+
+
+def render_days(days: List[DayTemplate], start: datetime, labels=None) -> List[Dict]:
+    """Day schedules of a day template, dated from ``start``'s date"""
+    first_day = start.date()
+    dates = [first_day + timedelta(days=offset) for offset in range(len(days) + 1)]
+    date_strings = [day.isoformat() for day in dates]
+
+    if start.tzinfo is None:
+        prefixes = [f'{day}T' for day in date_strings]
+
+        def timestamp(clock):
+            return prefixes[clock[0]] + clock[1]
+    else:
+        # The UTC offset can change between days (DST), so aware stamps
+        # are built per date; consecutive intervals share boundaries
+        stamps = {}
+
+        def timestamp(clock):
+            stamp = stamps.get(clock)
+            if stamp is None:
+                stamp = stamps[clock] = datetime.combine(
+                    dates[clock[0]], time.fromisoformat(clock[1]), tzinfo=start.tzinfo
+                ).isoformat()
+            return stamp
+
+    schedules = []
+    for offset, day in enumerate(days):
+        schedule = {
+            'day_number': offset + 1,
+            'date': date_strings[offset],
+            'total_driving_hours': day.driving_hours,
+            'total_on_duty_hours': day.on_duty_hours,
+            'total_off_duty_hours': round(24 - day.on_duty_hours, 2),
+            'breaks_needed': day.breaks,
+            'estimated_distance': day.distance,
+            'activities': [
+                {
+                    'start_time': timestamp(begin),
+                    'end_time': timestamp(end),
+                    'status': status,
+                    'description': description,
+                    'location': labels[label_index] if labels and label_index >= 0 else location,
+                    'duration_hours': duration,
+                }
+                for begin, end, status, description, location, duration, label_index
+                in day.activities
+            ],
+            'hos_compliant': True,
+        }
+        if day.restart:
+            schedule['is_restart_day'] = True
+        schedules.append(schedule)
+    return schedules
+
+
+class HOSSimulator:
+    """Event-driven simulation of a trip under the 70-hour/8-day rules.
+
+    Pass a ``cycle_tracker`` (e.g. CycleTracker.from_history) to plan
+    against a driver's per-day history; otherwise ``current_cycle_used``
+    is booked on the day before the trip starts.
+    """
+
+    def __init__(self, current_cycle_used: float = 0, hos_rules=HOSRules,
+                 cycle_tracker: CycleTracker = None):
+        self.current_cycle_used = float(current_cycle_used)
+        self.hos_rules = hos_rules
+        self.cycle_tracker = cycle_tracker
+
+    def simulate(self, total_driving_hours: float, total_distance_miles: float,
+                 start: datetime = None) -> DutyTimeline:
+        """Simulate the trip and return its duty-status timeline"""
+        rules = self.hos_rules
+        speed = total_distance_miles / total_driving_hours if total_driving_hours > 0 else 0.0
+        start = start or default_trip_start()
+
+        self.timeline = DutyTimeline(speed)
+        self.clock = 0.0
+        self.miles = 0.0
+        # Date ordinal of the clock and the offset of its next midnight
+        self.today = start.toordinal()
+        self.midnight = 24 - (start.hour + start.minute / 60 + start.second / 3600)
+        if self.cycle_tracker is not None:
+            self.cycle = self.cycle_tracker.copy()
+        else:
+            self.cycle = CycleTracker.from_cycle_used(
+                self.current_cycle_used, self.today, limit=rules.CYCLE_LIMIT_8_DAY)
+        self.shift_start = 0.0
+        self.shift_driving = 0.0
+        self.driving_since_break = 0.0
+
+        if self._cycle_left() <= EPSILON:
+            self._emit(RESTART, rules.RESTART_HOURS)
+        self._start_shift()
+        self._emit(PICKUP, PICKUP_HOURS)
+
+        remaining = total_driving_hours
+        while remaining > EPSILON:
+            cycle_left = self._cycle_left()
+            shift_left = min(
+                rules.DAILY_DRIVING_LIMIT - self.shift_driving,
+                rules.DUTY_WINDOW_LIMIT - (self.clock - self.shift_start))
+            break_left = rules.BREAK_REQUIRED_AFTER - self.driving_since_break
+
+            driving = min(remaining, cycle_left, shift_left, break_left)
+            if driving > EPSILON:
+                self._emit(DRIVING, driving)
+                remaining -= driving
+            elif cycle_left <= EPSILON:
+                self._emit(POST_TRIP, POST_TRIP_HOURS)
+                self._wait_for_cycle()
+                self._start_shift()
+            elif shift_left <= EPSILON:
+                self._emit(POST_TRIP, POST_TRIP_HOURS)
+                self._emit(REST, rules.MIN_OFF_DUTY)
+                self._start_shift()
+            else:
+                self._emit(BREAK, rules.MIN_BREAK_DURATION)
+
+        self._emit(DROPOFF, DROPOFF_HOURS)
+        self._emit(POST_TRIP, POST_TRIP_HOURS)
+        self._emit(REST, rules.MIN_OFF_DUTY)
+        return self.timeline
+
+    def _day(self, offset: float) -> int:
+        """Date ordinal of a clock offset no earlier than the clock"""
+        return self.today + int(math.floor((offset - self.midnight) / 24 + EPSILON)) + 1
+
+    def _cycle_left(self) -> float:
+        cycle = self.cycle
+        if cycle.current == self.today:
+            return cycle.limit - cycle.total
+        return cycle.available_on(self.today)
+
+    def _wait_for_cycle(self):
+        """Rest until old on-duty hours roll off the cycle, or take a
+        34-hour restart if that is sooner"""
+        rules = self.hos_rules
+        rest_end = self.clock + rules.MIN_OFF_DUTY
+        while rest_end - self.clock < rules.RESTART_HOURS - EPSILON:
+            day = self._day(rest_end)
+            if self.cycle.available_on(day) > EPSILON:
+                self._emit(REST, rest_end - self.clock)
+                return
+            # Nothing rolls off before the next midnight
+            rest_end = self.midnight + (day - self.today) * 24
+        self._emit(RESTART, rules.RESTART_HOURS)
+
+    def _start_shift(self):
+        self.shift_start = self.clock
+        self.shift_driving = 0.0
+        self.driving_since_break = 0.0
+        self._emit(PRE_TRIP, PRE_TRIP_HOURS)
+
+    def _emit(self, kind: int, hours: float):
+        begin = self.clock
+        end = self.clock = begin + hours
+        # DutyTimeline.append, inlined: this runs once per interval
+        timeline = self.timeline
+        timeline.kinds.append(kind)
+        timeline.starts.append(begin)
+        timeline.ends.append(end)
+        timeline.miles.append(self.miles)
+
+        # Book on-duty hours on each calendar day they fall on
+        on_duty = kind in ON_DUTY_KINDS
+        while self.midnight <= end + EPSILON:
+            if on_duty and self.midnight > begin:
+                self.cycle.record(self.today, self.midnight - begin)
+                begin = self.midnight
+            self.today += 1
+            self.midnight += 24
+        if on_duty and end - begin > EPSILON:
+            self.cycle.record(self.today, end - begin)
+
+        if kind == DRIVING:
+            self.miles += hours * self.timeline.speed
+            self.shift_driving += hours
+            self.driving_since_break += hours
+        elif kind == BREAK:
+            self.driving_since_break = 0.0
+        elif kind == RESTART:
+            self.cycle.restart(self.today)
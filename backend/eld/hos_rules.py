@@ -40,27 +40,7 @@ class HOSRules:
     @classmethod
     def validate_daily_schedule(cls, activities):
         """Validate that daily schedule complies with HOS rules"""
-        total_driving = 0
-        total_on_duty = 0
-        driving_start_time = None
+        from .compliance import ComplianceValidator, activity_intervals
 
-        for activity in activities:
-            if activity['status'] == 'driving':
-                total_driving += activity['duration_hours']
-                if driving_start_time is None:
-                    driving_start_time = activity['start_time']
-
-            if activity['status'] in ['driving', 'on_duty']:
-                total_on_duty += activity['duration_hours']
-
-        # Check daily limits
-        violations = []
-        if total_driving > cls.DAILY_DRIVING_LIMIT:
-            violations.append(
-                f"Daily driving limit exceeded: {total_driving}h > {cls.DAILY_DRIVING_LIMIT}h")
-
-        if total_on_duty > cls.DUTY_WINDOW_LIMIT:
-            violations.append(
-                f"Duty window exceeded: {total_on_duty}h > {cls.DUTY_WINDOW_LIMIT}h")
-
-        return violations
+        return [violation.message for violation in
+                ComplianceValidator(cls).validate(activity_intervals(activities))]
@@ -0,0 +1,225 @@
+"""
+Idempotent /trips/calculate/ requests.
+
+Clients on flaky networks retry calculate requests; each retry would
+route the trip again and insert another Trip with all its rows. A request
+is identified by its Idempotency-Key header when it has one, and otherwise
+by a fingerprint of its normalized payload and geometry options:
+
+    in flight   concurrent requests with the same identity in one worker
+                share a single computation (SingleFlight)
+    completed   a successful response is kept in the shared Django cache,
+                for TTL seconds under an Idempotency-Key or PAYLOAD_WINDOW
+                seconds under a fingerprint, and replayed byte for byte
+                with an ``Idempotent-Replayed: true`` header
+
+Across workers, the first request takes a short lock in the cache; others
+wait for its stored response instead of computing their own. Reusing a
+key for a different payload is rejected with 422, and a request still
+waiting on another worker after WAIT_TIMEOUT gets 409.
+
+PAYLOAD_WINDOW defaults to 0 (only in-flight duplicates are coalesced),
+since two dispatchers may legitimately plan the same trip a minute apart.
+"""
+import asyncio
+import hashlib
+import json
+import time
+import weakref
+from typing import Awaitable, Callable, Dict, NamedTuple, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from .cache import AsyncSingleFlight, SingleFlight, normalize_address
+from .metrics import count
+from .serializers import geometry_options
+
+IDEMPOTENCY_DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 24 * 3600,  # seconds a keyed response is replayed
+    'PAYLOAD_WINDOW': 0,  # seconds an un-keyed response is replayed
+    'LOCK_TIMEOUT': 60,  # seconds; should exceed the slowest calculation
+    'WAIT_TIMEOUT': 30,  # seconds to wait on another worker's request
+    'POLL_INTERVAL': 0.05,
+}
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+KEY_PREFIX = 'eld:idempotency'
+
+_flights = SingleFlight()
+_async_flights = weakref.WeakKeyDictionary()  # event loop -> AsyncSingleFlight
+
+
+class IdempotencyError(Exception):
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class RequestIdentity(NamedTuple):
+    cache_key: str
+    fingerprint: str
+    ttl: float  # seconds the response is replayed for; 0 only coalesces
+
+
+def get_idempotency_config() -> Dict:
+    return {**IDEMPOTENCY_DEFAULTS, **getattr(settings, 'ELD_IDEMPOTENCY', {})}
+
+
+def get_idempotency_cache():
+    alias = get_idempotency_config()['CACHE_ALIAS']
+    return caches[alias] if alias else None
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def payload_fingerprint(data: Dict, request=None) -> str:
+    """Hash of a validated calculate payload and the response options"""
+    return _sha1(json.dumps([
+        normalize_address(data['current_location']),
+        normalize_address(data['pickup_location']),
+        normalize_address(data['dropoff_location']),
+        str(data['current_cycle_used'].normalize()),
+        geometry_options(request),
+    ]))
+
+
+def request_identity(request, data: Dict) -> RequestIdentity:
+    """Identity of a calculate request whose payload has been validated.
+
+    Raises IdempotencyError for an unusable Idempotency-Key header.
+    """
+    config = get_idempotency_config()
+    fingerprint = payload_fingerprint(data, request)
+    key = request.headers.get(HEADER)
+    if key is None:
+        return RequestIdentity(
+            f'{KEY_PREFIX}:payload:{fingerprint}', fingerprint, config['PAYLOAD_WINDOW'])
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(
+            f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters',
+            status.HTTP_400_BAD_REQUEST)
+    return RequestIdentity(f'{KEY_PREFIX}:key:{_sha1(key)}', fingerprint, config['TTL'])
+
+
+def _wait_for(cache, identity: RequestIdentity, config: Dict) -> Tuple:
+    """Poll for the response of a request running in another worker"""
+    deadline = time.monotonic() + config['WAIT_TIMEOUT']
+    lock_key = f'{identity.cache_key}:lock'
+    while time.monotonic() < deadline:
+        time.sleep(config['POLL_INTERVAL'])
+        stored = cache.get(identity.cache_key)
+        if stored is not None:
+            return (*stored, True)
+        if cache.get(lock_key) is None:
+            # The other request finished without a storable response
+            break
+    raise IdempotencyError(
+        'A request with the same identity is still in progress', status.HTTP_409_CONFLICT)
+
+
+def _store(cache, identity: RequestIdentity, response_data: Dict, status_code: int) -> Tuple:
+    content = JSONRenderer().render(response_data)
+    if cache is not None and status.is_success(status_code):
+        cache.set(identity.cache_key, (identity.fingerprint, status_code, content),
+                  timeout=identity.ttl)
+    return identity.fingerprint, status_code, content, False
+
+
+def _outcome(identity: RequestIdentity, result: Tuple, ran: bool) -> Tuple[int, bytes, bool]:
+    fingerprint, status_code, content, replayed = result
+    if fingerprint != identity.fingerprint:
+        raise IdempotencyError(
+            f'{HEADER} was already used with a different payload',
+            status.HTTP_422_UNPROCESSABLE_ENTITY)
+    # In-process followers share the leader's response
+    replayed = replayed or not ran
+    count('idempotency.replayed' if replayed else 'idempotency.computed')
+    return status_code, content, replayed
+
+
+def run_once(identity: RequestIdentity,
+             compute: Callable[[], Tuple[Dict, int]]) -> Tuple[int, bytes, bool]:
+    """``(status, content, replayed)`` of the request ``identity`` names.
+
+    ``compute`` returns ``(response_data, status)`` and runs at most once
+    per identity across concurrent callers; 2xx responses are stored.
+    """
+    config = get_idempotency_config()
+    cache = get_idempotency_cache() if identity.ttl else None
+    lock_key = f'{identity.cache_key}:lock'
+    ran = []
+
+    def lead():
+        ran.append(True)
+        if cache is None:
+            return _store(None, identity, *compute())
+        if not cache.add(lock_key, 1, timeout=config['LOCK_TIMEOUT']):
+            return _wait_for(cache, identity, config)
+        try:
+            # Another worker may have finished since the first lookup
+            stored = cache.get(identity.cache_key)
+            if stored is not None:
+                return (*stored, True)
+            return _store(cache, identity, *compute())
+        finally:
+            cache.delete(lock_key)
+
+    stored = cache.get(identity.cache_key) if cache is not None else None
+    if stored is not None:
+        return _outcome(identity, (*stored, True), ran=False)
+    result = _flights.do(f'{identity.cache_key}:{identity.fingerprint}', lead)
+    return _outcome(identity, result, bool(ran))
+
+
+async def run_once_async(identity: RequestIdentity,
+                         compute: Callable[[], Awaitable[Tuple[Dict, int]]]
+                         ) -> Tuple[int, bytes, bool]:
+    """run_once for the async endpoint; ``compute`` is a coroutine function
+    and in-flight duplicates are coalesced per event loop"""
+    config = get_idempotency_config()
+    cache = get_idempotency_cache() if identity.ttl else None
+    lock_key = f'{identity.cache_key}:lock'
+    ran = []
+
+    async def lead():
+        ran.append(True)
+        if cache is None:
+            return _store(None, identity, *await compute())
+        if not await sync_to_async(cache.add)(lock_key, 1, timeout=config['LOCK_TIMEOUT']):
+            return await sync_to_async(_wait_for, thread_sensitive=False)(
+                cache, identity, config)
+        try:
+            stored = await sync_to_async(cache.get)(identity.cache_key)
+            if stored is not None:
+                return (*stored, True)
+            return await sync_to_async(_store)(cache, identity, *await compute())
+        finally:
+            await sync_to_async(cache.delete)(lock_key)
+
+    stored = await sync_to_async(cache.get)(identity.cache_key) if cache is not None else None
+    if stored is not None:
+        return _outcome(identity, (*stored, True), ran=False)
+
+    loop = asyncio.get_running_loop()
+    flights = _async_flights.get(loop)
+    if flights is None:
+        flights = _async_flights[loop] = AsyncSingleFlight()
+    result = await flights.do(f'{identity.cache_key}:{identity.fingerprint}', lead)
+    return _outcome(identity, result, bool(ran))
+
+
+def idempotent_response(status_code: int, content: bytes, replayed: bool) -> HttpResponse:
+    response = HttpResponse(content, status=status_code, content_type='application/json')
+    if replayed:
+        response['Idempotent-Replayed'] = 'true'
+    return response
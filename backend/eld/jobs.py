@@ -0,0 +1,257 @@
+"""
+Background calculation jobs.
+
+A calculate request for a long trip can hold an HTTP worker for 30+
+seconds while ORS responds. With ``Prefer: respond-async`` the request is
+validated, written to the CalculationJob table and answered with 202 and
+the job's status URL at once; ``manage.py run_jobs`` workers then route,
+schedule and persist the trip exactly as the synchronous endpoint would,
+and store its response on the job. The database is the queue, so there is
+no broker to run:
+
+    queued      waiting for a worker; claimed oldest first
+    running     leased to one worker until lease_expires_at; a job whose
+                worker died is claimed again once the lease expires, up
+                to MAX_ATTEMPTS times, then failed
+    succeeded   ``result`` is the calculate response, ``trip`` the new trip
+    failed      ``error`` says why; ``result`` holds the error response
+
+Claims are a conditional UPDATE on the job's status and lease, so any
+number of worker processes, on any hosts, can share one table without row
+locks. Clients poll GET /api/jobs/<id>/, optionally with ``?wait=<s>`` to
+hold the request until the job finishes.
+"""
+import json
+import logging
+import os
+import socket
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from .idempotency import HEADER, MAX_KEY_LENGTH, IdempotencyError, _sha1, payload_fingerprint
+from .models import CalculationJob
+from .serializers import TripCalculationSerializer, geometry_options
+
+JOBS_DEFAULTS = {
+    'WORKERS': 2,  # processes started by run_jobs
+    'POLL_INTERVAL': 1.0,  # seconds an idle worker sleeps between claims
+    'LEASE': 300,  # seconds; should exceed the slowest calculation
+    'MAX_ATTEMPTS': 3,
+    'MAX_WAIT': 30,  # longest ?wait= a status request may hold
+    'WAIT_INTERVAL': 0.25,
+}
+
+logger = logging.getLogger(__name__)
+
+PREFER_ASYNC = 'respond-async'
+GEOMETRY_PARAMS = ('geometry_detail', 'geometry_format')
+CLAIM_CANDIDATES = 5
+
+
+def get_jobs_config() -> Dict:
+    return {**JOBS_DEFAULTS, **getattr(settings, 'ELD_JOBS', {})}
+
+
+def prefers_async(request) -> bool:
+    """Whether the request asked for a job (``Prefer: respond-async``)"""
+    preferences = request.headers.get('Prefer', '')
+    return PREFER_ASYNC in (p.split(';')[0].strip().lower() for p in preferences.split(','))
+
+
+def enqueue(data: Dict, request=None) -> Tuple[CalculationJob, bool]:
+    """Queue a validated calculate request; ``(job, created)``.
+
+    A repeated Idempotency-Key returns the job it first created, and is
+    rejected with IdempotencyError for a different payload.
+    """
+    geometry_options(request)
+    options = {name: value for name, value in getattr(request, 'GET', {}).items()
+               if name in GEOMETRY_PARAMS}
+    fingerprint = payload_fingerprint(data, request)
+    key = request.headers.get(HEADER) if request is not None else None
+    if key is not None and (not key or len(key) > MAX_KEY_LENGTH):
+        raise IdempotencyError(
+            f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters', status.HTTP_400_BAD_REQUEST)
+
+    fields = {
+        'payload': {
+            'current_location': data['current_location'],
+            'pickup_location': data['pickup_location'],
+            'dropoff_location': data['dropoff_location'],
+            'current_cycle_used': str(data['current_cycle_used']),
+        },
+        'options': options,
+        'fingerprint': fingerprint,
+    }
+    if key is None:
+        return CalculationJob.objects.create(**fields), True
+
+    digest = _sha1(key)
+    try:
+        with transaction.atomic():
+            return CalculationJob.objects.create(idempotency_key=digest, **fields), True
+    except IntegrityError:
+        job = CalculationJob.objects.get(idempotency_key=digest)
+    if job.fingerprint != fingerprint:
+        raise IdempotencyError(
+            f'{HEADER} was already used with a different payload',
+            status.HTTP_422_UNPROCESSABLE_ENTITY)
+    return job, False
+
+
+def worker_name() -> str:
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _claimable(now) -> Q:
+    return Q(status=CalculationJob.QUEUED) | Q(
+        status=CalculationJob.RUNNING, lease_expires_at__lt=now)
+
+
+def fail_abandoned() -> int:
+    """Fail running jobs whose lease expired on their last attempt"""
+    now = timezone.now()
+    return CalculationJob.objects.filter(
+        status=CalculationJob.RUNNING, lease_expires_at__lt=now,
+        attempts__gte=get_jobs_config()['MAX_ATTEMPTS'],
+    ).update(
+        status=CalculationJob.FAILED, finished_at=now, lease_expires_at=None,
+        error='Worker did not finish the job')
+
+
+def claim_job(worker: str) -> Optional[CalculationJob]:
+    """Lease the oldest claimable job to ``worker``, or None if there is none"""
+    config = get_jobs_config()
+    now = timezone.now()
+    claimable = _claimable(now) & Q(attempts__lt=config['MAX_ATTEMPTS'])
+    candidates = list(CalculationJob.objects.filter(claimable)
+                      .order_by('created_at', 'id')
+                      .values_list('pk', flat=True)[:CLAIM_CANDIDATES])
+    for pk in candidates:
+        # Compare-and-set: only one worker's UPDATE matches the row
+        claimed = CalculationJob.objects.filter(claimable, pk=pk).update(
+            status=CalculationJob.RUNNING,
+            worker=worker,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            lease_expires_at=now + timedelta(seconds=config['LEASE']),
+        )
+        if claimed:
+            return CalculationJob.objects.get(pk=pk)
+    return None
+
+
+def run_job(job: CalculationJob) -> CalculationJob:
+    """Calculate a claimed job and record its outcome"""
+    # Imported here: views imports this module for the enqueue endpoint
+    from .views import calculate_trip
+
+    serializer = TripCalculationSerializer(data=job.payload)
+    if serializer.is_valid():
+        response_data, status_code = calculate_trip(
+            serializer.validated_data, SimpleNamespace(GET=job.options))
+    else:
+        response_data, status_code = serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    succeeded = status.is_success(status_code)
+    fields = {
+        'status': CalculationJob.SUCCEEDED if succeeded else CalculationJob.FAILED,
+        # Decimals, datetimes etc. as the API would render them
+        'result': json.loads(JSONRenderer().render(response_data)),
+        'status_code': status_code,
+        'trip_id': response_data.get('id') if succeeded else None,
+        'error': '' if succeeded else str(response_data.get('error', response_data)),
+        'finished_at': timezone.now(),
+        'lease_expires_at': None,
+    }
+    # A worker whose lease expired must not overwrite its successor's job
+    CalculationJob.objects.filter(
+        pk=job.pk, status=CalculationJob.RUNNING, worker=job.worker).update(**fields)
+    job.refresh_from_db()
+    return job
+
+
+def close_old_connections():
+    """django.db.close_old_connections, leaving alone connections inside a
+    transaction (tests run workers in one)"""
+    for conn in connections.all(initialized_only=True):
+        if not conn.in_atomic_block:
+            conn.close_if_unusable_or_obsolete()
+
+
+def release_job(job: CalculationJob) -> int:
+    """Put a job back in the queue after its worker hit an error"""
+    return CalculationJob.objects.filter(
+        pk=job.pk, status=CalculationJob.RUNNING, worker=job.worker,
+    ).update(status=CalculationJob.QUEUED, lease_expires_at=None)
+
+
+def work(worker: str = None, stop=None, once: bool = False) -> int:
+    """Run jobs until ``stop`` is set, or until the queue is empty with
+    ``once``; returns the number of jobs run.
+
+    A database error (a restarted server, a stale pooled connection) is
+    logged and the loop carries on with a fresh connection; a job it
+    interrupted goes back to the queue.
+    """
+    config = get_jobs_config()
+    worker = worker or worker_name()
+    processed = 0
+    while stop is None or not stop.is_set():
+        job = None
+        # Drop connections that broke or outlived CONN_MAX_AGE, as Django
+        # does around each request
+        close_old_connections()
+        try:
+            fail_abandoned()
+            job = claim_job(worker)
+            if job is not None:
+                run_job(job)
+                processed += 1
+                continue
+        except Exception:
+            logger.exception('Job worker %s failed%s', worker,
+                             f' on job {job.pk}' if job is not None else '')
+            close_old_connections()
+            if job is not None:
+                try:
+                    release_job(job)
+                except Exception:
+                    # The lease expires and another worker retries it
+                    logger.exception('Could not release job %s', job.pk)
+        if once:
+            break
+        if stop is not None:
+            stop.wait(config['POLL_INTERVAL'])
+        else:
+            time.sleep(config['POLL_INTERVAL'])
+    close_old_connections()
+    return processed
+
+
+def job_data(job: CalculationJob) -> Dict:
+    """Status response of a job"""
+    data = {
+        'id': job.pk,
+        'status': job.status,
+        'attempts': job.attempts,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'trip_id': job.trip_id,
+    }
+    if job.status == CalculationJob.SUCCEEDED:
+        data['result'] = job.result
+    elif job.status == CalculationJob.FAILED:
+        data['error'] = job.error
+        data['result'] = job.result
+    return data
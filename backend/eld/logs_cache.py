@@ -0,0 +1,92 @@
+"""
+Materialized /trips/{id}/logs/ payloads.
+
+A stored trip's logs response only changes when its rows do, so the
+rendered JSON is kept in the shared Django cache together with an ETag,
+one entry per geometry option. Hits are served without touching the
+database, and clients that send If-None-Match get a 304. Model signals
+(see signals.py) drop a trip's entries whenever the trip, one of its
+daily logs or one of its duty statuses is saved or deleted.
+
+Use a cache backend shared by all workers (Redis, Memcached, database)
+in production; with the default per-process LocMemCache, an edit made in
+one worker does not invalidate the copies held by the others.
+"""
+import hashlib
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+
+from .models import Trip
+from .responses import logs_response
+from .serializers import GEOMETRY_FORMATS, geometry_options, get_geometry_config
+
+LOGS_CACHE_DEFAULTS = {
+    'CACHE_ALIAS': 'default',
+    'TTL': 7 * 86400,
+    'WARM_ON_CALCULATE': True,
+}
+
+KEY_PREFIX = 'eld:logs'
+
+
+def get_logs_cache_config() -> Dict:
+    return {**LOGS_CACHE_DEFAULTS, **getattr(settings, 'ELD_LOGS_CACHE', {})}
+
+
+def get_logs_cache():
+    alias = get_logs_cache_config()['CACHE_ALIAS']
+    return caches[alias] if alias else None
+
+
+def _key(trip_id, tolerance: Optional[float], fmt: str) -> str:
+    return f'{KEY_PREFIX}:{int(trip_id)}:{tolerance}:{fmt}'
+
+
+def logs_cache_key(trip_id, request=None) -> str:
+    return _key(trip_id, *geometry_options(request))
+
+
+def get_cached_logs(trip_id, request=None) -> Optional[Tuple[str, bytes]]:
+    """``(etag, content)`` for a trip's cached logs payload, or None"""
+    cache = get_logs_cache()
+    if cache is None:
+        return None
+    return cache.get(logs_cache_key(trip_id, request))
+
+
+def cache_logs(trip: Trip, request=None) -> Tuple[str, bytes]:
+    """Render a trip's logs payload, cache it and return ``(etag, content)``
+
+    ``trip`` should have ``daily_logs__duty_statuses`` prefetched.
+    """
+    content = JSONRenderer().render(logs_response(trip, request))
+    entry = (f'"{hashlib.sha1(content).hexdigest()}"', content)
+
+    cache = get_logs_cache()
+    if cache is not None:
+        cache.set(logs_cache_key(trip.pk, request), entry,
+                  timeout=get_logs_cache_config()['TTL'])
+    return entry
+
+
+def warm_logs(trip_id):
+    """Cache the default-option logs payload of a stored trip"""
+    trip = Trip.objects.prefetch_related('daily_logs__duty_statuses').filter(pk=trip_id).first()
+    if trip is not None:
+        cache_logs(trip)
+
+
+def invalidate_logs(trip_id):
+    """Drop every cached logs payload of a trip"""
+    cache = get_logs_cache()
+    if cache is None or trip_id is None:
+        return
+    tolerances = [*get_geometry_config()['DETAIL_TOLERANCES'].values(), None]
+    cache.delete_many([
+        _key(trip_id, tolerance, fmt)
+        for tolerance in tolerances
+        for fmt in GEOMETRY_FORMATS
+    ])
@@ -0,0 +1,36 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from eld.compliance import AUDIT_CHUNK_SIZE, audit_duty_statuses
+
+
+class Command(BaseCommand):
+    help = 'Re-check stored duty statuses against the HOS rules'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--trip', type=int, action='append', dest='trip_ids',
+            help='Only audit this trip (repeatable; default: every trip)')
+        parser.add_argument(
+            '--chunk-size', type=int, default=AUDIT_CHUNK_SIZE,
+            help='Rows fetched from the database at a time')
+        parser.add_argument(
+            '--summary', action='store_true',
+            help='Only print the number of violations per rule')
+
+    def handle(self, *args, **options):
+        counts = Counter()
+        for violation in audit_duty_statuses(options['trip_ids'],
+                                             chunk_size=options['chunk_size']):
+            counts[violation.rule] += 1
+            if not options['summary']:
+                self.stdout.write(
+                    f'trip={violation.trip_id}  rule={violation.rule}  '
+                    f'at={violation.at.isoformat()}  {violation.message}')
+
+        if not counts:
+            self.stdout.write(self.style.SUCCESS('No violations'))
+            return
+        for rule, count in counts.most_common():
+            self.stdout.write(self.style.WARNING(f'{rule}: {count}'))
@@ -0,0 +1,75 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eld.benchmarks import BENCHMARKS, REGRESSION_TOLERANCE, compare_results, run_metadata
+
+
+class Command(BaseCommand):
+    help = 'Run trip calculation benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help=f'Benchmarks to run (default: all). Available: {", ".join(BENCHMARKS)}')
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help='Number of timed runs per case')
+        parser.add_argument(
+            '--output',
+            help='Write the results as JSON to this file, e.g. to store a baseline')
+        parser.add_argument(
+            '--baseline',
+            help='Compare with a JSON file written by --output; fails on regressions')
+        parser.add_argument(
+            '--tolerance', type=float, default=REGRESSION_TOLERANCE,
+            help='Allowed slowdown against the baseline, as a fraction '
+                 f'(default: {REGRESSION_TOLERANCE})')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+        baseline = None
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as stream:
+                    baseline = json.load(stream)['results']
+            except (OSError, ValueError, KeyError) as e:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {e}")
+
+        results = {}
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results[name] = list(BENCHMARKS[name](repeat=options['repeat']))
+            for result in results[name]:
+                self.stdout.write('  ' + '  '.join(
+                    f'{key}={value}' for key, value in result.items()))
+
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump({'meta': run_metadata(options['repeat']), 'results': results},
+                          stream, indent=2)
+                stream.write('\n')
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            self.report(compare_results(results, baseline, options['tolerance']))
+
+    def report(self, comparisons):
+        self.stdout.write(self.style.MIGRATE_HEADING('baseline'))
+        regressions = [c for c in comparisons if c['regression']]
+        for comparison in regressions:
+            change = comparison['change']
+            self.stdout.write(self.style.ERROR(
+                f"  {comparison['benchmark']}  {comparison['case']}  {comparison['metric']}: "
+                f"{comparison['baseline']} -> {comparison['current']}"
+                + (f' ({change:+.0%})' if change is not None else '')))
+
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} of {len(comparisons)} metrics regressed against the baseline')
+        self.stdout.write(self.style.SUCCESS(
+            f'No regressions in {len(comparisons)} metrics'))
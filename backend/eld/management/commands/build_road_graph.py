@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eld.road_graph import build_road_graph
+
+
+class Command(BaseCommand):
+    help = 'Build an offline road graph file from an OpenStreetMap XML extract'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'extract', help='OSM XML extract (.osm, .osm.gz or .osm.bz2)')
+        parser.add_argument(
+            'output', help='Road graph file to write (set as ELD_ROUTING["ROAD_GRAPH_PATH"])')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            stats = build_road_graph(options['extract'], options['output'])
+        except (OSError, SyntaxError) as e:
+            raise CommandError(f"Could not build road graph: {e}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {stats['nodes']} nodes, "
+            f"{stats['edges']} edges from {stats['ways']} ways "
+            f"in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,69 @@
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eld.bulk import FORMATS, BulkGenerator, BulkInputError, input_format, read_trips
+from eld.routing import RouteCalculator, offline_route_calculator
+
+
+class Command(BaseCommand):
+    help = 'Generate ELD logs for every trip in a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Trips file: current_location, pickup_location, dropoff_location, '
+                 'current_cycle_used and an optional ISO 8601 start_time per row')
+        parser.add_argument(
+            '--format', choices=FORMATS,
+            help='Input format (default: from the file extension)')
+        parser.add_argument(
+            '--output',
+            help='Write results as JSON lines to this file instead of the database')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Trips validated, scheduled and written at a time')
+        parser.add_argument(
+            '--workers', type=int,
+            help='Scheduling processes (default: one per CPU; 1 runs in-process)')
+        parser.add_argument(
+            '--offline', action='store_true',
+            help='Route locally instead of calling the routing API: on the road '
+                 'graph if configured, else a straight-line estimate')
+        parser.add_argument(
+            '--show-errors', action='store_true',
+            help='Print the validation/routing errors of each failed row')
+
+    def handle(self, *args, **options):
+        try:
+            fmt = input_format(options['path'], options['format'])
+        except BulkInputError as e:
+            raise CommandError(str(e))
+
+        def progress(stats, errors):
+            if options['show_errors']:
+                for number, row_errors in errors:
+                    self.stderr.write(f'line {number}: {row_errors}')
+            self.stdout.write(
+                f"{stats['trips']} trips  {stats['days']} days  {stats['failed']} failed  "
+                f"{stats['elapsed']:.1f}s  {stats['trips_per_s']} trips/s")
+
+        route_calculator = offline_route_calculator() if options['offline'] else RouteCalculator()
+        output = options['output']
+        try:
+            with open(options['path'], newline='', encoding='utf-8') as stream, \
+                    open(output, 'w', encoding='utf-8') if output else nullcontext() as out:
+                stats = BulkGenerator(
+                    route_calculator=route_calculator,
+                    output=out,
+                    chunk_size=options['chunk_size'],
+                    workers=options['workers'],
+                    progress=progress,
+                ).run(read_trips(stream, fmt))
+        except (OSError, BulkInputError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {stats['trips']} trips ({stats['days']} daily logs) in "
+            f"{stats['elapsed']:.1f}s, {stats['trips_per_s']} trips/s"
+            + (f"; {stats['failed']} rows failed" if stats['failed'] else '')))
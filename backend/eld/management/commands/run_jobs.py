@@ -0,0 +1,112 @@
+import multiprocessing
+import multiprocessing.connection
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from eld.jobs import get_jobs_config, work, worker_name
+
+RESTART_DELAY = 1.0  # seconds; keeps a crashing worker from spinning
+STOP_POLL_INTERVAL = 0.1
+
+
+class _StopFlag:
+    """Stop flag shared with worker processes, without locks.
+
+    A multiprocessing.Event deadlocks its setter when a worker is killed
+    while waiting on it, and a signal handler setting one deadlocks if the
+    main thread is inside the Event's lock.
+    """
+
+    def __init__(self):
+        self.value = multiprocessing.RawValue('b', 0)
+
+    def set(self, *args):
+        self.value.value = 1
+
+    def is_set(self) -> bool:
+        return bool(self.value.value)
+
+    def wait(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while not self.is_set() and time.monotonic() < deadline:
+            time.sleep(min(STOP_POLL_INTERVAL, timeout))
+
+
+def _interrupt(*args):
+    raise KeyboardInterrupt
+
+
+def _work_forever(stop):
+    # The parent stops children through ``stop`` once the current job is
+    # done, also when a service manager signals the whole process group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    work(stop=stop)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Run queued trip calculation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int,
+            help='Worker processes (default: ELD_JOBS["WORKERS"]; 1 runs in-process)')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Run the queued jobs in-process and exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = work(once=True)
+            self.stdout.write(self.style.SUCCESS(f'Ran {processed} jobs'))
+            return
+
+        workers = options['workers'] or get_jobs_config()['WORKERS']
+        if workers <= 1:
+            stop = _StopFlag()
+            signal.signal(signal.SIGINT, stop.set)
+            signal.signal(signal.SIGTERM, stop.set)
+            self.stdout.write(f'Worker {worker_name()} waiting for jobs')
+            work(stop=stop)
+            return
+
+        # Children must open their own database connections and pools
+        connections.close_all()
+        for conn in connections.all(initialized_only=True):
+            if conn.vendor == 'postgresql':
+                conn.close_pool()
+
+        stop = _StopFlag()
+        signal.signal(signal.SIGINT, _interrupt)
+        signal.signal(signal.SIGTERM, _interrupt)
+        processes = [self.start_worker(stop) for _ in range(workers)]
+        self.stdout.write(f'Started {workers} workers: '
+                          + ', '.join(str(process.pid) for process in processes))
+        try:
+            while True:
+                multiprocessing.connection.wait(
+                    [process.sentinel for process in processes], timeout=RESTART_DELAY)
+                for i, process in enumerate(processes):
+                    if not process.is_alive():
+                        # Crashed or killed; its job is retried once the
+                        # lease expires
+                        self.stderr.write(f'Worker {process.pid} exited with code '
+                                          f'{process.exitcode}; restarting')
+                        time.sleep(RESTART_DELAY)
+                        processes[i] = self.start_worker(stop)
+        except KeyboardInterrupt:
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            self.stdout.write('Stopping after the running jobs finish')
+            stop.set()
+        for process in processes:
+            process.join()
+
+    def start_worker(self, stop):
+        process = multiprocessing.Process(target=_work_forever, args=(stop,), daemon=True)
+        process.start()
+        return process
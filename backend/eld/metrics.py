@@ -0,0 +1,355 @@
+"""
+Request instrumentation: stage timers, event counters and query counts.
+
+MetricsMiddleware gives each request a RequestMetrics, held in a context
+variable. Code on the request path times its stages with ``stage()`` and
+counts events (cache hits, ORS fallbacks) with ``count()``; both are a
+single ContextVar lookup when no request is being measured, so they cost
+next to nothing with ELD_METRICS['ENABLED'] off, when the middleware
+removes itself. A request's numbers are merged into the process-wide
+registry once, when it finishes, and reported:
+
+    Server-Timing   per-stage durations, DB time and query count of the
+                    request itself (ELD_METRICS['SERVER_TIMING'])
+    /api/metrics/   Prometheus text exposition of the registry, for
+                    clients on ELD_METRICS['ALLOWED_NETWORKS'] or
+                    presenting ``Authorization: Bearer <TOKEN>``
+
+The middleware runs in the server's mode, sync under WSGI and async under
+ASGI, so async views aren't forced through a thread. Queries are counted
+by an execute wrapper on every connection that reads the context variable,
+which sync_to_async copies into the thread running the ORM.
+
+The registry is per process: scrape every worker, or run one per host.
+"""
+import hmac
+import ipaddress
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.signals import request_started
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+METRICS_DEFAULTS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'QUERY_COUNTS': True,
+    # Clients allowed to read /api/metrics/, by REMOTE_ADDR
+    'ALLOWED_NETWORKS': ('127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12',
+                         '192.168.0.0/16', 'fc00::/7'),
+    'TOKEN': '',  # also allow ``Authorization: Bearer <TOKEN>``; empty: off
+}
+
+# Seconds; Prometheus' default buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def get_metrics_config() -> Dict:
+    return {**METRICS_DEFAULTS, **getattr(settings, 'ELD_METRICS', {})}
+
+
+class RequestMetrics:
+    """Stage durations, events and queries of one request"""
+
+    __slots__ = ('stages', 'events', 'queries', 'query_seconds')
+
+    def __init__(self):
+        self.stages = {}
+        self.events = defaultdict(int)
+        self.queries = 0
+        self.query_seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestMetrics]] = ContextVar('eld_request_metrics', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    """Execute wrapper timing the queries of the request being measured"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.query_seconds += time.perf_counter() - started
+        metrics.queries += 1
+
+
+def _count_queries(connection, **kwargs):
+    """Install _record_query on ``connection``; a connection_created
+    receiver"""
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _count_thread_queries(**kwargs):
+    """request_started receiver; sent on the thread that runs the request's
+    sync code, also under ASGI"""
+    _count_queries(connection)
+
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics: RequestMetrics, name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        stages = self.metrics.stages
+        stages[self.name] = stages.get(self.name, 0.0) + time.perf_counter() - self.started
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_STAGE = _NoStage()
+
+
+def stage(name: str):
+    """Context manager adding the block's duration to stage ``name`` of the
+    current request; repeated stages add up"""
+    metrics = _current.get()
+    return _NO_STAGE if metrics is None else _Stage(metrics, name)
+
+
+def count(event: str, amount: int = 1):
+    """Count an event, e.g. ``route_cache.hit``, for the current request"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.events[event] += amount
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, in Prometheus' data model"""
+
+    def __init__(self):
+        self.counters = defaultdict(float)  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> _Histogram
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def _histogram(self, name: str, labels: Labels, buckets) -> _Histogram:
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[name, labels] = _Histogram(buckets)
+        return histogram
+
+    def record_request(self, metrics: RequestMetrics, view: str, method: str,
+                       status_code: int, seconds: float, query_counts: bool = True):
+        view_labels = (('view', view),)
+        with self._lock:
+            self.counters['eld_requests_total', (
+                ('view', view), ('method', method), ('status', str(status_code)))] += 1
+            self._histogram('eld_request_duration_seconds', view_labels,
+                            DURATION_BUCKETS).observe(seconds)
+            for name, stage_seconds in metrics.stages.items():
+                self._histogram('eld_stage_duration_seconds', (('stage', name),),
+                                DURATION_BUCKETS).observe(stage_seconds)
+            for event, amount in metrics.events.items():
+                self.counters['eld_events_total', (('event', event),)] += amount
+            if query_counts:
+                self._histogram('eld_request_queries', view_labels,
+                                QUERY_BUCKETS).observe(metrics.queries)
+                self.counters['eld_db_query_seconds_total', view_labels] += metrics.query_seconds
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, (histogram.buckets, list(histogram.counts), histogram.sum, histogram.count))
+                for key, histogram in self.histograms.items())
+
+        lines = []
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+                lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for (name, labels), (buckets, counts, total, observations) in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# HELP {name} {METRIC_HELP[name]}')
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} '
+                             f'{cumulative}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {observations}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+            lines.append(f'{name}_count{_labels(labels)} {observations}')
+        return '\n'.join(lines) + '\n'
+
+
+METRIC_HELP = {
+    'eld_requests_total': 'Requests handled, by view, method and status.',
+    'eld_request_duration_seconds': 'Request latency, by view.',
+    'eld_stage_duration_seconds': 'Time spent in each stage of a request.',
+    'eld_events_total': 'Cache hits and misses, ORS requests and fallbacks.',
+    'eld_request_queries': 'Database queries per request, by view.',
+    'eld_db_query_seconds_total': 'Time spent in database queries, by view.',
+}
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(
+        key, value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for key, value in labels)
+    return '{' + pairs + '}'
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def measure(query_counts: bool = True) -> Iterator[RequestMetrics]:
+    """Measure the enclosed block as a request would be"""
+    if query_counts:
+        _count_queries(connection)
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+def server_timing(metrics: RequestMetrics, seconds: float, query_counts: bool = True) -> str:
+    """Server-Timing header value; durations in milliseconds"""
+    entries = [f'{name};dur={stage_seconds * 1000:.2f}'
+               for name, stage_seconds in metrics.stages.items()]
+    if query_counts:
+        entries.append(f'db;dur={metrics.query_seconds * 1000:.2f};desc="{metrics.queries} queries"')
+    entries.append(f'total;dur={seconds * 1000:.2f}')
+    return ', '.join(entries)
+
+
+class MetricsMiddleware:
+    """Measure each request; removed from the stack unless
+    ELD_METRICS['ENABLED']"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = get_metrics_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.server_timing = config['SERVER_TIMING']
+        self.query_counts = config['QUERY_COUNTS']
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        if self.query_counts:
+            # ORM calls of async requests run on sync_to_async threads,
+            # whose connections the middleware never sees
+            connection_created.connect(_count_queries, dispatch_uid='eld.metrics')
+            request_started.connect(_count_thread_queries, dispatch_uid='eld.metrics')
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        with measure(self.query_counts) as metrics:
+            response = self.get_response(request)
+        return self.record(request, response, metrics, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with measure(query_counts=False) as metrics:
+            response = await self.get_response(request)
+        return self.record(request, response, metrics, time.perf_counter() - started)
+
+    def record(self, request, response, metrics: RequestMetrics, seconds: float):
+        match = request.resolver_match
+        registry.record_request(
+            metrics, match.view_name if match else 'unmatched', request.method,
+            response.status_code, seconds, self.query_counts)
+        if self.server_timing:
+            response['Server-Timing'] = server_timing(metrics, seconds, self.query_counts)
+        return response
+
+
+def metrics_allowed(request, config: Dict) -> bool:
+    """Whether ``request`` may read the registry"""
+    token = config['TOKEN']
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(
+                credentials.strip().encode(), token.encode()):
+            return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in config['ALLOWED_NETWORKS'])
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint"""
+    config = get_metrics_config()
+    if not config['ENABLED']:
+        raise Http404('Metrics are disabled')
+    if not metrics_allowed(request, config):
+        return HttpResponseForbidden('Metrics are only served to internal clients')
+    return HttpResponse(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
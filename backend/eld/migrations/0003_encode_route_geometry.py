@@ -0,0 +1,121 @@
+from django.db import migrations
+
+STORAGE_TOLERANCE = 0.00001
+PRECISION = 5
+
+
+# Frozen copies of eld.geometry's simplify and polyline codec as of this
+# migration, so later changes to the app's geometry code don't change
+# what it does to existing rows
+
+def simplify(coordinates, tolerance):
+    """Douglas-Peucker simplification of ``[lon, lat]`` pairs with a
+    tolerance in degrees"""
+    if any(len(point) < 2 for point in coordinates):
+        return []
+    points = [[float(point[0]), float(point[1])] for point in coordinates]
+    if len(points) < 3 or tolerance <= 0:
+        return points
+
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        x0, y0 = points[start]
+        dx, dy = points[end][0] - x0, points[end][1] - y0
+        chord = dx * dx + dy * dy
+        limit = tolerance * tolerance * (chord if chord > 0 else 1)
+
+        worst, split = -1.0, start
+        for i in range(start + 1, end):
+            lon, lat = points[i]
+            if chord > 0:
+                cross = dx * (lat - y0) - dy * (lon - x0)
+                distance = cross * cross
+            else:
+                distance = (lon - x0) ** 2 + (lat - y0) ** 2
+            if distance > worst:
+                worst, split = distance, i
+
+        if worst > limit:
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def encode_polyline(coordinates, precision=PRECISION):
+    """Google encoded polyline of ``[lon, lat]`` pairs"""
+    chunks = []
+    previous_lat = previous_lon = 0
+    for lon, lat in coordinates:
+        lat, lon = round(lat * 10 ** precision), round(lon * 10 ** precision)
+        for delta in (lat - previous_lat, lon - previous_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chunks.append(chr(value + 63))
+        previous_lat, previous_lon = lat, lon
+    return ''.join(chunks)
+
+
+def decode_polyline(encoded, precision=PRECISION):
+    """``[lon, lat]`` pairs of a Google encoded polyline"""
+    values = []
+    result = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        result |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            result = shift = 0
+
+    coordinates = []
+    lat = lon = 0
+    for i in range(0, len(values) // 2 * 2, 2):
+        lat += values[i]
+        lon += values[i + 1]
+        coordinates.append([lon / 10 ** precision, lat / 10 ** precision])
+    return coordinates
+
+
+def encode_route_geometry(apps, schema_editor):
+    Trip = apps.get_model('eld', 'Trip')
+    trips = Trip.objects.filter(route_geometry__type='LineString').only('id', 'route_geometry')
+    for trip in trips.iterator(chunk_size=500):
+        coordinates = simplify(trip.route_geometry.get('coordinates') or [], STORAGE_TOLERANCE)
+        trip.route_geometry = {
+            'type': 'EncodedPolyline',
+            'precision': PRECISION,
+            'polyline': encode_polyline(coordinates),
+        }
+        trip.save(update_fields=['route_geometry'])
+
+
+def decode_route_geometry(apps, schema_editor):
+    Trip = apps.get_model('eld', 'Trip')
+    trips = Trip.objects.filter(route_geometry__type='EncodedPolyline').only('id', 'route_geometry')
+    for trip in trips.iterator(chunk_size=500):
+        geometry = trip.route_geometry
+        trip.route_geometry = {
+            'type': 'LineString',
+            'coordinates': decode_polyline(geometry['polyline'], geometry.get('precision', 5)),
+        }
+        trip.save(update_fields=['route_geometry'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld', '0002_remove_trip_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(encode_route_geometry, decode_route_geometry),
+    ]
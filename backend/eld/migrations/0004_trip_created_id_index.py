@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld', '0003_encode_route_geometry'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='trip',
+            options={'ordering': ['-created_at', '-id']},
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['-created_at', '-id'], name='eld_trip_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld', '0004_trip_created_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('text', models.TextField(unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='dailylog',
+            name='timeline',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 05:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld', '0005_compact_timelines'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailylog',
+            index=models.Index(fields=['driver_name', 'log_date'], name='eld_dailylog_driver_date_idx'),
+        ),
+    ]
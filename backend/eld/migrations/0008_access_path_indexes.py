@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('eld', '0007_calculationjob'),
+    ]
+
+    operations = [
+        # The composite indexes lead with the foreign keys, which then need
+        # no index of their own; create them before dropping those
+        migrations.AddIndex(
+            model_name='dailylog',
+            index=models.Index(fields=['trip', 'day_number'], name='eld_dailylog_trip_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dutystatus',
+            index=models.Index(fields=['daily_log', 'start_time'], name='eld_dutystatus_log_start_idx'),
+        ),
+        migrations.AlterField(
+            model_name='dailylog',
+            name='trip',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='daily_logs', to='eld.trip'),
+        ),
+        migrations.AlterField(
+            model_name='dutystatus',
+            name='daily_log',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='duty_statuses', to='eld.dailylog'),
+        ),
+    ]
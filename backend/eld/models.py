@@ -1,5 +1,7 @@
 from django.db import models
 
+from .timeline import decode_timeline, timeline_label_ids
+
 
 class Trip(models.Model):
     current_location = models.CharField(max_length=255)
@@ -23,15 +25,19 @@ class Trip(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='eld_trip_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Trip from {self.pickup_location} to {self.dropoff_location}"
 
 
 class DailyLog(models.Model):
+    # Indexed by eld_dailylog_trip_day_idx
     trip = models.ForeignKey(
-        Trip, related_name='daily_logs', on_delete=models.CASCADE)
+        Trip, related_name='daily_logs', on_delete=models.CASCADE, db_index=False)
     log_date = models.DateField()
     day_number = models.IntegerField(default=1)
 
@@ -50,14 +56,40 @@ class DailyLog(models.Model):
     total_off_duty_hours = models.DecimalField(
         max_digits=4, decimal_places=2, default=0)
 
+    # Packed duty statuses in compact storage mode (see timeline.py);
+    # null when the day's duty statuses are DutyStatus rows
+    timeline = models.BinaryField(null=True, blank=True, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['trip', 'day_number']
+        indexes = [
+            # A trip's days in order, for prefetches and the logs endpoint
+            models.Index(fields=['trip', 'day_number'], name='eld_dailylog_trip_day_idx'),
+            # CycleTracker.from_history reads a driver's last 8 days
+            models.Index(fields=['driver_name', 'log_date'], name='eld_dailylog_driver_date_idx'),
+        ]
 
     def __str__(self):
         return f"Log {self.day_number} - {self.log_date}"
 
+    def get_duty_statuses(self):
+        """The day's duty statuses, from rows or the packed timeline.
+
+        Call persistence.attach_timelines() on a list of logs first to load
+        their labels in one query.
+        """
+        if self.timeline is None:
+            return self.duty_statuses.all()
+        entries = getattr(self, '_timeline_entries', None)
+        if entries is None:
+            labels = dict(TimelineLabel.objects.filter(
+                pk__in=timeline_label_ids(self.timeline)).values_list('id', 'text'))
+            entries = self._timeline_entries = decode_timeline(
+                bytes(self.timeline), self.log_date, labels, daily_log=self)
+        return entries
+
 
 class DutyStatus(models.Model):
     STATUS_CHOICES = [
@@ -67,8 +99,9 @@ class DutyStatus(models.Model):
         ('on_duty', 'On Duty (Not Driving)'),
     ]
 
+    # Indexed by eld_dutystatus_log_start_idx
     daily_log = models.ForeignKey(
-        DailyLog, related_name='duty_statuses', on_delete=models.CASCADE)
+        DailyLog, related_name='duty_statuses', on_delete=models.CASCADE, db_index=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField()
@@ -83,8 +116,16 @@ class DutyStatus(models.Model):
 
     class Meta:
         ordering = ['start_time']
+        indexes = [
+            # A day's statuses in order, without a sort
+            models.Index(fields=['daily_log', 'start_time'], name='eld_dutystatus_log_start_idx'),
+        ]
 
-    def save(self, *args, **kwargs):
+    def compute_derived_fields(self):
+        """Fill duration and grid hours from start/end times.
+
+        Called by save() and by bulk inserts, which bypass save().
+        """
         # Calculate duration
         if self.start_time and self.end_time:
             duration = self.end_time - self.start_time
@@ -94,7 +135,62 @@ class DutyStatus(models.Model):
         self.grid_start_hour = self.start_time.hour
         self.grid_end_hour = self.end_time.hour
 
+    def save(self, *args, **kwargs):
+        self.compute_derived_fields()
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.status} at {self.location}"
+
+
+class TimelineLabel(models.Model):
+    """Interned location/description text referenced by compact timelines"""
+    text = models.TextField(unique=True)
+
+    def __str__(self):
+        return self.text
+
+
+class CalculationJob(models.Model):
+    """A queued /trips/calculate/ request, run by a jobs worker (see jobs.py)"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    FINISHED = (SUCCEEDED, FAILED)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    payload = models.JSONField()
+    options = models.JSONField(default=dict)  # geometry query parameters
+    idempotency_key = models.CharField(max_length=40, null=True, blank=True, unique=True)
+    fingerprint = models.CharField(max_length=40, blank=True)
+
+    trip = models.ForeignKey(
+        Trip, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    result = models.JSONField(null=True, blank=True)
+    status_code = models.IntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    attempts = models.IntegerField(default=0)
+    worker = models.CharField(max_length=255, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+        indexes = [
+            # Workers claim the oldest queued job
+            models.Index(fields=['status', 'created_at'], name='eld_job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status})"
@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class TripCursorPagination(CursorPagination):
+    """Keyset pagination in Trip.Meta ordering.
+
+    Each page is a range scan on the (created_at, id) index from the
+    cursor position, so deep pages cost the same as the first one and no
+    COUNT(*) is run.
+    """
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,137 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction
+
+from .models import Trip, DailyLog, DutyStatus, TimelineLabel
+from .serializers import storage_geometry
+from .timeline import (
+    compact_storage_enabled, decode_timeline, encode_timeline, label_texts, timeline_label_ids)
+
+
+def build_daily_log(trip: Trip, schedule: Dict) -> DailyLog:
+    """Build an unsaved DailyLog from a TripCalculator day schedule"""
+    return DailyLog(
+        trip=trip,
+        log_date=schedule['date'],
+        day_number=schedule['day_number'],
+        total_miles=int(schedule['estimated_distance']),
+        total_driving_hours=schedule['total_driving_hours'],
+        total_on_duty_hours=schedule['total_on_duty_hours'],
+        total_off_duty_hours=schedule['total_off_duty_hours'],
+        cycle_used=schedule['total_on_duty_hours']
+    )
+
+
+def build_duty_status(daily_log: DailyLog, activity: Dict) -> DutyStatus:
+    """Build an unsaved DutyStatus with its derived fields filled in"""
+    duty_status = DutyStatus(
+        daily_log=daily_log,
+        status=activity['status'],
+        start_time=datetime.fromisoformat(activity['start_time']),
+        end_time=datetime.fromisoformat(activity['end_time']),
+        location=activity['location'],
+        description=activity['description'],
+        duration_hours=activity['duration_hours']
+    )
+    duty_status.compute_derived_fields()
+    return duty_status
+
+
+def build_trip(data: Dict, route_data: Dict, daily_schedules: List[Dict]) -> Trip:
+    """Build an unsaved Trip from validated input and its calculated route"""
+    return Trip(
+        current_location=data['current_location'],
+        pickup_location=data['pickup_location'],
+        dropoff_location=data['dropoff_location'],
+        current_cycle_used=data['current_cycle_used'],
+        total_distance=route_data['distance'],
+        estimated_duration=route_data['duration'],
+        total_days=len(daily_schedules),
+        route_geometry=storage_geometry(route_data.get('geometry')),
+        route_summary=route_data.get('summary')
+    )
+
+
+# Keeps IN (...) lookups under every backend's bound-parameter limit
+LOOKUP_CHUNK_SIZE = 900
+
+
+def _label_lookup(field: str, values, *columns) -> Dict:
+    values = list(values)
+    found = {}
+    for i in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        found.update(TimelineLabel.objects.filter(
+            **{f'{field}__in': values[i:i + LOOKUP_CHUNK_SIZE]}).values_list(*columns))
+    return found
+
+
+def intern_labels(texts: Iterable[str]) -> Dict[str, int]:
+    """TimelineLabel ids for some texts, creating the missing labels"""
+    texts = set(texts)
+    ids = _label_lookup('text', texts, 'text', 'id')
+    missing = texts - ids.keys()
+    if missing:
+        # Another worker may insert the same label concurrently
+        TimelineLabel.objects.bulk_create(
+            [TimelineLabel(text=text) for text in missing], ignore_conflicts=True)
+        ids.update(_label_lookup('text', missing, 'text', 'id'))
+    return ids
+
+
+def attach_timelines(daily_logs: Iterable[DailyLog]):
+    """Decode the compact timelines of some logs with one label query, so
+    DailyLog.get_duty_statuses() does not query per log"""
+    compact = [log for log in daily_logs if log.timeline is not None]
+    if not compact:
+        return
+
+    blobs = [bytes(log.timeline) for log in compact]
+    ids = {label_id for blob in blobs for label_id in timeline_label_ids(blob)}
+    labels = _label_lookup('pk', ids, 'id', 'text')
+    for log, blob in zip(compact, blobs):
+        log._timeline_entries = decode_timeline(blob, log.log_date, labels, daily_log=log)
+
+
+def create_trips_with_logs(plans: List[Tuple[Dict, Dict, List[Dict]]]) -> List[Trip]:
+    """Persist many calculated trips in one transaction.
+
+    ``plans`` holds ``(data, route_data, daily_schedules)`` tuples. Trips,
+    daily logs and duty statuses are each written with bulk INSERTs, so the
+    query count does not grow with the number of trips or their length.
+    In compact storage mode duty statuses are packed into
+    DailyLog.timeline instead of being written as rows.
+    """
+    compact = compact_storage_enabled()
+    with transaction.atomic():
+        trips = Trip.objects.bulk_create(
+            [build_trip(*plan) for plan in plans])
+
+        daily_logs = []
+        activities = []
+        for trip, (_, _, daily_schedules) in zip(trips, plans):
+            for schedule in daily_schedules:
+                daily_logs.append(build_daily_log(trip, schedule))
+                activities.append(schedule['activities'])
+
+        if compact:
+            label_ids = intern_labels(
+                text for day_activities in activities for text in label_texts(day_activities))
+            for daily_log, day_activities in zip(daily_logs, activities):
+                daily_log.timeline = encode_timeline(
+                    day_activities, daily_log.log_date, label_ids)
+            DailyLog.objects.bulk_create(daily_logs)
+        else:
+            daily_logs = DailyLog.objects.bulk_create(daily_logs)
+            DutyStatus.objects.bulk_create([
+                build_duty_status(daily_log, activity)
+                for daily_log, day_activities in zip(daily_logs, activities)
+                for activity in day_activities
+            ])
+
+    return trips
+
+
+def create_trip_with_logs(data: Dict, route_data: Dict, daily_schedules: List[Dict]) -> Trip:
+    """Persist a calculated trip, its daily logs and duty statuses"""
+    return create_trips_with_logs([(data, route_data, daily_schedules)])[0]
@@ -0,0 +1,75 @@
+"""
+Long-lived process pools for CPU-bound request work.
+
+Large batches schedule their trips in worker processes. A pool created
+per request forks the multithreaded web worker once per CPU on every
+request, which can deadlock on a lock another thread held at fork time,
+and pays process start-up each time. Instead each web process keeps one
+lazily started pool per name. Its workers come from a forkserver (spawn
+where that is unavailable), so they never copy the web worker's threads,
+and set Django up once.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Sequence
+
+_pools: Dict[str, tuple] = {}  # name -> (pid, workers, executor)
+_lock = threading.Lock()
+
+
+def _start_method() -> str:
+    methods = multiprocessing.get_all_start_methods()
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+def _setup_django():
+    # Tasks reference functions in modules that import models
+    import django
+    django.setup()
+
+
+def get_process_pool(name: str, workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """This process's pool ``name`` of ``workers`` processes (None: one per
+    CPU), started on first use"""
+    pid = os.getpid()
+    with _lock:
+        entry = _pools.get(name)
+        if entry is not None and entry[0] == pid and entry[1] == workers:
+            return entry[2]
+        if entry is not None and entry[0] == pid:
+            # Resized by a settings change
+            entry[2].shutdown(wait=False)
+        # A pool inherited from a parent process (e.g. a preloading
+        # server) belongs to the parent and is left alone
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(_start_method()),
+            initializer=_setup_django,
+        )
+        _pools[name] = (pid, workers, pool)
+        return pool
+
+
+def discard_pool(name: str):
+    with _lock:
+        entry = _pools.pop(name, None)
+    if entry is not None and entry[0] == os.getpid():
+        entry[2].shutdown(wait=False, cancel_futures=True)
+
+
+def pool_map(name: str, workers: Optional[int], fn: Callable, *iterables: Sequence,
+             chunksize: int = 1) -> List:
+    """``list(pool.map(fn, *iterables))`` on the named pool.
+
+    A pool broken by a killed worker is replaced and the call retried
+    once, so one crash doesn't fail every later request; ``iterables``
+    must therefore be sequences, not iterators.
+    """
+    try:
+        return list(get_process_pool(name, workers).map(fn, *iterables, chunksize=chunksize))
+    except BrokenProcessPool:
+        discard_pool(name)
+        return list(get_process_pool(name, workers).map(fn, *iterables, chunksize=chunksize))
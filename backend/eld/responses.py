@@ -0,0 +1,112 @@
+"""
+Output path for the calculate and logs responses.
+
+Both payloads are built from schedules this service generated or from
+stored rows, so there is nothing to validate. Running them through
+TripCalculationResponseSerializer(data=...) validated and copied every
+field of every activity twice; these builders produce the same JSON with
+plain dicts. Activity lists are passed through untouched, as the
+serializer's ListField did.
+"""
+from typing import Dict, List
+
+from .models import DailyLog, Trip
+from .persistence import attach_timelines
+from .serializers import TripSummarySerializer, render_route_geometry
+
+
+def serialize_schedule(schedule: Dict) -> Dict:
+    """Same output as DailyScheduleSerializer"""
+    data = {
+        'day_number': int(schedule['day_number']),
+        'date': str(schedule['date']),
+        'total_driving_hours': float(schedule['total_driving_hours']),
+        'total_on_duty_hours': float(schedule['total_on_duty_hours']),
+        'total_off_duty_hours': float(schedule['total_off_duty_hours']),
+        'breaks_needed': int(schedule['breaks_needed']),
+        'estimated_distance': float(schedule['estimated_distance']),
+        'activities': schedule['activities'],
+        'hos_compliant': bool(schedule['hos_compliant']),
+    }
+    if 'is_restart_day' in schedule:
+        data['is_restart_day'] = bool(schedule['is_restart_day'])
+    return data
+
+
+def serialize_route(route_data: Dict, request=None) -> Dict:
+    """Same output as RouteResponseSerializer, with the geometry rendered
+    at the requested level of detail"""
+    return {
+        'distance': float(route_data['distance']),
+        'duration': float(route_data['duration']),
+        'fuel_stops': int(route_data['fuel_stops']),
+        'geometry': render_route_geometry(route_data.get('geometry'), request) or {},
+        'summary': dict(route_data['summary'] or {}),
+    }
+
+
+def calculation_response(trip: Trip, route_data: Dict, daily_schedules: List[Dict],
+                         hos_compliance_check: Dict, request=None) -> Dict:
+    """TripCalculationResponseSerializer-shaped payload for a trip"""
+    return {
+        'trip': TripSummarySerializer(trip, context={'request': request}).data,
+        'route': serialize_route(route_data, request),
+        'daily_schedules': [serialize_schedule(schedule) for schedule in daily_schedules],
+        'total_days': len(daily_schedules),
+        'hos_compliance_check': dict(hos_compliance_check),
+    }
+
+
+def daily_log_schedule(log: DailyLog) -> Dict:
+    """Schedule dict for a stored DailyLog and its duty statuses"""
+    return {
+        'day_number': log.day_number,
+        'date': str(log.log_date),
+        'total_driving_hours': float(log.total_driving_hours),
+        'total_on_duty_hours': float(log.total_on_duty_hours),
+        'total_off_duty_hours': float(log.total_off_duty_hours),
+        'breaks_needed': 0,  # logs do not store this
+        'estimated_distance': float(log.total_miles),
+        'activities': [
+            {
+                'start_time': ds.start_time.isoformat(),
+                'end_time': ds.end_time.isoformat(),
+                'status': ds.status,
+                'location': ds.location,
+                'description': ds.description,
+                'duration_hours': float(ds.duration_hours),
+            }
+            for ds in log.get_duty_statuses()
+        ],
+        'hos_compliant': True,
+        'is_restart_day': False,
+    }
+
+
+def logs_response(trip: Trip, request=None) -> Dict:
+    """Calculate-shaped payload rebuilt from a stored trip.
+
+    Expects ``daily_logs__duty_statuses`` to be prefetched.
+    """
+    daily_logs = trip.daily_logs.all()
+    attach_timelines(daily_logs)
+    daily_schedules = [daily_log_schedule(log) for log in daily_logs]
+
+    route_data = {
+        'distance': trip.total_distance,
+        'duration': trip.estimated_duration,
+        'fuel_stops': 0,
+        'geometry': trip.route_geometry,
+        'summary': trip.route_summary,
+    }
+
+    on_duty_hours = float(sum(log.total_on_duty_hours for log in daily_logs))
+    hos_compliance_check = {
+        'is_compliant': True,
+        'total_days': len(daily_schedules),
+        'total_driving_hours': float(sum(log.total_driving_hours for log in daily_logs)),
+        'total_on_duty_hours': on_duty_hours,
+        'cycle_used_end': float(trip.current_cycle_used) + on_duty_hours,
+    }
+
+    return calculation_response(trip, route_data, daily_schedules, hos_compliance_check, request)
@@ -0,0 +1,338 @@
+"""
+Offline road-graph routing.
+
+Graphs are built from an OpenStreetMap XML extract with
+``python manage.py build_road_graph`` and stored as CSR (compressed sparse
+row) arrays in one file. The file is memory-mapped when loaded, so opening
+a graph is cheap and its pages are shared by every worker on the host.
+
+File layout (native little-endian, each section padded to 8 bytes):
+
+    header      magic b'ELDGRAPH', version u32, node_count u32,
+                edge_count u32, cell_count u32, max_speed f32 (m/s)
+    lon, lat    i32[node_count]        degrees * 1e7
+    offsets     u32[node_count + 1]    CSR row pointers into the edge arrays
+    targets     u32[edge_count]
+    lengths     f32[edge_count]        meters
+    times       f32[edge_count]        seconds
+    cells       i64[cell_count]        sorted grid cell keys
+    cell_start  u32[cell_count + 1]    first node of each cell
+
+Nodes are numbered in grid-cell order, so the nodes of a cell are a
+contiguous range and nearest-node lookups only scan nearby cells.
+"""
+import bz2
+import gzip
+import heapq
+import math
+import mmap
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+MAGIC = b'ELDGRAPH'
+VERSION = 1
+HEADER = struct.Struct('<8sIIIIf')
+COORD_SCALE = 1e7
+CELL_SIZE = 0.05       # degrees, roughly 5 km
+CELL_COLUMNS = 10000   # > 360 / CELL_SIZE
+MAX_SNAP_RINGS = 40    # give up snapping beyond ~2 degrees
+EARTH_RADIUS_M = 6371000
+
+# Default speeds in km/h for drivable OSM highway types
+HIGHWAY_SPEEDS = {
+    'motorway': 105, 'motorway_link': 60,
+    'trunk': 90, 'trunk_link': 55,
+    'primary': 80, 'primary_link': 50,
+    'secondary': 70, 'secondary_link': 45,
+    'tertiary': 60, 'tertiary_link': 40,
+    'unclassified': 50, 'residential': 40,
+    'living_street': 10, 'service': 20,
+}
+
+
+class RoadGraphError(Exception):
+    pass
+
+
+def cell_key(lon: float, lat: float) -> int:
+    row = int(math.floor((lat + 90) / CELL_SIZE))
+    col = int(math.floor((lon + 180) / CELL_SIZE))
+    return row * CELL_COLUMNS + col
+
+
+def haversine_m(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1_rad) * math.cos(lat2_rad) *
+         math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def _ring_offsets(ring: int):
+    """(row, col) offsets of the cells on the perimeter of a square ring"""
+    if ring == 0:
+        yield 0, 0
+        return
+    for d in range(-ring, ring + 1):
+        yield -ring, d
+        yield ring, d
+    for d in range(-ring + 1, ring):
+        yield d, -ring
+        yield d, ring
+
+
+def _padding(size: int) -> int:
+    return -size % 8
+
+
+class RoadGraph:
+    """Read-only road graph backed by a memory-mapped CSR file"""
+
+    def __init__(self, path: str):
+        if sys.byteorder != 'little':
+            raise RoadGraphError('Road graphs require a little-endian host')
+
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, nodes, edges, cells, max_speed = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise RoadGraphError(f'{self.path} is not a version {VERSION} road graph')
+
+        self.node_count = nodes
+        self.edge_count = edges
+        self.max_speed = max_speed
+
+        buffer = memoryview(self._mmap)
+        position = HEADER.size + _padding(HEADER.size)
+
+        def section(fmt: str, count: int) -> memoryview:
+            nonlocal position
+            size = struct.calcsize(fmt) * count
+            view = buffer[position:position + size].cast(fmt)
+            position += size + _padding(size)
+            return view
+
+        self.lon = section('i', nodes)
+        self.lat = section('i', nodes)
+        self.offsets = section('I', nodes + 1)
+        self.targets = section('I', edges)
+        self.lengths = section('f', edges)
+        self.times = section('f', edges)
+        self.cells = section('q', cells)
+        self.cell_start = section('I', cells + 1)
+
+    def coordinates(self, node: int) -> Tuple[float, float]:
+        return self.lon[node] / COORD_SCALE, self.lat[node] / COORD_SCALE
+
+    def _cell_nodes(self, key: int) -> range:
+        index = bisect_left(self.cells, key)
+        if index == len(self.cells) or self.cells[index] != key:
+            return range(0)
+        return range(self.cell_start[index], self.cell_start[index + 1])
+
+    def nearest_node(self, lon: float, lat: float) -> Optional[int]:
+        """Snap a coordinate to the closest graph node"""
+        center = cell_key(lon, lat)
+        best, best_distance = None, math.inf
+        found_at = None
+
+        for ring in range(MAX_SNAP_RINGS + 1):
+            for d_row, d_col in _ring_offsets(ring):
+                for node in self._cell_nodes(center + d_row * CELL_COLUMNS + d_col):
+                    distance = haversine_m(lon, lat, *self.coordinates(node))
+                    if distance < best_distance:
+                        best, best_distance = node, distance
+
+            # A closer node can still sit one ring further out
+            if best is not None:
+                if found_at is None:
+                    found_at = ring
+                elif ring > found_at:
+                    break
+
+        return best
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[List[int], float, float]]:
+        """A* search on travel time.
+
+        Returns ``(nodes, length_m, time_s)`` or None if unreachable.
+        """
+        target_lon, target_lat = self.coordinates(target)
+        max_speed = self.max_speed or 1
+
+        def heuristic(node):
+            return haversine_m(*self.coordinates(node), target_lon, target_lat) / max_speed
+
+        best = {source: 0.0}
+        previous = {}
+        heap = [(heuristic(source), 0.0, source)]
+
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                break
+            if cost > best[node]:
+                continue
+            for edge in range(self.offsets[node], self.offsets[node + 1]):
+                neighbor = self.targets[edge]
+                new_cost = cost + self.times[edge]
+                if new_cost < best.get(neighbor, math.inf):
+                    best[neighbor] = new_cost
+                    previous[neighbor] = (node, edge)
+                    heapq.heappush(heap, (new_cost + heuristic(neighbor), new_cost, neighbor))
+        else:
+            return None
+
+        nodes = [target]
+        length = 0.0
+        while nodes[-1] != source:
+            node, edge = previous[nodes[-1]]
+            length += self.lengths[edge]
+            nodes.append(node)
+        nodes.reverse()
+        return nodes, length, best[target]
+
+    def route(self, coordinates: List[List[float]]) -> Optional[Dict]:
+        """Route through ``[lon, lat]`` waypoints.
+
+        Returns an OpenRouteService-shaped response that
+        RouteCalculator.parse_route_data understands, or None.
+        """
+        snapped = [self.nearest_node(lon, lat) for lon, lat in coordinates]
+        if len(snapped) < 2 or None in snapped:
+            return None
+
+        path = [snapped[0]]
+        distance = duration = 0.0
+        for source, target in zip(snapped, snapped[1:]):
+            leg = self.shortest_path(source, target)
+            if leg is None:
+                return None
+            nodes, length, time = leg
+            path.extend(nodes[1:])
+            distance += length
+            duration += time
+
+        return {
+            'features': [{
+                'properties': {
+                    'summary': {'distance': distance, 'duration': duration},
+                },
+                'geometry': {
+                    'type': 'LineString',
+                    'coordinates': [list(self.coordinates(node)) for node in path],
+                },
+            }]
+        }
+
+    def close(self):
+        for name in ('lon', 'lat', 'offsets', 'targets', 'lengths', 'times',
+                     'cells', 'cell_start'):
+            getattr(self, name).release()
+        self._mmap.close()
+
+
+def _open_extract(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def parse_speed(way_tags: Dict[str, str]) -> Optional[float]:
+    """Speed in km/h from a way's maxspeed tag, or the highway default"""
+    maxspeed = way_tags.get('maxspeed', '')
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', maxspeed)
+    if match and float(match.group(1)) > 0:
+        speed = float(match.group(1))
+        return speed * 1.609344 if match.group(2) else speed
+    return HIGHWAY_SPEEDS.get(way_tags.get('highway'))
+
+
+def _read_ways(path: str):
+    ways = []
+    with _open_extract(path) as f:
+        for _, element in iterparse(f, events=('end',)):
+            if element.tag == 'way':
+                tags = {t.get('k'): t.get('v') for t in element.iterfind('tag')}
+                if tags.get('highway') in HIGHWAY_SPEEDS:
+                    refs = [int(nd.get('ref')) for nd in element.iterfind('nd')]
+                    oneway = tags.get('oneway', 'yes' if tags['highway'] == 'motorway' else 'no')
+                    if oneway == '-1':
+                        refs.reverse()
+                    ways.append((refs, parse_speed(tags), oneway in ('yes', 'true', '1', '-1')))
+                element.clear()
+            elif element.tag in ('node', 'relation'):
+                element.clear()
+    return ways
+
+
+def _read_nodes(path: str, wanted: set) -> Dict[int, Tuple[float, float]]:
+    nodes = {}
+    with _open_extract(path) as f:
+        for _, element in iterparse(f, events=('end',)):
+            if element.tag == 'node':
+                node_id = int(element.get('id'))
+                if node_id in wanted:
+                    nodes[node_id] = (float(element.get('lon')), float(element.get('lat')))
+            element.clear()
+    return nodes
+
+
+def build_road_graph(extract_path: str, output_path: str) -> Dict[str, int]:
+    """Build a road graph file from an OSM XML extract (.osm, .gz, .bz2)"""
+    ways = _read_ways(extract_path)
+    osm_nodes = _read_nodes(extract_path, {ref for refs, _, _ in ways for ref in refs})
+
+    # Number nodes in grid-cell order so each cell is a contiguous range
+    order = sorted(osm_nodes, key=lambda node_id: cell_key(*osm_nodes[node_id]))
+    index = {node_id: i for i, node_id in enumerate(order)}
+
+    adjacency = [[] for _ in order]
+    max_speed = 0.0
+    for refs, speed_kph, oneway in ways:
+        speed = speed_kph / 3.6
+        max_speed = max(max_speed, speed)
+        for a, b in zip(refs, refs[1:]):
+            if a not in index or b not in index:
+                continue
+            length = haversine_m(*osm_nodes[a], *osm_nodes[b])
+            adjacency[index[a]].append((index[b], length, length / speed))
+            if not oneway:
+                adjacency[index[b]].append((index[a], length, length / speed))
+
+    lon = array('i', (round(osm_nodes[n][0] * COORD_SCALE) for n in order))
+    lat = array('i', (round(osm_nodes[n][1] * COORD_SCALE) for n in order))
+    offsets, targets, lengths, times = array('I', [0]), array('I'), array('f'), array('f')
+    for edges in adjacency:
+        for target, length, time in edges:
+            targets.append(target)
+            lengths.append(length)
+            times.append(time)
+        offsets.append(len(targets))
+
+    cells, cell_start = array('q'), array('I')
+    for i, node_id in enumerate(order):
+        key = cell_key(*osm_nodes[node_id])
+        if not cells or cells[-1] != key:
+            cells.append(key)
+            cell_start.append(i)
+    cell_start.append(len(order))
+
+    with open(output_path, 'wb') as f:
+        header = HEADER.pack(MAGIC, VERSION, len(order), len(targets), len(cells), max_speed)
+        f.write(header + b'\0' * _padding(len(header)))
+        for section in (lon, lat, offsets, targets, lengths, times, cells, cell_start):
+            data = section.tobytes()
+            f.write(data + b'\0' * _padding(len(data)))
+
+    return {'nodes': len(order), 'edges': len(targets), 'ways': len(ways)}
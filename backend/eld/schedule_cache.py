@@ -0,0 +1,81 @@
+"""
+Memoized trip plans.
+
+An event-engine schedule depends only on the driving hours, distance,
+current_cycle_used and the start time. The start date only shifts every
+timestamp by whole days, so plans are cached as date-independent day
+templates (DutyTimeline.day_template: times as a day offset and a
+formatted clock time) keyed on the start's time of day, and rebased onto
+the requested date with render_days(), which only prefixes the dates.
+Dispatch what-if tools that re-plan the same trip for other days or
+drivers skip the simulation and the split at midnight.
+
+The cache is a per-process LRU bounded by ELD_SCHEDULE_CACHE['MAX_SIZE'];
+a MAX_SIZE of 0 turns memoization off.
+"""
+import threading
+from typing import Callable, Dict, Hashable, Optional
+
+from django.conf import settings
+
+from .cache import MISSING, LRUCache
+from .metrics import count
+
+SCHEDULE_CACHE_DEFAULTS = {
+    'MAX_SIZE': 256,
+}
+
+
+def get_schedule_cache_config() -> Dict:
+    return {**SCHEDULE_CACHE_DEFAULTS, **getattr(settings, 'ELD_SCHEDULE_CACHE', {})}
+
+
+class ScheduleCache:
+    """LRU of cached plans with hit/miss counters"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.plans = LRUCache(max_size=max_size)
+        self.stats = {'hits': 0, 'misses': 0}
+        self._stats_lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable):
+        plan = self.plans.get(key)
+        with self._stats_lock:
+            self.stats['hits' if plan is not MISSING else 'misses'] += 1
+        count('schedule_cache.hit' if plan is not MISSING else 'schedule_cache.miss')
+        if plan is MISSING:
+            plan = build()
+            self.plans.set(key, plan)
+        return plan
+
+    def clear(self):
+        """Drop every plan and reset counters"""
+        self.plans.clear()
+        with self._stats_lock:
+            for counter in self.stats:
+                self.stats[counter] = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['size'] = len(self.plans)
+        stats['max_size'] = self.max_size
+        return stats
+
+
+_schedule_cache = {}
+_schedule_cache_lock = threading.Lock()
+
+
+def get_schedule_cache() -> Optional[ScheduleCache]:
+    """The process-wide plan cache, or None when memoization is off"""
+    max_size = get_schedule_cache_config()['MAX_SIZE']
+    if not max_size:
+        return None
+    with _schedule_cache_lock:
+        cache = _schedule_cache.get(max_size)
+        if cache is None:
+            _schedule_cache.clear()
+            cache = _schedule_cache[max_size] = ScheduleCache(max_size)
+        return cache
@@ -1,6 +1,76 @@
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
 from rest_framework import serializers
+
+from .geometry import encoded_geometry, geometry_coordinates, render_geometry, simplify
 from .models import Trip, DailyLog, DutyStatus
 
+GEOMETRY_DEFAULTS = {
+    'STORAGE_TOLERANCE': 0.00001,
+    'DETAIL_TOLERANCES': {'full': 0, 'high': 0.0001, 'medium': 0.001, 'low': 0.01},
+    'DEFAULT_DETAIL': 'high',
+}
+GEOMETRY_FORMATS = ('geojson', 'polyline')
+RENDERED_GEOMETRY_TYPES = ('LineString', 'EncodedPolyline')
+
+
+def get_geometry_config() -> Dict:
+    return {**GEOMETRY_DEFAULTS, **getattr(settings, 'ELD_GEOMETRY', {})}
+
+
+def geometry_options(request=None) -> Tuple[Optional[float], str]:
+    """``(tolerance, format)`` from ?geometry_detail= and ?geometry_format=
+
+    A tolerance of None means the geometry is left out of the response.
+    """
+    config = get_geometry_config()
+    params = getattr(request, 'GET', {})
+    detail = params.get('geometry_detail', config['DEFAULT_DETAIL'])
+    fmt = params.get('geometry_format', GEOMETRY_FORMATS[0])
+
+    if detail != 'none' and detail not in config['DETAIL_TOLERANCES']:
+        choices = ', '.join([*config['DETAIL_TOLERANCES'], 'none'])
+        raise serializers.ValidationError(
+            {'geometry_detail': f'Must be one of: {choices}'})
+    if fmt not in GEOMETRY_FORMATS:
+        raise serializers.ValidationError(
+            {'geometry_format': f'Must be one of: {", ".join(GEOMETRY_FORMATS)}'})
+
+    return (None if detail == 'none' else config['DETAIL_TOLERANCES'][detail]), fmt
+
+
+def storage_geometry(geometry: Optional[Dict]) -> Optional[Dict]:
+    """Simplify and encode a route geometry for Trip.route_geometry"""
+    if not geometry or geometry.get('type') not in RENDERED_GEOMETRY_TYPES:
+        return geometry
+    tolerance = get_geometry_config()['STORAGE_TOLERANCE']
+    return encoded_geometry(simplify(geometry_coordinates(geometry), tolerance))
+
+
+def render_route_geometry(geometry: Optional[Dict], request=None) -> Optional[Dict]:
+    """Render a stored or upstream route geometry for a response"""
+    tolerance, fmt = geometry_options(request)
+    if tolerance is None:
+        return None
+    if not geometry or geometry.get('type') not in RENDERED_GEOMETRY_TYPES:
+        return geometry
+    return render_geometry(geometry, tolerance, fmt)
+
+
+class RouteGeometryField(serializers.JSONField):
+    """Trip route geometry at the level of detail the request asks for.
+
+    Stored values are encoded polylines; incoming GeoJSON is simplified
+    and encoded the same way before it is saved.
+    """
+
+    def to_internal_value(self, data):
+        return storage_geometry(super().to_internal_value(data))
+
+    def to_representation(self, value):
+        return render_route_geometry(value, self.context.get('request'))
+
 
 class DutyStatusSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,15 +79,17 @@ class DutyStatusSerializer(serializers.ModelSerializer):
 
 
 class DailyLogSerializer(serializers.ModelSerializer):
-    duty_statuses = DutyStatusSerializer(many=True, read_only=True)
+    # Rows or, in compact storage mode, the decoded timeline
+    duty_statuses = DutyStatusSerializer(many=True, read_only=True, source='get_duty_statuses')
 
     class Meta:
         model = DailyLog
-        fields = '__all__'
+        exclude = ['timeline']
 
 
 class TripSerializer(serializers.ModelSerializer):
     daily_logs = DailyLogSerializer(many=True, read_only=True)
+    route_geometry = RouteGeometryField(required=False, allow_null=True)
 
     class Meta:
         model = Trip
@@ -25,10 +97,28 @@ class TripSerializer(serializers.ModelSerializer):
 
 
 class TripListSerializer(serializers.ModelSerializer):
+    """Trip list rows, without the route JSON columns"""
 
     class Meta:
         model = Trip
-        fields = '__all__'
+        fields = [
+            'id', 'current_location', 'pickup_location', 'dropoff_location',
+            'current_cycle_used', 'total_distance', 'estimated_duration',
+            'total_days', 'created_at', 'updated_at',
+        ]
+
+
+class TripSummarySerializer(serializers.ModelSerializer):
+    """Trip inputs and route, without the nested daily logs"""
+    route_geometry = RouteGeometryField(required=False, allow_null=True)
+
+    class Meta:
+        model = Trip
+        fields = [
+            'current_location', 'pickup_location', 'dropoff_location',
+            'current_cycle_used', 'total_distance', 'estimated_duration',
+            'total_days', 'route_geometry', 'route_summary',
+        ]
 
 
 class TripCalculationSerializer(serializers.Serializer):
@@ -45,6 +135,24 @@ class TripCalculationSerializer(serializers.Serializer):
         return value
 
 
+class BulkTripSerializer(TripCalculationSerializer):
+    """One row of a generate_logs input file"""
+    start_time = serializers.DateTimeField(required=False)
+
+
+class WhatIfSerializer(serializers.Serializer):
+    """One route planned over a grid of start times and cycle values"""
+    current_location = serializers.CharField(max_length=255)
+    pickup_location = serializers.CharField(max_length=255)
+    dropoff_location = serializers.CharField(max_length=255)
+    start_times = serializers.ListField(
+        child=serializers.DateTimeField(), min_length=1)
+    cycle_values = serializers.ListField(
+        child=serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=70),
+        min_length=1)
+    top = serializers.IntegerField(min_value=1, required=False)
+
+
 class RouteResponseSerializer(serializers.Serializer):
     distance = serializers.FloatField()
     duration = serializers.FloatField()
@@ -67,7 +175,7 @@ class DailyScheduleSerializer(serializers.Serializer):
 
 
 class TripCalculationResponseSerializer(serializers.Serializer):
-    trip = TripSerializer()
+    trip = TripSummarySerializer()
     route = RouteResponseSerializer()
     daily_schedules = DailyScheduleSerializer(many=True)
     total_days = serializers.IntegerField()
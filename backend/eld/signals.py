@@ -0,0 +1,46 @@
+"""
+Invalidate cached logs payloads when a trip's rows change.
+
+QuerySet.update() and bulk_create() do not send these signals; code that
+rewrites existing rows in bulk must call logs_cache.invalidate_logs().
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .logs_cache import invalidate_logs
+from .models import DailyLog, DutyStatus, Trip
+
+
+def _cascaded(sender, origin) -> bool:
+    """True for deletes cascading from a parent, whose signal covers the trip"""
+    return origin is not None and getattr(origin, 'model', type(origin)) is not sender
+
+
+def _invalidate(trip_id):
+    if trip_id is None:
+        return
+    invalidate_logs(trip_id)
+    # A concurrent request can re-cache the old rows before this
+    # transaction commits, so drop the entries again once it has
+    transaction.on_commit(lambda: invalidate_logs(trip_id), robust=True)
+
+
+@receiver([post_save, post_delete], sender=Trip)
+def trip_changed(sender, instance, **kwargs):
+    _invalidate(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=DailyLog)
+def daily_log_changed(sender, instance, origin=None, **kwargs):
+    if not _cascaded(sender, origin):
+        _invalidate(instance.trip_id)
+
+
+@receiver([post_save, post_delete], sender=DutyStatus)
+def duty_status_changed(sender, instance, origin=None, **kwargs):
+    if _cascaded(sender, origin):
+        return
+    trip_id = (DailyLog.objects.filter(pk=instance.daily_log_id)
+               .values_list('trip_id', flat=True).first())
+    _invalidate(trip_id)
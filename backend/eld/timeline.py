@@ -0,0 +1,188 @@
+"""
+Compact duty-status timelines.
+
+In compact storage mode (ELD_STORAGE['DUTY_STATUS_MODE'] = 'compact') a
+day's duty statuses are not written as DutyStatus rows but packed into
+DailyLog.timeline, one column after another:
+
+    header       version u8, count u16
+    status       u8[count]     index into DutyStatus.STATUS_CHOICES
+    start, end   u16[count]    minutes since midnight of the log date
+    location     u32[count]    TimelineLabel ids
+    description  u32[count]    TimelineLabel ids
+
+That is 13 bytes per interval instead of a ~150 byte row plus its index
+entries. Times are kept to the minute, the resolution ELD grids use;
+duration and grid hours are derived on read, as DutyStatus.save() does.
+Decoded intervals are TimelineEntry objects, which have the DutyStatus
+attributes the serializers read, so the API shape does not change.
+"""
+import struct
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+VERSION = 1
+HEADER = struct.Struct('<BH')
+
+STORAGE_DEFAULTS = {
+    'DUTY_STATUS_MODE': 'rows',
+}
+STORAGE_MODES = ('rows', 'compact')
+
+# Same order as DutyStatus.STATUS_CHOICES; codes are stored, so only append
+STATUSES = ('off_duty', 'sleeper_berth', 'driving', 'on_duty')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+
+class TimelineError(ValueError):
+    pass
+
+
+def get_storage_config() -> Dict:
+    config = {**STORAGE_DEFAULTS, **getattr(settings, 'ELD_STORAGE', {})}
+    if config['DUTY_STATUS_MODE'] not in STORAGE_MODES:
+        raise TimelineError(f"Unknown DUTY_STATUS_MODE {config['DUTY_STATUS_MODE']!r}")
+    return config
+
+
+def compact_storage_enabled() -> bool:
+    return get_storage_config()['DUTY_STATUS_MODE'] == 'compact'
+
+
+def _as_date(log_date) -> date:
+    return log_date if isinstance(log_date, date) else date.fromisoformat(str(log_date))
+
+
+def _naive_utc(timestamp: str) -> datetime:
+    """An ISO 8601 timestamp as a naive UTC datetime; one without an offset
+    is taken to be UTC already"""
+    value = datetime.fromisoformat(timestamp)
+    if timezone.is_aware(value):
+        value = timezone.make_naive(value, dt_timezone.utc)
+    return value
+
+
+def _column_format(count: int) -> str:
+    return f'<{count}B{count}H{count}H{count}I{count}I'
+
+
+def encode_timeline(activities: Sequence[Dict], log_date, label_ids: Dict[str, int]) -> bytes:
+    """Pack a day's TripCalculator activities.
+
+    ``label_ids`` maps every location and description to its
+    TimelineLabel id (see persistence.intern_labels).
+    """
+    midnight = datetime.combine(_as_date(log_date), time())
+    statuses, starts, ends, locations, descriptions = [], [], [], [], []
+
+    for activity in activities:
+        start = _naive_utc(activity['start_time'])
+        end = _naive_utc(activity['end_time'])
+        statuses.append(STATUS_CODES[activity['status']])
+        starts.append(round((start - midnight).total_seconds() / 60))
+        ends.append(round((end - midnight).total_seconds() / 60))
+        locations.append(label_ids[activity['location']])
+        descriptions.append(label_ids[activity.get('description', '')])
+
+    count = len(statuses)
+    try:
+        return HEADER.pack(VERSION, count) + struct.pack(
+            _column_format(count), *statuses, *starts, *ends, *locations, *descriptions)
+    except struct.error as e:
+        raise TimelineError(f'Cannot pack timeline for {log_date}: {e}') from e
+
+
+def timeline_label_ids(blob: bytes) -> List[int]:
+    """Every TimelineLabel id referenced by a packed timeline"""
+    version, count = HEADER.unpack_from(blob)
+    offset = HEADER.size + count * 5
+    return list(struct.unpack_from(f'<{count * 2}I', blob, offset))
+
+
+class TimelineEntry:
+    """Read-only stand-in for a DutyStatus decoded from a timeline"""
+
+    __slots__ = ('daily_log', 'status', 'start_time', 'end_time', 'duration_hours',
+                 'location', 'description', 'grid_start_hour', 'grid_end_hour')
+
+    id = pk = None
+
+    def __init__(self, daily_log, status, start_time, end_time, duration_hours,
+                 location, description):
+        self.daily_log = daily_log
+        self.status = status
+        self.start_time = start_time
+        self.end_time = end_time
+        self.duration_hours = duration_hours
+        self.location = location
+        self.description = description
+        self.grid_start_hour = start_time.hour
+        self.grid_end_hour = end_time.hour
+
+    @property
+    def daily_log_id(self):
+        return self.daily_log.pk
+
+    def __repr__(self):
+        return f'<TimelineEntry {self.status} {self.start_time.isoformat()}>'
+
+
+def decode_timeline(blob: bytes, log_date, labels: Dict[int, str],
+                    daily_log=None) -> List[TimelineEntry]:
+    """Unpack a timeline into TimelineEntry objects ordered by start time.
+
+    Times are aware UTC datetimes, as DutyStatus rows read back from the
+    database are when USE_TZ is on.
+    """
+    version, count = HEADER.unpack_from(blob)
+    if version != VERSION:
+        raise TimelineError(f'Unsupported timeline version {version}')
+
+    columns = struct.unpack_from(_column_format(count), blob, HEADER.size)
+    statuses = columns[:count]
+    starts = columns[count:2 * count]
+    ends = columns[2 * count:3 * count]
+    locations = columns[3 * count:4 * count]
+    descriptions = columns[4 * count:]
+
+    midnight = datetime.combine(_as_date(log_date), time())
+    if settings.USE_TZ:
+        midnight = timezone.make_aware(midnight).astimezone(dt_timezone.utc)
+
+    # Consecutive intervals share boundaries
+    stamps = {minutes: midnight + timedelta(minutes=minutes) for minutes in {*starts, *ends}}
+
+    return [
+        TimelineEntry(daily_log, STATUSES[status], stamps[start], stamps[end],
+                      round((end - start) / 60, 2), labels[location], labels[description])
+        for status, start, end, location, description
+        in zip(statuses, starts, ends, locations, descriptions)
+    ]
+
+
+def timeline_intervals(blob: bytes, log_date) -> Iterator[Tuple[str, datetime, datetime]]:
+    """``(status, start, end)`` of each packed interval, without labels.
+
+    Times are naive, in the log date's own day.
+    """
+    version, count = HEADER.unpack_from(blob)
+    if version != VERSION:
+        raise TimelineError(f'Unsupported timeline version {version}')
+
+    columns = struct.unpack_from(f'<{count}B{count}H{count}H', blob, HEADER.size)
+    midnight = datetime.combine(_as_date(log_date), time())
+    for status, start, end in zip(columns[:count], columns[count:2 * count], columns[2 * count:]):
+        yield (STATUSES[status], midnight + timedelta(minutes=start),
+               midnight + timedelta(minutes=end))
+
+
+def label_texts(activities: Iterable[Dict]) -> set:
+    """Location and description texts to intern for some activities"""
+    texts = set()
+    for activity in activities:
+        texts.add(activity['location'])
+        texts.add(activity.get('description', ''))
+    return texts
@@ -0,0 +1,112 @@
+"""
+HTTP plumbing for upstream routing services.
+
+A shared pooled session keeps connections alive between requests; a
+RetryBudget retries transient failures with backoff inside one deadline,
+and a circuit breaker stops calling an upstream that keeps failing so
+callers can fall back immediately.
+"""
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def build_session(pool_size: int = 10) -> requests.Session:
+    """Build a keep-alive session; retries are the caller's (RetryBudget)"""
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class RetryBudget:
+    """Attempts and backoff for one upstream call, within a deadline.
+
+    Every attempt's timeouts are cut to the time left, and a retry is only
+    made if its backoff still leaves ``min_attempt`` seconds to run it, so
+    the call as a whole never outlasts ``deadline``. Retry-After headers
+    are ignored: an upstream asking for minutes is better served by the
+    fallback route.
+    """
+
+    def __init__(self, max_retries: int, backoff_factor: float, deadline: float,
+                 min_attempt: float = 1.0):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.expires = time.monotonic() + deadline
+        self.min_attempt = min_attempt
+        self.attempt = 0
+
+    def remaining(self) -> float:
+        return max(self.expires - time.monotonic(), 0.0)
+
+    def timeout(self, connect: float, read: float) -> Tuple[float, float]:
+        """``(connect, read)`` timeouts for the next attempt"""
+        remaining = self.remaining()
+        return min(connect, remaining), min(read, remaining)
+
+    def next_delay(self) -> Optional[float]:
+        """Backoff before the next attempt, or None to stop retrying"""
+        if self.attempt >= self.max_retries:
+            return None
+        delay = self.backoff_factor * (2 ** self.attempt)
+        if delay + self.min_attempt > self.remaining():
+            return None
+        self.attempt += 1
+        return delay
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Closed: requests flow and failures are counted. After
+    ``failure_threshold`` consecutive failures the breaker opens and
+    rejects requests for ``reset_timeout`` seconds, then lets a single
+    trial request through (half-open). Its outcome closes or re-opens it.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if (self.state == self.OPEN and
+                    time.monotonic() - self.opened_at >= self.reset_timeout):
+                self.state = self.HALF_OPEN
+                return True
+            # Open, or half-open with a trial request already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALF_OPEN or
+                    self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def reset(self):
+        self.record_success()
@@ -1,11 +1,17 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'trips', views.TripViewSet)
 router.register(r'hos-rules', views.HOSRulesViewSet, basename='hos-rules')
 
 urlpatterns = [
+    # Plain async Django views, for ASGI deployments (config/asgi.py)
+    path('trips/calculate-async/', views.calculate_trip_async,
+         name='trip-calculate-async'),
+    path('jobs/<int:pk>/', views.job_status, name='job-detail'),
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
 ]
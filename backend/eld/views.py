@@ -1,27 +1,130 @@
+import asyncio
+import json
+import math
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from django.db import transaction
-from datetime import datetime
 
-from .models import Trip, DailyLog, DutyStatus
+from .models import CalculationJob, Trip
 from .serializers import (
     TripSerializer,
     TripListSerializer,
     TripCalculationSerializer,
-    TripCalculationResponseSerializer
+    WhatIfSerializer,
+    geometry_options
 )
-from .routing import RouteCalculator
-from .calculations import TripCalculator
+from .routing import RouteCalculator, async_client_scope
+from .calculations import TripCalculator, summarize_hos_compliance
 from .hos_rules import HOSRules
+from .persistence import attach_timelines, create_trip_with_logs
+from .responses import calculation_response
+from .logs_cache import cache_logs, get_cached_logs, get_logs_cache_config, warm_logs
+from .batch import get_batch_config, plan_trip_batch
+from .pagination import TripCursorPagination
+from .whatif import get_what_if_config, plan_what_if
+from .metrics import count, stage
+from .idempotency import (
+    IdempotencyError, idempotent_response, request_identity, run_once, run_once_async)
+from .jobs import enqueue, get_jobs_config, job_data, prefers_async
+
+
+def plan_trip(data, route_data, request=None):
+    """Schedule a routed trip, persist it and build the calculate response.
+
+    Returns ``(response_data, status_code)``. Shared by the sync and async
+    calculate endpoints; ``request`` selects the geometry level of detail.
+    """
+    # Calculate trip schedule
+    with stage('schedule'):
+        trip_calculator = TripCalculator(
+            current_cycle_used=float(data['current_cycle_used']))
+        daily_schedules = trip_calculator.calculate_trip_schedule(
+            total_duration_hours=route_data['duration'],
+            total_distance_miles=route_data['distance'],
+            route_geometry=route_data.get('geometry')
+        )
+
+    # Create trip and logs in database
+    with stage('persist'):
+        trip = create_trip_with_logs(data, route_data, daily_schedules)
+    if get_logs_cache_config()['WARM_ON_CALCULATE']:
+        # Drivers' tablets start polling the logs as soon as the trip exists
+        transaction.on_commit(lambda: warm_logs(trip.id), robust=True)
+
+    # Prepare response
+    with stage('serialize'):
+        hos_compliance_check = summarize_hos_compliance(
+            data['current_cycle_used'], daily_schedules)
+
+        response_data = calculation_response(
+            trip, route_data, daily_schedules, hos_compliance_check, request)
+    response_data["id"] = trip.id  # add trip ID to the response
+
+    return response_data, status.HTTP_200_OK
+
+
+def calculate_trip(data, request=None):
+    """Route, schedule and persist a validated calculate request.
+
+    Returns ``(response_data, status_code)``.
+    """
+    try:
+        # Calculate route
+        route_calculator = RouteCalculator()
+        route_data = route_calculator.calculate_route(
+            start=data['current_location'],
+            end=data['dropoff_location'],
+            via=[data['pickup_location']]
+        )
+
+        if not route_data:
+            return {'error': 'Could not calculate route'}, status.HTTP_400_BAD_REQUEST
+
+        return plan_trip(data, route_data, request)
+
+    except Exception as e:
+        return (
+            {'error': f'Calculation failed: {str(e)}'},
+            status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
 
 
 class TripViewSet(viewsets.ModelViewSet):
     queryset = Trip.objects.all()
     serializer_class = TripSerializer
+    pagination_class = TripCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            # Don't load the route JSON columns for list rows
+            queryset = queryset.only(*TripListSerializer.Meta.fields)
+        if self.action in ('retrieve', 'update', 'partial_update', 'logs'):
+            # Every day and duty status in two queries, however long the trip
+            queryset = queryset.prefetch_related('daily_logs__duty_statuses')
+        return queryset
+
+    def get_object(self):
+        trip = super().get_object()
+        if self.action in ('retrieve', 'update', 'partial_update'):
+            attach_timelines(trip.daily_logs.all())
+        return trip
 
     def get_serializer(self, *args, **kwargs):
         if self.action == 'list':
+            kwargs.setdefault('context', self.get_serializer_context())
             return TripListSerializer(*args, **kwargs)
         return super().get_serializer(*args, **kwargs)
 
@@ -33,170 +136,121 @@ class TripViewSet(viewsets.ModelViewSet):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+        geometry_options(request)
+        data = serializer.validated_data
+
         try:
-            data = serializer.validated_data
+            if prefers_async(request):
+                # Long trips: answer at once and let a jobs worker calculate
+                return job_accepted(request, *enqueue(data, request))
+
+            # Retries and concurrent duplicates share one calculation
+            identity = request_identity(request, data)
+            return idempotent_response(*run_once(identity, lambda: calculate_trip(data, request)))
+        except IdempotencyError as e:
+            return Response({'error': e.detail}, status=e.status_code)
+
+    @action(detail=False, methods=['post'], url_path='calculate-batch')
+    def calculate_batch(self, request):
+        """Plan a list of trips in one request and return per-item results"""
+        payloads = request.data
+        max_items = get_batch_config()['MAX_ITEMS']
+
+        if not isinstance(payloads, list) or not payloads:
+            return Response(
+                {'error': 'Expected a non-empty list of trips'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(payloads) > max_items:
+            return Response(
+                {'error': f'Batch size cannot exceed {max_items} trips'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-            # Calculate route
-            route_calculator = RouteCalculator()
-            route_data = route_calculator.calculate_route(
+        try:
+            results = plan_trip_batch(payloads)
+        except Exception as e:
+            return Response(
+                {'error': f'Batch calculation failed: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response({
+            'results': results,
+            'succeeded': sum(1 for r in results if 'id' in r),
+            'failed': sum(1 for r in results if 'errors' in r),
+        })
+
+    @action(detail=False, methods=['post'], url_path='what-if')
+    def what_if(self, request):
+        """Rank one route's schedules over start times x cycle values"""
+        serializer = WhatIfSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        max_scenarios = get_what_if_config()['MAX_SCENARIOS']
+        if len(data['start_times']) * len(data['cycle_values']) > max_scenarios:
+            return Response(
+                {'error': f'Cannot plan more than {max_scenarios} scenarios'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            route_data = RouteCalculator().calculate_route(
                 start=data['current_location'],
                 end=data['dropoff_location'],
                 via=[data['pickup_location']]
             )
-
             if not route_data:
                 return Response(
                     {'error': 'Could not calculate route'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            # Calculate trip schedule
-            trip_calculator = TripCalculator(
-                current_cycle_used=float(data['current_cycle_used']))
-            daily_schedules = trip_calculator.calculate_trip_schedule(
-                total_duration_hours=route_data['duration'],
-                total_distance_miles=route_data['distance']
-            )
-
-            # Create trip and logs in database
-            with transaction.atomic():
-                trip = Trip.objects.create(
-                    current_location=data['current_location'],
-                    pickup_location=data['pickup_location'],
-                    dropoff_location=data['dropoff_location'],
-                    current_cycle_used=data['current_cycle_used'],
-                    total_distance=route_data['distance'],
-                    estimated_duration=route_data['duration'],
-                    total_days=len(daily_schedules),
-                    route_geometry=route_data.get('geometry'),
-                    route_summary=route_data.get('summary')
-                )
-
-                # Create daily logs and duty statuses
-                for schedule in daily_schedules:
-                    daily_log = DailyLog.objects.create(
-                        trip=trip,
-                        log_date=schedule['date'],
-                        day_number=schedule['day_number'],
-                        total_miles=int(schedule['estimated_distance']),
-                        total_driving_hours=schedule['total_driving_hours'],
-                        total_on_duty_hours=schedule['total_on_duty_hours'],
-                        total_off_duty_hours=schedule['total_off_duty_hours'],
-                        cycle_used=schedule['total_on_duty_hours']
-                    )
-
-                    # Create duty status activities
-                    for activity in schedule['activities']:
-                        DutyStatus.objects.create(
-                            daily_log=daily_log,
-                            status=activity['status'],
-                            start_time=datetime.fromisoformat(
-                                activity['start_time']),
-                            end_time=datetime.fromisoformat(
-                                activity['end_time']),
-                            location=activity['location'],
-                            description=activity['description'],
-                            duration_hours=activity['duration_hours']
-                        )
-
-            # Prepare response
-            hos_compliance_check = {
-                'is_compliant': True,
-                'total_days': len(daily_schedules),
-                'total_driving_hours': sum(s['total_driving_hours'] for s in daily_schedules),
-                'total_on_duty_hours': sum(s['total_on_duty_hours'] for s in daily_schedules),
-                'cycle_used_end': float(data['current_cycle_used']) + sum(s['total_on_duty_hours'] for s in daily_schedules)
-            }
-
-            response_data = {
-                'trip': TripSerializer(trip).data,
-                'route': route_data,
-                'daily_schedules': daily_schedules,
-                'total_days': len(daily_schedules),
-                'hos_compliance_check': hos_compliance_check
-            }
-
-            response_serializer = TripCalculationResponseSerializer(
-                data=response_data)
-            if response_serializer.is_valid():
-                response_data = response_serializer.data
-                response_data["id"] = trip.id  # add trip ID to the response
-
-                return Response(response_data)
-            else:
-                return Response(response_serializer.errors, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
+            plan = plan_what_if(
+                route_data['duration'], route_data['distance'],
+                data['start_times'], data['cycle_values'], data.get('top'))
         except Exception as e:
             return Response(
-                {'error': f'Calculation failed: {str(e)}'},
+                {'error': f'What-if planning failed: {str(e)}'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+        return Response({
+            'route': {
+                'distance': route_data['distance'],
+                'duration': route_data['duration'],
+                'summary': route_data['summary'],
+            },
+            **plan,
+        })
+
     @action(detail=True, methods=['get'])
     def logs(self, request, pk=None):
-        """Return logs using TripCalculationResponseSerializer format"""
-        trip = self.get_object()
-        daily_logs = trip.daily_logs.all().order_by("day_number")
-
-        # Build daily_schedules in the exact format required by DailyScheduleSerializer
-        daily_schedules = []
-        for log in daily_logs:
-            daily_schedules.append({
-                "day_number": log.day_number,
-                "date": str(log.log_date),
-                "total_driving_hours": float(log.total_driving_hours),
-                "total_on_duty_hours": float(log.total_on_duty_hours),
-                "total_off_duty_hours": float(log.total_off_duty_hours),
-                "breaks_needed": 0,  # logs do not store this; you can compute if needed
-                "estimated_distance": float(log.total_miles),
-                "activities": [
-                    {
-                        "start_time": ds.start_time.isoformat(),
-                        "end_time": ds.end_time.isoformat(),
-                        "status": ds.status,
-                        "location": ds.location,
-                        "description": ds.description,
-                        "duration_hours": float(ds.duration_hours),
-                    }
-                    for ds in log.duty_statuses.all()
-                ],
-                "hos_compliant": True,        # or compute if you want
-                "is_restart_day": False       # optional field
-            })
-
-        # Prepare route data based on the stored trip fields
-        route_data = {
-            "distance": float(trip.total_distance),
-            "duration": float(trip.estimated_duration),
-            "fuel_stops": 0,  # unless you calculate this
-            "geometry": trip.route_geometry or {},
-            "summary": trip.route_summary or {},
-        }
-
-        # Rebuild HOS compliance section
-        hos_compliance_check = {
-            "is_compliant": True,
-            "total_days": len(daily_schedules),
-            "total_driving_hours": float(sum(l.total_driving_hours for l in daily_logs)),
-            "total_on_duty_hours": float(sum(l.total_on_duty_hours for l in daily_logs)),
-            "cycle_used_end": float(trip.current_cycle_used) +
-            float(sum(l.total_on_duty_hours for l in daily_logs)),
-        }
-
-        # Full response structure
-        response_data = {
-            "trip": TripSerializer(trip).data,
-            "route": route_data,
-            "daily_schedules": daily_schedules,
-            "total_days": len(daily_schedules),
-            "hos_compliance_check": hos_compliance_check,
-        }
-
-        # Validate using TripCalculationResponseSerializer
-        serializer = TripCalculationResponseSerializer(data=response_data)
-        serializer.is_valid(raise_exception=True)
-
-        return Response(serializer.data)
+        """Return logs using TripCalculationResponseSerializer format.
+
+        The rendered payload is cached until the trip's rows change and
+        revalidated with ETag/If-None-Match.
+        """
+        geometry_options(request)
+
+        cached = get_cached_logs(pk, request) if str(pk).isdigit() else None
+        count('logs_cache.hit' if cached is not None else 'logs_cache.miss')
+        if cached is None:
+            with stage('load'):
+                trip = self.get_object()
+            with stage('serialize'):
+                cached = cache_logs(trip, request)
+        etag, content = cached
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'no-cache'
+        return response
 
 
 class HOSRulesViewSet(viewsets.ViewSet):
@@ -237,3 +291,110 @@ class HOSRulesViewSet(viewsets.ViewSet):
             'needs_restart': rules.needs_restart(current_cycle_used),
             'cycle_limit': rules.CYCLE_LIMIT_8_DAY
         })
+
+
+def job_accepted(request, job, created=True):
+    """202 response pointing at a queued job's status URL"""
+    count('jobs.enqueued' if created else 'jobs.replayed')
+    url = request.build_absolute_uri(reverse('job-detail', args=[job.pk]))
+    response = Response({**job_data(job), 'url': url}, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = url
+    response['Preference-Applied'] = 'respond-async'
+    if not created:
+        response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _json_response(data, status_code=status.HTTP_200_OK):
+    with stage('render'):
+        content = JSONRenderer().render(data)
+    return HttpResponse(content, status=status_code, content_type='application/json')
+
+
+@csrf_exempt
+@require_POST
+async def calculate_trip_async(request):
+    """Async variant of TripViewSet.calculate for ASGI deployments.
+
+    Geocoding and routing are awaited without holding a thread; schedule
+    generation and DB writes run in the sync executor. Under WSGI it still
+    answers, but each request runs on its own event loop with its own ORS
+    connection, so prefer /trips/calculate/ there.
+
+    DRF has no async views, so this is a plain Django view: it parses JSON
+    only, and DRF authentication, permission and throttle classes are not
+    applied. Mirror any added to TripViewSet here.
+    """
+    try:
+        payload = json.loads(request.body or b'{}')
+    except ValueError:
+        return _json_response(
+            {'detail': 'JSON parse error'}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = TripCalculationSerializer(data=payload)
+    if not serializer.is_valid():
+        return _json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    try:
+        geometry_options(request)
+    except ValidationError as e:
+        return _json_response(e.detail, status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+
+    async def calculate():
+        try:
+            route_calculator = RouteCalculator()
+            route_data = await route_calculator.calculate_route_async(
+                start=data['current_location'],
+                end=data['dropoff_location'],
+                via=[data['pickup_location']]
+            )
+
+            if not route_data:
+                return {'error': 'Could not calculate route'}, status.HTTP_400_BAD_REQUEST
+
+            return await sync_to_async(plan_trip)(data, route_data, request)
+
+        except Exception as e:
+            return (
+                {'error': f'Calculation failed: {str(e)}'},
+                status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+    try:
+        identity = request_identity(request, data)
+        async with async_client_scope(shared=isinstance(request, ASGIRequest)):
+            return idempotent_response(*await run_once_async(identity, calculate))
+    except IdempotencyError as e:
+        return _json_response({'error': e.detail}, e.status_code)
+
+
+@require_GET
+async def job_status(request, pk):
+    """Status of a calculation job.
+
+    ``?wait=<seconds>`` long-polls: the response is held until the job
+    finishes or the wait (at most ELD_JOBS['MAX_WAIT']) runs out. Under
+    ASGI a waiting request holds no thread.
+    """
+    config = get_jobs_config()
+    try:
+        wait = float(request.GET.get('wait', 0))
+        if not math.isfinite(wait):
+            raise ValueError
+    except ValueError:
+        return _json_response(
+            {'wait': 'Must be a number of seconds'}, status.HTTP_400_BAD_REQUEST)
+    deadline = time.monotonic() + min(max(wait, 0), config['MAX_WAIT'])
+
+    jobs = CalculationJob.objects.filter(pk=pk)
+    job_state = await jobs.values_list('status', flat=True).afirst()
+    while job_state not in (None, *CalculationJob.FINISHED) and time.monotonic() < deadline:
+        await asyncio.sleep(config['WAIT_INTERVAL'])
+        job_state = await jobs.values_list('status', flat=True).afirst()
+
+    job = await jobs.afirst()
+    if job is None:
+        return _json_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+    return _json_response(job_data(job))
@@ -0,0 +1,105 @@
+"""
+What-if planning over start times and cycle states.
+
+Dispatch compares one routed load across a grid of start datetimes and
+current_cycle_used values. A scenario's timeline only depends on the
+cycle value and the start's time of day (offsets are relative to the
+start, see schedule_cache.py), so each distinct (cycle, time of day) pair
+is simulated once and rebased onto every start date that shares it.
+Simulations only build the columnar DutyTimeline, never the schedule
+dicts, and large grids are spread in chunks over the web process's
+long-lived what-if pool (see pools.py).
+"""
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from .hos_engine import EPSILON, RESTART, HOSSimulator, start_hour
+from .pools import pool_map
+
+WHAT_IF_DEFAULTS = {
+    'MAX_SCENARIOS': 20000,
+    'WORKERS': None,  # defaults to the CPU count
+    # Below this many distinct simulations, process startup costs more
+    # than it saves, so they run in-process
+    'PARALLEL_THRESHOLD': 2000,
+    'CHUNK_SIZE': 250,
+}
+
+# Any date works: the simulation only uses the start's time of day
+REFERENCE_DATE = datetime(2000, 1, 3)
+
+
+def get_what_if_config() -> Dict:
+    return {**WHAT_IF_DEFAULTS, **getattr(settings, 'ELD_WHAT_IF', {})}
+
+
+def simulate_scenarios(duration: float, distance: float,
+                       keys: Sequence[Tuple[float, float]]) -> List[Tuple[float, float, int]]:
+    """Process pool entry point: ``(arrival, last on-duty end, restarts)``
+    offsets in hours for each ``(current_cycle_used, start hour)`` key"""
+    results = []
+    for cycle, base in keys:
+        timeline = HOSSimulator(cycle).simulate(
+            duration, distance, REFERENCE_DATE + timedelta(hours=base))
+        # Every timeline ends with dropoff, post-trip inspection and a rest
+        results.append((timeline.starts[-3], timeline.ends[-2], timeline.count(RESTART)))
+    return results
+
+
+def _simulate_all(duration: float, distance: float, keys: List[Tuple[float, float]],
+                  config: Dict) -> Dict:
+    if len(keys) < config['PARALLEL_THRESHOLD']:
+        return dict(zip(keys, simulate_scenarios(duration, distance, keys)))
+
+    size = config['CHUNK_SIZE']
+    chunks = [keys[i:i + size] for i in range(0, len(keys), size)]
+    outcomes = pool_map('what_if.simulate', config['WORKERS'], simulate_scenarios,
+                        [duration] * len(chunks), [distance] * len(chunks), chunks)
+    results = {}
+    for chunk, chunk_outcomes in zip(chunks, outcomes):
+        results.update(zip(chunk, chunk_outcomes))
+    return results
+
+
+def plan_what_if(duration: float, distance: float, start_times: Iterable[datetime],
+                 cycle_values: Iterable[float], top: Optional[int] = None) -> Dict:
+    """Simulate every start time x cycle value scenario of one route.
+
+    Returns the scenarios ranked by arrival at the dropoff, then by
+    restarts and calendar days. Every event-engine schedule is HOS
+    compliant, so the first one is the fastest compliant arrival.
+    """
+    start_times = list(start_times)
+    cycle_values = [float(cycle) for cycle in cycle_values]
+    scenarios = [(start, cycle) for start in start_times for cycle in cycle_values]
+    bases = {start: start_hour(start) for start in start_times}
+
+    outcomes = _simulate_all(
+        duration, distance,
+        list(dict.fromkeys((cycle, bases[start]) for start, cycle in scenarios)),
+        get_what_if_config())
+
+    ranked = []
+    for start, cycle in scenarios:
+        base = bases[start]
+        arrival, end, restarts = outcomes[cycle, base]
+        ranked.append({
+            'start_time': start,
+            'current_cycle_used': cycle,
+            'arrival_time': start + timedelta(seconds=round(arrival * 3600)),
+            'trip_hours': round(arrival, 2),
+            'total_days': math.ceil((base + end) / 24 - EPSILON),
+            'restarts': restarts,
+        })
+    ranked.sort(key=lambda result: (
+        result['arrival_time'], result['restarts'], result['total_days'],
+        result['start_time'], result['current_cycle_used']))
+
+    return {
+        'scenarios': len(scenarios),
+        'simulations': len(outcomes),
+        'results': ranked if top is None else ranked[:top],
+    }
@@ -19,7 +19,7 @@ export function meta({}: Route.MetaArgs) {
 
 export async function clientLoader() {
   try {
-    const tripsData = await getTrips();
+    const { results: tripsData } = await getTrips();
     return { tripsData };
   } catch (error) {
     console.error("Failed to load trips:", error);
@@ -1,3 +1,4 @@
+import { useState } from "react";
 import { useLoaderData, useNavigate } from "react-router";
 import { getTrips } from "~/services/api";
 import { formatDate, formatDurationHours } from "~/utils/timeUtils";
@@ -17,11 +18,11 @@ export function meta({}: Route.MetaArgs) {
 
 export async function clientLoader() {
   try {
-    const tripsData = await getTrips();
-    return { tripsData };
+    const { results: tripsData, next } = await getTrips();
+    return { tripsData, next };
   } catch (error) {
     console.error("Failed to load trips:", error);
-    return { tripsData: [] };
+    return { tripsData: [], next: null };
   }
 }
 
@@ -29,7 +30,10 @@ clientLoader.hydrate = true;
 
 export default function TripsPage() {
   const navigate = useNavigate();
-  const { tripsData } = useLoaderData() as { tripsData: any[] };
+  const loaded = useLoaderData() as { tripsData: any[]; next: string | null };
+  const [tripsData, setTripsData] = useState(loaded.tripsData);
+  const [next, setNext] = useState(loaded.next);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const formatDistance = (distance: string) => {
     const num = parseFloat(distance);
@@ -40,7 +44,21 @@ export default function TripsPage() {
     navigate(`/trips/${tripId}`);
   };
 
-  const data = [...tripsData, ...sampleTripsData];
+  const loadMore = async () => {
+    try {
+      setLoadingMore(true);
+      const page = await getTrips(next);
+      setTripsData((trips) => [...trips, ...page.results]);
+      setNext(page.next);
+    } catch (error) {
+      console.error("Failed to load more trips:", error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  // Samples follow the user's trips once every page is loaded
+  const data = next ? tripsData : [...tripsData, ...sampleTripsData];
 
   return (
     <div className="home-page">
@@ -97,6 +115,15 @@ export default function TripsPage() {
               </div>
             ))}
         </div>
+        {next && (
+          <button
+            className="btn btn-outline"
+            onClick={loadMore}
+            disabled={loadingMore}
+          >
+            {loadingMore ? "Loading..." : "Load more trips"}
+          </button>
+        )}
       </section>
     </div>
   );
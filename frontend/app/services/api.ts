@@ -51,10 +51,17 @@ export const calculateTrip = async (tripData: FormData): Promise<TripData> => {
   }
 };
 
-export const getTrips = async (): Promise<any> => {
+export interface TripPage {
+  results: any[];
+  next: string | null;
+}
+
+// The trip list is cursor paginated; pass a page's `next` URL to fetch the
+// page after it
+export const getTrips = async (next?: string | null): Promise<TripPage> => {
   try {
-    const response = await api.get("/trips/");
-    return response.data;
+    const response = await api.get(next || "/trips/");
+    return { results: response.data.results, next: response.data.next };
   } catch (error: any) {
     throw new Error("Failed to fetch HOS limits");
   }